@@ -0,0 +1,46 @@
+"""
+JSON codec benchmarks: decoding of panel-status responses (as bytes, as received on the wire) and encoding of
+command payloads, for every codec installed (see `elmax_api.codec`).
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_codec                    # compare against benchmarks/baseline.json
+    python -m benchmarks.bench_codec --update-baseline  # store the current numbers as the new baseline
+
+Codecs that are not installed are skipped, and so are their baseline entries.
+"""
+import sys
+from typing import List
+
+from benchmarks.common import BenchmarkResult, build_arg_parser, measure, run_suite
+from elmax_api.codec import available_codecs, get_codec
+from elmax_api.simulator.payload import SECTIONS, build_profile_payload
+
+SUITE = "codec"
+
+PROFILES = ("small", "medium", "huge")
+
+
+def run_benchmarks(min_time: float = 0.2) -> List[BenchmarkResult]:
+    results = []
+    reference = get_codec("json")
+    for name in available_codecs():
+        codec = get_codec(name)
+        for profile in PROFILES:
+            payload = build_profile_payload(profile)
+            data = reference.dumps(payload)
+            endpoints = sum(len(payload[section]) for section in SECTIONS)
+            results.append(measure(f"decode/{name}/{profile}", lambda: codec.loads(data),
+                                   items=endpoints, min_time=min_time))
+        command = {"code": "000000", "stato": 2, "aree": [1, 2, 3]}
+        results.append(measure(f"encode/{name}/command", lambda: codec.dumps(command), min_time=min_time))
+    return results
+
+
+def main() -> int:
+    args = build_arg_parser("Benchmark the JSON codecs on panel-status payloads").parse_args()
+    return run_suite(SUITE, run_benchmarks(min_time=args.min_time), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
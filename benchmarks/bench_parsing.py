@@ -0,0 +1,52 @@
+"""
+Parsing benchmarks for `PanelStatus.from_api_response` and `EndpointStatus.from_api_response`, run against
+synthetic payloads ranging from tiny panels up to panels with thousands of endpoints.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_parsing                    # compare against benchmarks/baseline.json
+    python -m benchmarks.bench_parsing --update-baseline  # store the current numbers as the new baseline
+
+The command exits with a non-zero status when a benchmark regresses past the stored baseline.
+"""
+import sys
+from typing import List
+
+from benchmarks.common import BenchmarkResult, build_arg_parser, measure, run_suite
+from elmax_api.model.panel import EndpointStatus, PanelStatus
+from elmax_api.simulator.payload import PANEL_PROFILES, build_endpoint_payload, build_profile_payload, SECTIONS
+
+SUITE = "parsing"
+
+
+def run_benchmarks(min_time: float = 0.2) -> List[BenchmarkResult]:
+    results = []
+    for profile in PANEL_PROFILES:
+        payload = build_profile_payload(profile)
+        endpoints = sum(len(payload[section]) for section in SECTIONS)
+        results.append(measure(f"panel_status/{profile}", lambda: PanelStatus.from_api_response(payload),
+                               items=endpoints, min_time=min_time))
+
+    payload = build_profile_payload("huge")
+    endpoints = sum(len(payload[section]) for section in SECTIONS)
+    results.append(measure("panel_status_lazy/huge", lambda: PanelStatus.from_api_response(payload, lazy=True),
+                           items=endpoints, min_time=min_time))
+    results.append(measure("panel_status_areas/huge",
+                           lambda: PanelStatus.from_api_response(payload, sections={"areas"}),
+                           items=endpoints, min_time=min_time))
+
+    payload = build_profile_payload("small")
+    for section in SECTIONS:
+        endpoint_payload = build_endpoint_payload(payload, section, payload[section][0])
+        results.append(measure(f"endpoint_status/{section}",
+                               lambda: EndpointStatus.from_api_response(endpoint_payload), min_time=min_time))
+    return results
+
+
+def main() -> int:
+    args = build_arg_parser("Benchmark the panel and endpoint status parsers").parse_args()
+    return run_suite(SUITE, run_benchmarks(min_time=args.min_time), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
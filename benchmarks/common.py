@@ -0,0 +1,177 @@
+"""
+Shared helpers for the benchmark suites: timing, allocation tracking and baseline comparison.
+Throughputs depend on the machine running the suites, so they are compared with the baseline relative to a
+reference workload measured in the same run. Allocations are compared as they are.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A benchmark regresses when its throughput drops, or its allocations grow, past these ratios
+DEFAULT_SPEED_TOLERANCE = 0.30
+DEFAULT_ALLOC_TOLERANCE = 0.10
+
+
+class BenchmarkResult:
+    """Outcome of a single benchmark"""
+
+    def __init__(self, name: str, ops_per_sec: float, us_per_item: float, peak_alloc_bytes: int, alloc_blocks: int):
+        self.name = name
+        self.ops_per_sec = ops_per_sec
+        self.us_per_item = us_per_item
+        self.peak_alloc_bytes = peak_alloc_bytes
+        self.alloc_blocks = alloc_blocks
+        # Throughput relative to a reference workload timed alongside, which factors out the speed of the machine
+        self.relative_speed: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "ops_per_sec": round(self.ops_per_sec, 2),
+            "relative_speed": round(self.relative_speed, 6) if self.relative_speed is not None else None,
+            "us_per_item": round(self.us_per_item, 3),
+            "peak_alloc_bytes": self.peak_alloc_bytes,
+            "alloc_blocks": self.alloc_blocks,
+        }
+
+
+def measure(name: str, func: Callable[[], object], items: int = 1, min_time: float = 0.2,
+            repeat: int = 5) -> BenchmarkResult:
+    """
+    Measures the throughput and the allocations of the given callable.
+
+    Args:
+        name: benchmark name
+        func: callable to benchmark, invoked without arguments
+        items: number of items (e.g. endpoints) processed by every invocation, used to report the per-item cost
+        min_time: minimum duration, in seconds, of every timing round
+        repeat: number of timing rounds. The best one is reported
+
+    Returns: The benchmark result
+    """
+    loops = _calibrate(func, min_time)
+    reference_loops = _calibrate(_reference_workload, min_time / 2)
+    # Rounds of the reference workload are interleaved with the benchmark ones, so that both see the same
+    # machine load and frequency scaling
+    best, best_reference = float("inf"), float("inf")
+    for _ in range(repeat):
+        best = min(best, _time_loops(func, loops))
+        best_reference = min(best_reference, _time_loops(_reference_workload, reference_loops))
+
+    # Allocations of a single invocation: peak traced memory and number of blocks kept alive by the result
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+
+    res = BenchmarkResult(name=name, ops_per_sec=1.0 / best, us_per_item=best * 1e6 / max(items, 1),
+                          peak_alloc_bytes=peak, alloc_blocks=blocks)
+    res.relative_speed = best_reference / best
+    return res
+
+
+def _time_loops(func: Callable[[], object], loops: int) -> float:
+    """Returns the average duration, in seconds, of `loops` invocations of the given callable"""
+    start = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - start) / loops
+
+
+def _calibrate(func: Callable[[], object], min_time: float) -> int:
+    """Returns the number of loops of the given callable lasting at least min_time"""
+    loops = 1
+    while _time_loops(func, loops) * loops < min_time:
+        loops *= 2
+    return loops
+
+
+def _reference_workload() -> List[str]:
+    # Pure-Python work akin to the parsers: building small objects, formatting and sorting strings
+    entries = [{"id": i, "name": f"endpoint-{i}", "flags": (i % 2 == 0, i % 3 == 0)} for i in range(200)]
+    return sorted(f"{e['name']}:{e['flags'][0]}:{e['flags'][1]}" for e in entries)
+
+
+def load_baseline(path: str = BASELINE_FILE) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(suite: str, results: List[BenchmarkResult], path: str = BASELINE_FILE) -> None:
+    """Stores the given results as the new baseline of the given suite, keeping the other suites untouched"""
+    baseline = load_baseline(path)
+    baseline[suite] = {r.name: r.to_dict() for r in results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def find_regressions(results: List[BenchmarkResult], baseline: Dict[str, Dict],
+                     speed_tolerance: float = DEFAULT_SPEED_TOLERANCE,
+                     alloc_tolerance: float = DEFAULT_ALLOC_TOLERANCE) -> List[str]:
+    """
+    Compares the given results against the baseline of their suite. Throughputs are compared relative to the
+    reference workload, and only against baselines recording it.
+
+    Returns: A list of human readable regression descriptions. Empty when no regression was found.
+    """
+    regressions = []
+    for r in results:
+        reference = baseline.get(r.name)
+        if reference is None:
+            continue
+        expected = reference.get("relative_speed")
+        if expected and r.relative_speed is not None and r.relative_speed < expected * (1 - speed_tolerance):
+            regressions.append(f"{r.name}: {r.relative_speed:.4f}x the reference speed, baseline {expected:.4f}x")
+        if r.peak_alloc_bytes > reference["peak_alloc_bytes"] * (1 + alloc_tolerance):
+            regressions.append(f"{r.name}: {r.peak_alloc_bytes} peak bytes, "
+                               f"baseline {reference['peak_alloc_bytes']} bytes")
+    return regressions
+
+
+def print_results(results: List[BenchmarkResult], baseline: Dict[str, Dict]) -> None:
+    print(f"{'benchmark':<32} {'ops/s':>12} {'us/item':>10} {'peak KiB':>10} {'blocks':>8} {'vs baseline':>12}")
+    for r in results:
+        expected = baseline.get(r.name, {}).get("relative_speed")
+        delta = f"{(r.relative_speed / expected - 1) * 100:+.1f}%" if expected and r.relative_speed else "n/a"
+        print(f"{r.name:<32} {r.ops_per_sec:>12.1f} {r.us_per_item:>10.3f} {r.peak_alloc_bytes / 1024:>10.1f} "
+              f"{r.alloc_blocks:>8} {delta:>12}")
+
+
+def build_arg_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--speed-tolerance", type=float, default=DEFAULT_SPEED_TOLERANCE)
+    parser.add_argument("--alloc-tolerance", type=float, default=DEFAULT_ALLOC_TOLERANCE)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum duration of each timing round")
+    return parser
+
+
+def run_suite(suite: str, results: List[BenchmarkResult], args: argparse.Namespace,
+              baseline_path: Optional[str] = None) -> int:
+    """Prints the results, then either stores them as baseline or checks them for regressions. Returns an exit code"""
+    path = baseline_path or BASELINE_FILE
+    baseline = load_baseline(path).get(suite, {})
+    print_results(results, baseline)
+    if args.update_baseline:
+        save_baseline(suite, results, path)
+        print(f"Baseline of suite '{suite}' updated.")
+        return 0
+    regressions = find_regressions(results, baseline, args.speed_tolerance, args.alloc_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
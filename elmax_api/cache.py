@@ -0,0 +1,189 @@
+"""
+This module implements the read-through cache of panel statuses, used by the API clients to serve many readers
+of the same panel with a single request.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Collection, Dict, Optional, Set, Tuple
+
+from elmax_api.metrics import Metrics
+from elmax_api.model.panel import PanelStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+StatusFetcher = Callable[[], Awaitable[Dict]]
+
+
+class StatusSnapshot:
+    """Panel-status response, along with the statuses already parsed from it"""
+    __slots__ = ("data", "digest", "timestamp", "_statuses")
+
+    def __init__(self, data: Dict, digest: Optional[bytes] = None):
+        self.data = data
+        self.digest = digest
+        self.timestamp = time.monotonic()
+        self._statuses: Dict[Tuple[bool, Optional[frozenset]], PanelStatus] = {}
+
+    def status(self, sections: Optional[Collection[str]], lazy: bool,
+               metrics: Optional[Metrics] = None) -> PanelStatus:
+        """Returns the status parsed with the given options, parsing it on first request (timed in `metrics`)"""
+        key = (lazy, frozenset(sections) if sections is not None else None)
+        status = self._statuses.get(key)
+        if status is None:
+            started = time.perf_counter()
+            status = PanelStatus.from_api_response(response_entry=self.data, lazy=lazy, sections=sections)
+            if metrics is not None:
+                metrics.observe("status_parse_duration_seconds", time.perf_counter() - started)
+            self._statuses[key] = status
+        return status
+
+
+class StatusCache:
+    """
+    Read-through cache of panel statuses, keyed by panel id and PIN.
+    Concurrent readers of a panel whose status is not cached share a single in-flight request, and every
+    response is parsed at most once per section selection. Statuses returned by the cache are shared among
+    the readers, hence they must not be modified.
+    """
+    _entries: Dict[Tuple[str, str], StatusSnapshot]
+    _in_flight: Dict[Tuple[str, str], asyncio.Future]
+    _generations: Dict[Tuple[str, str], int]
+    _refresh_tasks: Set[asyncio.Future]
+
+    def __init__(self, max_age: float = 1.0, stale_while_revalidate: float = 0.0):
+        """
+        Constructor.
+
+        Args:
+            max_age: time, in seconds, a cached status is served for
+            stale_while_revalidate: time, in seconds, a status older than `max_age` is still served for, while
+                a fresh one is fetched in background
+        """
+        self._max_age = max_age
+        self._stale_while_revalidate = stale_while_revalidate
+        self._entries = {}
+        self._in_flight = {}
+        self._generations = {}
+        self._refresh_tasks = set()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    @property
+    def max_age(self) -> float:
+        return self._max_age
+
+    @property
+    def stale_while_revalidate(self) -> float:
+        return self._stale_while_revalidate
+
+    @property
+    def hits(self) -> int:
+        """Number of reads served by a fresh cached status"""
+        return self._hits
+
+    @property
+    def stale_hits(self) -> int:
+        """Number of reads served by a stale cached status, while revalidating it"""
+        return self._stale_hits
+
+    @property
+    def misses(self) -> int:
+        """Number of requests issued to the API"""
+        return self._misses
+
+    @property
+    def coalesced(self) -> int:
+        """Number of reads which joined an in-flight request instead of issuing their own"""
+        return self._coalesced
+
+    async def get_status(self,
+                         panel_id: str,
+                         pin: str,
+                         fetch: StatusFetcher,
+                         sections: Optional[Collection[str]] = None,
+                         lazy: bool = False,
+                         max_age: Optional[float] = None,
+                         metrics: Optional[Metrics] = None) -> PanelStatus:
+        """
+        Returns the status of the given panel, from the cache when possible.
+
+        Args:
+            panel_id: id of the panel
+            pin: PIN used to read the panel status
+            fetch: coroutine function returning the panel-status response of the API
+            sections: sections to decode, as for `PanelStatus.from_api_response`
+            lazy: lazy decoding, as for `PanelStatus.from_api_response`
+            max_age: overrides the cache `max_age` for this read. An explicit value also disables stale reads.
+            metrics: registry recording the time spent parsing the statuses
+
+        Returns:
+            PanelStatus: the status of the panel
+        """
+        key = (panel_id, str(pin))
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.timestamp
+            if age <= (self._max_age if max_age is None else max_age):
+                self._hits += 1
+                return entry.status(sections, lazy, metrics)
+            if max_age is None and age <= self._max_age + self._stale_while_revalidate:
+                self._stale_hits += 1
+                self._revalidate(key, fetch)
+                return entry.status(sections, lazy, metrics)
+        entry = await self._fetch(key, fetch)
+        return entry.status(sections, lazy, metrics)
+
+    def invalidate(self, panel_id: Optional[str] = None) -> None:
+        """
+        Drops the cached statuses of the given panel, or of every panel if not set.
+        Requests already in flight are not cached when they complete.
+        """
+        keys = [k for k in set(self._entries) | set(self._in_flight) if panel_id is None or k[0] == panel_id]
+        for key in keys:
+            self._entries.pop(key, None)
+            self._in_flight.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    async def _fetch(self, key: Tuple[str, str], fetch: StatusFetcher) -> StatusSnapshot:
+        future = self._in_flight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            self._misses += 1
+            future = asyncio.ensure_future(self._load(key, fetch))
+            self._in_flight[key] = future
+        else:
+            self._coalesced += 1
+        # Shield the shared request, so that a cancelled reader does not cancel it for everyone else
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Tuple[str, str], fetch: StatusFetcher) -> StatusSnapshot:
+        generation = self._generations.get(key, 0)
+        try:
+            data = await fetch()
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+        entry = self._entries.get(key)
+        if entry is not None and entry.data is data:
+            # The client returned the very same response (see `skip_unchanged`): keep the parsed statuses
+            entry.timestamp = time.monotonic()
+        else:
+            entry = StatusSnapshot(data)
+        if self._generations.get(key, 0) == generation:
+            self._entries[key] = entry
+        return entry
+
+    def _revalidate(self, key: Tuple[str, str], fetch: StatusFetcher) -> None:
+        if key in self._in_flight:
+            return
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._on_revalidated)
+
+    def _on_revalidated(self, task: asyncio.Future) -> None:
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.warning("Background refresh of a cached panel status failed: %r", task.exception())
@@ -0,0 +1,205 @@
+"""
+This module implements the circuit breakers used by the API clients, so that requests against an unreachable
+server fail fast instead of waiting for the network timeouts.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+from elmax_api.constants import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_HALF_OPEN_PROBES, CIRCUIT_RECOVERY_TIMEOUT
+from elmax_api.exceptions import ElmaxApiError, ElmaxCircuitOpenError, ElmaxNetworkError
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    """States of a circuit breaker"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+# Callback invoked on every state change, with the circuit key, the old state and the new state
+StateChangeCallback = Callable[[str, CircuitState, CircuitState], None]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a single server.
+    The circuit opens after `failure_threshold` consecutive failures (network errors or 5xx responses): requests
+    are then rejected with `ElmaxCircuitOpenError`, without being sent. After `recovery_timeout` seconds, up to
+    `half_open_probes` requests are let through: the circuit closes as soon as one of them succeeds, and opens
+    again if they fail.
+    """
+
+    def __init__(self,
+                 key: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+                 on_state_change: Optional[StateChangeCallback] = None):
+        """
+        Constructor.
+
+        Args:
+            key: key of the circuit, usually the server base URL, followed by the panel id for cloud panels
+            failure_threshold: number of consecutive failures opening the circuit
+            recovery_timeout: time, in seconds, the circuit stays open before probing the server again
+            half_open_probes: maximum number of probe requests in flight while the circuit is half-open
+            on_state_change: callback invoked on every state change
+        """
+        if failure_threshold < 1 or half_open_probes < 1:
+            raise ValueError("failure_threshold and half_open_probes must be positive numbers")
+        self._key = key
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._half_open_probes = half_open_probes
+        self._on_state_change = on_state_change
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._probes_in_flight = 0
+        self._trips = 0
+        self._rejected = 0
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self._consecutive_failures
+
+    @staticmethod
+    def is_failure(error: BaseException) -> bool:
+        """Whether the given error counts as a failure of the server"""
+        if isinstance(error, ElmaxNetworkError):
+            return True
+        return isinstance(error, ElmaxApiError) and error.status_code >= 500
+
+    @contextmanager
+    def guard(self):
+        """
+        Guards a request: the request is rejected when the circuit is open, and its outcome is recorded.
+
+        Raises:
+            ElmaxCircuitOpenError: If the circuit is open
+        """
+        probe = self._before_request()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # No outcome: just free the probe slot
+            if probe:
+                self._probes_in_flight -= 1
+            raise
+        except Exception as e:
+            self._after_request(probe, failed=self.is_failure(e))
+            raise
+        self._after_request(probe, failed=False)
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "state": self._state.value,
+            "consecutive_failures": self._consecutive_failures,
+            "trips": self._trips,
+            "rejected": self._rejected,
+        }
+
+    def _before_request(self) -> bool:
+        """Returns whether the request is a half-open probe"""
+        if self._state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self._recovery_timeout:
+                self._reject()
+            self._set_state(CircuitState.HALF_OPEN)
+        if self._state == CircuitState.HALF_OPEN:
+            if self._probes_in_flight >= self._half_open_probes:
+                self._reject()
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def _after_request(self, probe: bool, failed: bool) -> None:
+        if probe:
+            self._probes_in_flight -= 1
+        if not failed:
+            self._consecutive_failures = 0
+            if self._state != CircuitState.CLOSED:
+                self._set_state(CircuitState.CLOSED)
+            return
+        self._consecutive_failures += 1
+        if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._consecutive_failures >= self._failure_threshold):
+            self._opened_at = time.monotonic()
+            self._trips += 1
+            self._set_state(CircuitState.OPEN)
+
+    def _reject(self) -> None:
+        self._rejected += 1
+        raise ElmaxCircuitOpenError(f"Circuit open for {self._key}")
+
+    def _set_state(self, state: CircuitState) -> None:
+        old_state, self._state = self._state, state
+        if state == CircuitState.OPEN:
+            _LOGGER.warning("Circuit of %s is open: requests will fail fast for %.1f seconds",
+                            self._key, self._recovery_timeout)
+        else:
+            _LOGGER.info("Circuit of %s is %s", self._key, state.value)
+        if self._on_state_change is not None:
+            try:
+                self._on_state_change(self._key, old_state, state)
+            except Exception:
+                _LOGGER.exception("Circuit state-change callback failed")
+
+
+class CircuitBreakerRegistry:
+    """
+    Circuit breakers keyed by server base URL, or by base URL and panel id for the panels reached through the
+    cloud. A registry can be shared by all the clients targeting the same servers, so that they share the
+    knowledge of the unreachable ones.
+    """
+    _breakers: Dict[str, CircuitBreaker]
+
+    def __init__(self,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+                 on_state_change: Optional[StateChangeCallback] = None):
+        """
+        Constructor.
+
+        Args:
+            failure_threshold: number of consecutive failures opening a circuit
+            recovery_timeout: time, in seconds, a circuit stays open before probing the server again
+            half_open_probes: maximum number of probe requests in flight while a circuit is half-open
+            on_state_change: callback invoked on every state change of every circuit
+        """
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._half_open_probes = half_open_probes
+        self._on_state_change = on_state_change
+        self._breakers = {}
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        """Returns the circuit breaker of the given key, creating it if needed"""
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key, failure_threshold=self._failure_threshold,
+                                     recovery_timeout=self._recovery_timeout,
+                                     half_open_probes=self._half_open_probes,
+                                     on_state_change=self._on_state_change)
+            self._breakers[key] = breaker
+        return breaker
+
+    def metrics(self) -> Dict[str, Dict[str, object]]:
+        """Returns, for every circuit, its state, consecutive failures, trips and rejected requests"""
+        return {key: breaker.metrics() for key, breaker in self._breakers.items()}
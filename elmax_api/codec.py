@@ -0,0 +1,123 @@
+"""
+This module implements the JSON codecs used to encode API requests and to decode API responses and push
+notifications. The fastest available codec is used by default: orjson, then msgspec, then the standard library.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Type, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+
+class JsonCodec(ABC):
+    """
+    Abstract JSON codec.
+    Implementations decode straight from the bytes received on the wire and encode to bytes, and raise
+    `ValueError` on malformed documents.
+    """
+    name: str
+
+    @abstractmethod
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Decodes a JSON document"""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """Encodes an object to a UTF-8 JSON document"""
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class StdlibJsonCodec(JsonCodec):
+    """JSON codec backed by the standard library `json` module"""
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+    """JSON codec backed by `orjson`"""
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("The orjson package is not installed")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+    """JSON codec backed by `msgspec`"""
+    name = "msgspec"
+
+    def __init__(self):
+        if msgspec is None:
+            raise RuntimeError("The msgspec package is not installed")
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+
+_CODECS: Dict[str, Type[JsonCodec]] = {
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+    StdlibJsonCodec.name: StdlibJsonCodec,
+}
+
+_default_codec: Optional[JsonCodec] = None
+
+
+def available_codecs() -> Dict[str, Type[JsonCodec]]:
+    """Returns the codecs whose backing package is installed, fastest first"""
+    installed = {OrjsonCodec.name: orjson is not None, MsgspecCodec.name: msgspec is not None}
+    return {name: codec for name, codec in _CODECS.items() if installed.get(name, True)}
+
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """
+    Returns a JSON codec.
+
+    Args:
+        name: name of the codec ("orjson", "msgspec" or "json"). When not set, the fastest installed codec is
+            returned.
+
+    Raises:
+        ValueError: if the codec is unknown
+        RuntimeError: if the package backing the codec is not installed
+    """
+    global _default_codec
+    if name is not None:
+        if name not in _CODECS:
+            raise ValueError(f"Unknown JSON codec {name}")
+        return _CODECS[name]()
+    if _default_codec is None:
+        _default_codec = next(iter(available_codecs().values()))()
+    return _default_codec
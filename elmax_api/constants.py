@@ -19,6 +19,55 @@ USER_AGENT = f"elmax-api/{__version__}"
 DEFAULT_HTTP_TIMEOUT = 20.0
 BUSY_WAIT_INTERVAL = 2.0
 
+# RETRY POLICY
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_INITIAL = 0.5
+RETRY_BACKOFF_MAX = 8.0
+DEFAULT_REQUEST_DEADLINE = None
+
+# CIRCUIT BREAKER
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RECOVERY_TIMEOUT = 10.0
+CIRCUIT_HALF_OPEN_PROBES = 1
+
+# STATUS WATCH
+WATCH_INTERVAL_MIN = 1.0
+WATCH_INTERVAL_MAX = 30.0
+WATCH_BACKOFF_FACTOR = 1.5
+
+# PUSH SUPERVISOR
+PUSH_RESTART_DELAY = 30.0
+
+# HYBRID STATE STORE
+STATE_STORE_POLL_INTERVAL = 5.0
+STATE_STORE_CHECK_INTERVAL = 1.0
+
+# METRICS
+METRICS_PREFIX = "elmax"
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+# FLEET POLLING
+DEFAULT_FLEET_CONCURRENCY = 32
+DEFAULT_FLEET_POLL_INTERVAL = 30.0
+FLEET_OFFLINE_PROBE_INTERVAL = 300.0
+FLEET_FAILURE_BACKOFF_MAX = 600.0
+
+# BATCH COMMANDS
+DEFAULT_COMMAND_CONCURRENCY = 4
+
+# BATCH ENDPOINT REFRESH
+DEFAULT_REFRESH_CONCURRENCY = 8
+
+# COMMAND SCHEDULING
+DEFAULT_PANEL_MAX_IN_FLIGHT = 1
+BUSY_BACKOFF_MIN = 0.25
+BUSY_BACKOFF_MAX = 10.0
+
+# BACKGROUND TOKEN REFRESH
+TOKEN_REFRESH_MARGIN = 300.0
+TOKEN_REFRESH_JITTER = 30.0
+TOKEN_REFRESH_RETRY_INTERVAL = 10.0
+
 # OTHER DEFAULTS
 DEFAULT_PANEL_PIN = "000000"
 
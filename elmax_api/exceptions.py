@@ -24,6 +24,18 @@ class ElmaxNetworkError(ElmaxError):
     pass
 
 
+class ElmaxConnectionError(ElmaxNetworkError):
+    """When a request could not be sent, since no connection to the server could be established."""
+
+    pass
+
+
+class ElmaxCircuitOpenError(ElmaxNetworkError):
+    """When a request is rejected without being sent, since its server keeps failing (see `CircuitBreaker`)."""
+
+    pass
+
+
 class ElmaxBadLoginError(ElmaxError):
     """Occurs when a login attempt fails"""
 
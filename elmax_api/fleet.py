@@ -0,0 +1,253 @@
+"""
+This module implements the fleet poller, fetching the status of every panel of a cloud account concurrently.
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Collection, Dict, List, Mapping, Optional
+
+from elmax_api.constants import DEFAULT_FLEET_CONCURRENCY, DEFAULT_FLEET_POLL_INTERVAL, DEFAULT_PANEL_PIN, \
+    FLEET_FAILURE_BACKOFF_MAX, FLEET_OFFLINE_PROBE_INTERVAL
+from elmax_api.exceptions import ElmaxApiError, ElmaxCircuitOpenError, ElmaxNetworkError
+from elmax_api.http import Elmax
+from elmax_api.model.panel import PanelEntry, PanelStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollResult:
+    """Outcome of the poll of a panel (see `FleetPoller`)"""
+    __slots__ = ("_panel_id", "_status", "_error", "_duration", "_probe")
+
+    def __init__(self, panel_id: str, status: Optional[PanelStatus] = None, error: Optional[BaseException] = None,
+                 duration: float = 0.0, probe: bool = False):
+        self._panel_id = panel_id
+        self._status = status
+        self._error = error
+        self._duration = duration
+        self._probe = probe
+
+    @property
+    def panel_id(self) -> str:
+        return self._panel_id
+
+    @property
+    def status(self) -> Optional[PanelStatus]:
+        """Status of the panel, if the poll succeeded"""
+        return self._status
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        """Exception raised by the poll, if it failed"""
+        return self._error
+
+    @property
+    def duration(self) -> float:
+        """Duration, in seconds, of the poll request"""
+        return self._duration
+
+    @property
+    def probe(self) -> bool:
+        """Whether the panel was polled to probe it, since reported offline"""
+        return self._probe
+
+    @property
+    def succeeded(self) -> bool:
+        return self._error is None
+
+    def __repr__(self):
+        outcome = f"error={self._error!r}" if self._error is not None else "ok"
+        return f"PollResult({self._panel_id}, {outcome}, duration={self._duration:.3f})"
+
+
+class _PanelHealth:
+    __slots__ = ("online", "failures", "next_poll", "polls", "errors", "skipped", "last_success", "last_error")
+
+    def __init__(self, online: bool):
+        self.online = online
+        self.failures = 0
+        self.next_poll = 0.0
+        self.polls = 0
+        self.errors = 0
+        self.skipped = 0
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+
+
+class FleetPoller:
+    """
+    Polls the status of every panel of a cloud account, with bounded concurrency.
+    Polls are spread over the polling interval, to avoid bursts, and their results are yielded as they complete.
+    Panels reported offline by the cloud are only probed every `offline_probe_interval` seconds, and failing
+    panels are polled less and less often (exponential backoff), so that they do not slow down the others.
+
+    Usage:
+        poller = FleetPoller(client, pins={"panel-id": "123456"}, interval=30)
+        async for result in poller.poll():
+            if result.succeeded:
+                ...
+    """
+    _health: Dict[str, _PanelHealth]
+
+    def __init__(self,
+                 client: Elmax,
+                 pins: Optional[Mapping[str, str]] = None,
+                 default_pin: str = DEFAULT_PANEL_PIN,
+                 concurrency: int = DEFAULT_FLEET_CONCURRENCY,
+                 interval: float = DEFAULT_FLEET_POLL_INTERVAL,
+                 offline_probe_interval: float = FLEET_OFFLINE_PROBE_INTERVAL,
+                 failure_backoff_max: float = FLEET_FAILURE_BACKOFF_MAX,
+                 sections: Optional[Collection[str]] = None,
+                 lazy: bool = False):
+        """
+        Constructor.
+
+        Args:
+            client: cloud API client
+            pins: PIN of the panels, by panel id
+            default_pin: PIN of the panels missing from `pins`
+            concurrency: maximum number of polls in flight. Keep it within the connection pool limits of the client
+            interval: time, in seconds, between two polls of the same panel
+            offline_probe_interval: time, in seconds, between two probes of a panel reported offline
+            failure_backoff_max: maximum time, in seconds, between two polls of a failing panel
+            sections: endpoint sections to decode (see `Elmax.get_panel_status`)
+            lazy: decode the endpoint sections on first access
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive number")
+        self._client = client
+        self._pins = dict(pins) if pins is not None else {}
+        self._default_pin = default_pin
+        self._concurrency = concurrency
+        self._interval = interval
+        self._offline_probe_interval = offline_probe_interval
+        self._failure_backoff_max = failure_backoff_max
+        self._sections = sections
+        self._lazy = lazy
+        self._health = {}
+
+    @property
+    def panel_ids(self) -> List[str]:
+        return list(self._health)
+
+    def set_pin(self, panel_id: str, pin: str) -> None:
+        self._pins[panel_id] = pin
+
+    async def refresh_panels(self) -> List[PanelEntry]:
+        """Fetches the panel list of the account, starting to track new panels and dropping removed ones"""
+        entries = await self._client.list_control_panels()
+        now = time.monotonic()
+        health = {}
+        for entry in entries:
+            panel = self._health.get(entry.hash)
+            if panel is None:
+                panel = _PanelHealth(online=entry.online)
+                if not entry.online:
+                    panel.next_poll = now + self._offline_probe_interval
+            elif panel.online != entry.online:
+                _LOGGER.info("Panel %s is now %s", entry.hash, "online" if entry.online else "offline")
+                panel.online = entry.online
+                panel.next_poll = now + self._offline_probe_interval if not entry.online else 0.0
+            health[entry.hash] = panel
+        self._health = health
+        return entries
+
+    async def poll_once(self, spread: float = 0.0, refresh: bool = True) -> AsyncIterator[PollResult]:
+        """
+        Polls every panel which is due, yielding the results as they complete.
+        Skipped panels (offline or backing off) yield nothing.
+
+        Args:
+            spread: time, in seconds, over which the polls are evenly spread
+            refresh: refresh the panel list before polling (see `refresh_panels`)
+        """
+        if refresh:
+            await self.refresh_panels()
+        now = time.monotonic()
+        due = []
+        for panel_id, panel in self._health.items():
+            if panel.next_poll <= now:
+                due.append(panel_id)
+            else:
+                panel.skipped += 1
+        # Created here, within the running loop: the poller may be built before the loop (e.g. before asyncio.run)
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks = [asyncio.ensure_future(self._poll_panel(panel_id, self._health[panel_id], semaphore,
+                                                        delay=spread * i / len(due)))
+                 for i, panel_id in enumerate(due)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def poll(self) -> AsyncIterator[PollResult]:
+        """Polls the panels every `interval` seconds, forever, yielding the results as they complete"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.refresh_panels()
+            except (ElmaxApiError, ElmaxNetworkError) as e:
+                # Keep polling the known panels
+                _LOGGER.error("Could not refresh the panel list: %r", e)
+            async for result in self.poll_once(spread=self._interval, refresh=False):
+                yield result
+            await asyncio.sleep(max(0.0, started + self._interval - loop.time()))
+
+    def health(self) -> Dict[str, Dict]:
+        """Returns, for every panel, its online state and poll statistics"""
+        return {
+            panel_id: {
+                "online": panel.online,
+                "consecutive_failures": panel.failures,
+                "polls": panel.polls,
+                "errors": panel.errors,
+                "skipped": panel.skipped,
+                "last_success": panel.last_success,
+                "last_error": repr(panel.last_error) if panel.last_error is not None else None,
+            } for panel_id, panel in self._health.items()
+        }
+
+    def metrics(self) -> Dict[str, int]:
+        """Returns metrics aggregated over all the panels"""
+        panels = list(self._health.values())
+        return {
+            "panels": len(panels),
+            "online": sum(1 for p in panels if p.online),
+            "failing": sum(1 for p in panels if p.failures),
+            "polls": sum(p.polls for p in panels),
+            "errors": sum(p.errors for p in panels),
+            "skipped": sum(p.skipped for p in panels),
+        }
+
+    async def _poll_panel(self, panel_id: str, panel: _PanelHealth, semaphore: asyncio.Semaphore,
+                          delay: float) -> PollResult:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        probe = not panel.online
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                status = await self._client.get_panel_status(panel_id, pin=self._pins.get(panel_id, self._default_pin),
+                                                             sections=self._sections, lazy=self._lazy)
+            except Exception as e:
+                now = time.monotonic()
+                panel.polls += 1
+                panel.errors += 1
+                panel.last_error = e
+                # Rejections of an open circuit are not sent: the circuit itself schedules the next probe
+                if not isinstance(e, ElmaxCircuitOpenError):
+                    panel.failures += 1
+                    backoff = min(self._failure_backoff_max, self._interval * 2 ** (panel.failures - 1))
+                    panel.next_poll = now + max(backoff, self._offline_probe_interval if probe else 0.0)
+                _LOGGER.debug("Poll of panel %s failed: %r", panel_id, e)
+                return PollResult(panel_id, error=e, duration=now - start, probe=probe)
+        now = time.monotonic()
+        panel.polls += 1
+        panel.failures = 0
+        panel.last_success = time.time()
+        panel.next_poll = now + self._offline_probe_interval if probe else 0.0
+        return PollResult(panel_id, status=status, duration=now - start, probe=probe)
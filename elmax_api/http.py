@@ -4,29 +4,66 @@ This module handles HTTP api calls to the Elmax WEB endpoint, implemented by the
 
 import asyncio
 import functools
+import hashlib
 import logging
+import random
 import ssl
 import time
 from enum import Enum
 from socket import socket
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Collection, Dict, Iterable, List, Optional, Sequence, Set, Union
 from abc import ABC, abstractmethod
 import httpx
 import jwt
 from yarl import URL
 
+from elmax_api.cache import StatusCache, StatusSnapshot
+from elmax_api.codec import JsonCodec, get_codec
 from elmax_api.constants import BASE_URL, ENDPOINT_LOGIN, USER_AGENT, ENDPOINT_DEVICES, ENDPOINT_DISCOVERY, \
     ENDPOINT_REFRESH, ENDPOINT_STATUS_ENTITY_ID, DEFAULT_HTTP_TIMEOUT, BUSY_WAIT_INTERVAL, ENDPOINT_LOCAL_CMD, \
-    DEFAULT_PANEL_PIN
+    DEFAULT_PANEL_PIN, TOKEN_REFRESH_MARGIN, TOKEN_REFRESH_JITTER, TOKEN_REFRESH_RETRY_INTERVAL, \
+    DEFAULT_COMMAND_CONCURRENCY, DEFAULT_REFRESH_CONCURRENCY, WATCH_INTERVAL_MIN, WATCH_INTERVAL_MAX, WATCH_BACKOFF_FACTOR
 from elmax_api.exceptions import ElmaxBadLoginError, ElmaxApiError, ElmaxNetworkError, ElmaxBadPinError, \
-    ElmaxPanelBusyError
-from elmax_api.model.command import Command
+    ElmaxPanelBusyError, ElmaxConnectionError, ElmaxCircuitOpenError
+from elmax_api.model.command import Command, CommandResult
 from elmax_api.model.panel import PanelEntry, PanelStatus, EndpointStatus
+from elmax_api.circuit import CircuitBreaker, CircuitBreakerRegistry
+from elmax_api.metrics import Metrics
+from elmax_api.retry import RetryPolicy
+from elmax_api.scheduler import CommandScheduler, PRIORITY_NORMAL, command_priority
+from elmax_api.token_store import TokenStore
 
 _LOGGER = logging.getLogger(__name__)
+
+# API endpoints used as metrics labels. Any other endpoint is a command against an endpoint id.
+_METRICS_ENDPOINTS = frozenset({ENDPOINT_LOGIN, ENDPOINT_REFRESH, ENDPOINT_DEVICES, ENDPOINT_DISCOVERY,
+                                ENDPOINT_STATUS_ENTITY_ID})
 _JWT_ALGS = ["HS256"]
 
 
+def create_http_session(timeout: float = DEFAULT_HTTP_TIMEOUT,
+                        ssl_context: Optional[ssl.SSLContext] = None,
+                        limits: Optional[httpx.Limits] = None,
+                        http2: bool = False) -> httpx.AsyncClient:
+    """
+    Builds an HTTP session, which can be shared by many API clients (see the `http_session` argument of the
+    clients). A shared session reuses its pooled connections and TLS sessions across all the clients.
+
+    Args:
+        timeout: The default timeout, in seconds
+        ssl_context: an SSL context to override the default one
+        limits: connection pool limits, e.g. `httpx.Limits(max_connections=10, keepalive_expiry=30)`.
+            When not set, the httpx defaults apply.
+        http2: enables HTTP/2. Requires the `h2` package (`pip install elmax-api[http2]`)
+
+    Returns:
+        httpx.AsyncClient: the HTTP session. The caller is responsible for closing it with `aclose()`.
+    """
+    kwargs = {"limits": limits} if limits is not None else {}
+    return httpx.AsyncClient(timeout=timeout, verify=ssl_context if ssl_context is not None else True,
+                             http2=http2, **kwargs)
+
+
 async def helper(f, *args, **kwargs):
     if asyncio.iscoroutinefunction(f):
         return await f(*args, **kwargs)
@@ -39,31 +76,17 @@ def async_auth(func, *method_args, **method_kwargs):
     Asynchronous decorator used to check validity of JWT token.
     It takes care to verify the validity of a JWT token before issuing the method call.
     In case the JWT is expired, or close to expiration date, it tries to renew it.
+    Concurrent callers share a single in-flight login. Nested decorated calls, and the tasks they spawn, repeat
+    the expiration check, which is a cheap comparison, since they may outlive the token checked by the outer call.
     """
 
     @functools.wraps(func, *method_args, **method_kwargs)
     async def wrapper(*args, **kwargs):
-        # Check whether the client has a valid token to be used. We consider valid tokens with expiration time
-        # > 10minutes. If not, try to login first and then proceed with the function call.
-        now = time.time()
         _instance = args[0]
         assert isinstance(_instance, GenericElmax)
-        exp_time = _instance.token_expiration_time
-        if exp_time == 0:
-            _LOGGER.debug("The API client was not authorized yet. Login will be attempted.")
-            await _instance.login()
-        elif exp_time < 0:
-            _LOGGER.debug("The API client token is expired. Login will be attempted.")
-            await _instance.login()
-        elif (exp_time - now) < 60:
-            _LOGGER.debug(
-                "The API client token is going to be expired soon. "
-                "Login will be attempted right now to refresh it."
-            )
-            await _instance.login()
+        await _instance._ensure_token()
         # At this point, we assume the client has a valid token to use for authorized APIs. So let's use it.
-        result = await helper(func, *args, **kwargs)
-        return result
+        return await helper(func, *args, **kwargs)
 
     return wrapper
 
@@ -77,7 +100,18 @@ class GenericElmax(ABC):
 
     def __init__(self, base_url: str = BASE_URL, current_panel_id: str = None,
                  current_panel_pin: str = DEFAULT_PANEL_PIN,
-                 timeout: float = DEFAULT_HTTP_TIMEOUT, ssl_context: Optional[ssl.SSLContext] = None):
+                 timeout: float = DEFAULT_HTTP_TIMEOUT, ssl_context: Optional[ssl.SSLContext] = None,
+                 token_store: Optional[TokenStore] = None,
+                 http_session: Optional[httpx.AsyncClient] = None,
+                 limits: Optional[httpx.Limits] = None,
+                 http2: bool = False,
+                 status_cache: Optional[StatusCache] = None,
+                 skip_unchanged: bool = False,
+                 json_codec: Optional[JsonCodec] = None,
+                 command_scheduler: Optional[CommandScheduler] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+                 metrics: Optional[Metrics] = None):
         """Base constructor.
 
         Args:
@@ -86,9 +120,46 @@ class GenericElmax(ABC):
             current_panel_pin: Panel PIN of the preferred panel
             timeout: The default timeout, in seconds, to set up for the inner HTTP client
             ssl_contex: an SSL context to override the default one
+            token_store: store used to share tokens with other clients and processes. When set, a valid
+                token found in the store is used instead of logging in, and every new token is saved to it.
+                Not set by default: tokens are kept in memory only, unless a store (e.g. `FileTokenStore`) is passed.
+            http_session: HTTP session to use, possibly shared with other clients (see `create_http_session`).
+                It is not closed by `aclose()`. When set, `timeout`, `ssl_context`, `limits` and `http2` are
+                ignored in favour of the session configuration.
+            limits: connection pool limits of the inner HTTP client (max connections, keep-alive expiry)
+            http2: enables HTTP/2 on the inner HTTP client. Requires the `h2` package
+            status_cache: read-through cache of panel statuses. When set, concurrent reads of a panel status
+                share a single request and recent statuses are served from the cache. Commands invalidate the
+                cached status of the panel they target.
+            skip_unchanged: when set, a panel-status response byte-identical to the previous one of the same
+                panel is not decoded nor parsed again: the previously built status object is returned instead.
+            json_codec: JSON codec used for requests and responses. Defaults to the fastest installed one
+                (see `elmax_api.codec.get_codec`)
+            command_scheduler: per-panel scheduler of the commands, also tracking the busy windows of the panels.
+                Pass the same scheduler to the clients targeting the same panels. Defaults to a new scheduler.
+            retry_policy: retry policy for network errors and server errors, also setting the overall deadline
+                of every request. By default such failures are not retried and requests have no deadline.
+            circuit_breakers: circuit breakers keyed by base URL (and by panel, for cloud clients), making requests
+                against unreachable servers fail fast. Pass the same registry to the clients targeting the same servers.
+                Defaults to a new registry.
+            metrics: registry recording request latencies, status codes, retries and authentication events.
+                It can be shared by many clients. Defaults to a new registry.
         """
         self._raw_jwt = None
         self._jwt = None
+        self._token_store = token_store
+        self._status_cache = status_cache
+        self._skip_unchanged = skip_unchanged
+        self._json_codec = json_codec if json_codec is not None else get_codec()
+        self._command_scheduler = command_scheduler if command_scheduler is not None else CommandScheduler()
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy(attempts=1)
+        self._circuit_breakers = circuit_breakers if circuit_breakers is not None else CircuitBreakerRegistry()
+        self._watch_wakeups: Set[asyncio.Event] = set()
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._snapshots: Dict[str, StatusSnapshot] = {}
+        self._skipped_parse_count = 0
+        self._auth_task: Optional[asyncio.Future] = None
+        self._refresher_task: Optional[asyncio.Task] = None
         self._areas = self._outputs = self._zones = []
         self._current_panel_id = current_panel_id
         self._current_panel_pin = current_panel_pin
@@ -96,7 +167,67 @@ class GenericElmax(ABC):
         # Build the SSL context we trust
         sslcontext = ssl_context if ssl_context is not None else True
         self._ssl_context = sslcontext
-        self._http_client = httpx.AsyncClient(timeout=timeout, verify=sslcontext)
+        self._owns_http_client = http_session is None
+        if http_session is None:
+            http_session = create_http_session(timeout=timeout, ssl_context=ssl_context, limits=limits, http2=http2)
+        self._http_client = http_session
+
+    async def __aenter__(self) -> "GenericElmax":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Releases the resources held by the client: stops the background token refresher and closes the inner
+        HTTP client, unless it was provided by the caller.
+        """
+        self.stop_token_refresher()
+        if self._owns_http_client and not self._http_client.is_closed:
+            await self._http_client.aclose()
+
+    @property
+    def http_session(self) -> httpx.AsyncClient:
+        return self._http_client
+
+    @property
+    def status_cache(self) -> Optional[StatusCache]:
+        return self._status_cache
+
+    @property
+    def command_scheduler(self) -> CommandScheduler:
+        return self._command_scheduler
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def circuit_breakers(self) -> CircuitBreakerRegistry:
+        return self._circuit_breakers
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """Circuit breaker of the account-level requests (login, panel list) of this client"""
+        return self._circuit_breakers.breaker(self._circuit_key())
+
+    def panel_circuit_breaker(self, panel_id: str) -> CircuitBreaker:
+        """Circuit breaker of the requests against the given panel"""
+        return self._circuit_breakers.breaker(self._circuit_key(panel_id))
+
+    @property
+    def json_codec(self) -> JsonCodec:
+        return self._json_codec
+
+    @property
+    def skipped_parse_count(self) -> int:
+        """Number of panel-status responses identical to the previous ones, hence not parsed again"""
+        return self._skipped_parse_count
 
     @classmethod
     async def retrieve_server_certificate(cls, hostname: str, port: int):
@@ -117,7 +248,10 @@ class GenericElmax(ABC):
             data: Optional[Dict] = None,
             authorized: bool = False,
             timeout: float = DEFAULT_HTTP_TIMEOUT,
-            retry_attempts: int = 3
+            retry_attempts: int = 3,
+            snapshot_key: Optional[str] = None,
+            panel_key: Optional[str] = None,
+            idempotent: Optional[bool] = None
     ) -> Dict:
         """
         Executes an HTTP API request against a given endpoint, parses the output and returns the
@@ -129,32 +263,104 @@ class GenericElmax(ABC):
             url: Target request URL
             data: Json data/Data to post in POST messages. Ignored when issuing GET requests
             authorized: When set, the request is performed passing the stored authorization token
-            timeout: timeout in seconds for a single attempt
+            timeout: timeout in seconds for a single attempt, capped by the remaining deadline of the request
             retry_attempts: number of retry attempts in case of 422 (panel busy)
+            snapshot_key: when set, and `skip_unchanged` is enabled, a response identical to the previous one
+                with the same key is not decoded: the previously decoded object is returned instead
+            panel_key: panel targeted by the request, whose busy windows drive the retry delays.
+                Defaults to the current panel
+            idempotent: whether the request can be safely repeated after a transient failure (see `RetryPolicy`).
+                Defaults to True for GET requests and to False for POST requests
 
         Returns:
             Dict: The dictionary object containing authenticated JWT data
 
         Raises:
             ElmaxApiError: Whenever a non 200 return code is returned by the remote server
-            ElmaxNetworkError: If the http request could not be completed due to a network error
+            ElmaxNetworkError: If the http request could not be completed due to a network error, or within
+                the deadline of the retry policy
+            ElmaxCircuitOpenError: If the request was not sent, since the server keeps failing
             ElmaxPanelBusyError: If the number of retries have been exhausted while the panel returned a busy state (422)
         """
-        retry_attempt = 0
-        while retry_attempt < retry_attempts:
-            try:
-                response_data = await self._internal_request(method=method, url=url, data=data, authorized=authorized,
-                                                             timeout=timeout)
-                _LOGGER.debug(response_data)
-                return response_data
-            except ElmaxApiError as e:
-                if e.status_code == 422:
-                    retry_attempt += 1
-                    _LOGGER.error("Panel is busy. Command will be retried in a moment.")
-                    await asyncio.sleep(BUSY_WAIT_INTERVAL)
-                else:
-                    raise
-        raise ElmaxPanelBusyError()
+        policy = self._retry_policy
+        metrics = self._metrics
+        endpoint = self._metrics_endpoint(url)
+        if idempotent is None:
+            idempotent = method == Elmax.HttpMethod.GET
+        tracker = self._command_scheduler.busy_tracker(panel_key if panel_key is not None else self._panel_key(),
+                                                       initial_window=BUSY_WAIT_INTERVAL)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline if policy.deadline is not None else None
+        # Busy panels are retried up to retry_attempts times, other failures according to the policy
+        busy_attempts = 0
+        attempts = 0
+        try:
+            # The circuit records the outcome of the whole request: retries do not count as further failures
+            with self._circuit_breakers.breaker(self._circuit_key(panel_key)).guard():
+                while True:
+                    attempt_timeout, remaining = timeout, None
+                    if deadline is not None:
+                        remaining = deadline - loop.time()
+                        attempt_timeout = min(timeout, remaining)
+                    attempts += 1
+                    try:
+                        # The httpx timeout bounds every single network operation, not the whole attempt: a slow
+                        # response could still outlive the deadline
+                        try:
+                            response_data = await asyncio.wait_for(
+                                self._internal_request(method=method, url=url, data=data, authorized=authorized,
+                                                       timeout=attempt_timeout, snapshot_key=snapshot_key,
+                                                       endpoint=endpoint),
+                                remaining)
+                        except asyncio.TimeoutError as e:
+                            _LOGGER.error("Request to %s did not complete within %.2f seconds", url, remaining)
+                            metrics.inc("network_errors_total", endpoint=endpoint, error="DeadlineExceeded")
+                            raise ElmaxNetworkError("The request did not complete within its deadline") from e
+                        tracker.on_success()
+                        _LOGGER.debug(response_data)
+                        return response_data
+                    except ElmaxApiError as e:
+                        if e.status_code == 422:
+                            busy_attempts += 1
+                            delay = tracker.on_busy(busy_attempts)
+                            error = ElmaxPanelBusyError()
+                            if busy_attempts >= retry_attempts:
+                                raise error
+                            reason = "Panel is busy"
+                            metrics.inc("retries_total", endpoint=endpoint, reason="busy")
+                        elif policy.should_retry(e, attempts - busy_attempts, idempotent):
+                            delay = policy.backoff(attempts - busy_attempts)
+                            error, reason = e, f"Server error {e.status_code}"
+                            metrics.inc("retries_total", endpoint=endpoint, reason="server_error")
+                        else:
+                            raise
+                    except ElmaxNetworkError as e:
+                        if not policy.should_retry(e, attempts - busy_attempts, idempotent):
+                            raise
+                        delay, error, reason = policy.backoff(attempts - busy_attempts), e, "Network error"
+                        metrics.inc("retries_total", endpoint=endpoint, reason="network_error")
+
+                    if deadline is not None and loop.time() + delay >= deadline:
+                        _LOGGER.error("%s. The request cannot be retried within its deadline.", reason)
+                        raise error
+                    _LOGGER.error("%s. The request will be retried in %.2f seconds.", reason, delay)
+                    await asyncio.sleep(delay)
+        except ElmaxCircuitOpenError:
+            metrics.inc("circuit_rejections_total", endpoint=endpoint)
+            raise
+
+    def _panel_key(self, endpoint_id: Optional[str] = None) -> str:
+        """Key of the panel targeted by a request, optionally against the given endpoint"""
+        return str(self._current_panel_id if self._current_panel_id is not None else self._base_url)
+
+    def _circuit_key(self, panel_key: Optional[str] = None) -> str:
+        """Key of the circuit breaker guarding the requests against the given panel, or the account-level ones"""
+        return str(self._base_url)
+
+    def _metrics_endpoint(self, url) -> str:
+        """API endpoint of the given URL, used as metrics label: ids are left out to bound the label values"""
+        segment = str(url)[len(str(self._base_url)):].lstrip("/").split("/", 1)[0].split("?", 1)[0]
+        return segment if segment in _METRICS_ENDPOINTS else "command"
 
     async def _internal_request(
             self,
@@ -162,8 +368,12 @@ class GenericElmax(ABC):
             url: str,
             data: Optional[Dict] = None,
             authorized: bool = False,
-            timeout: float = DEFAULT_HTTP_TIMEOUT
+            timeout: float = DEFAULT_HTTP_TIMEOUT,
+            snapshot_key: Optional[str] = None,
+            endpoint: Optional[str] = None
     ) -> Dict:
+        if endpoint is None:
+            endpoint = self._metrics_endpoint(url)
         headers = {
             "User-Agent": USER_AGENT,
             "Accept": "application/json",
@@ -172,14 +382,19 @@ class GenericElmax(ABC):
         if authorized:
             headers["Authorization"] = f"JWT {self._raw_jwt}"
 
+        started = time.perf_counter()
         try:
             if method == Elmax.HttpMethod.GET:
                 response = await self._http_client.get(str(url), headers=headers, params=data, timeout=timeout)
             elif method == Elmax.HttpMethod.POST:
-                response = await self._http_client.post(str(url), headers=headers, json=data, timeout=timeout)
+                content = self._json_codec.dumps(data) if data is not None else None
+                response = await self._http_client.post(str(url), headers=headers, content=content, timeout=timeout)
             else:
                 raise ValueError("Invalid/Unhandled method. Expecting GET or POST")
 
+            self._metrics.observe("request_duration_seconds", time.perf_counter() - started,
+                                  method=method.name, endpoint=endpoint)
+            self._metrics.inc("responses_total", endpoint=endpoint, status=str(response.status_code))
             _LOGGER.debug(
                 "HTTP Request %s %s -> Status code: %d",
                 str(method),
@@ -200,16 +415,49 @@ class GenericElmax(ABC):
             # The current API version does not return an error description nor an error http
             #  status code for invalid logins. Instead, an empty body is returned. In that case we
             #  assume the login failed due to invalid user/pass combination
-            response_content = response.text
-            if response_content == '':
+            response_content = response.content
+            if response_content == b'':
                 raise ElmaxBadLoginError()
 
-            return response.json()
+            if snapshot_key is None or not self._skip_unchanged:
+                return self._decode(response_content, endpoint)
+
+            digest = hashlib.blake2b(response_content, digest_size=16).digest()
+            snapshot = self._snapshots.get(snapshot_key)
+            if snapshot is not None and snapshot.digest == digest:
+                self._skipped_parse_count += 1
+                return snapshot.data
+            response_data = self._decode(response_content, endpoint)
+            self._snapshots[snapshot_key] = StatusSnapshot(response_data, digest=digest)
+            return response_data
 
         # Wrap any other HTTP/NETWORK error
-        except (httpx.ConnectError, httpx.ReadTimeout) as e:
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            _LOGGER.error("Could not connect to %s: %r", url, e)
+            self._metrics.inc("network_errors_total", endpoint=endpoint, error=type(e).__name__)
+            raise ElmaxConnectionError("Could not connect to the server") from e
+        except httpx.TransportError as e:
             _LOGGER.exception("An unhandled error occurred while executing API Call.")
-            raise ElmaxNetworkError("A network error occurred")
+            self._metrics.inc("network_errors_total", endpoint=endpoint, error=type(e).__name__)
+            raise ElmaxNetworkError("A network error occurred") from e
+
+    def _decode(self, content: bytes, endpoint: str):
+        """Decodes a JSON response, recording the decoding time"""
+        started = time.perf_counter()
+        data = self._json_codec.loads(content)
+        self._metrics.observe("response_decode_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+        return data
+
+    def _build_panel_status(self, snapshot_key: str, response_data: Dict,
+                            sections: Optional[Collection[str]], lazy: bool) -> PanelStatus:
+        """Parses a panel-status response, reusing the status built from the same response when possible"""
+        snapshot = self._snapshots.get(snapshot_key)
+        if snapshot is not None and snapshot.data is response_data:
+            return snapshot.status(sections, lazy, self._metrics)
+        started = time.perf_counter()
+        status = PanelStatus.from_api_response(response_entry=response_data, lazy=lazy, sections=sections)
+        self._metrics.observe("status_parse_duration_seconds", time.perf_counter() - started)
+        return status
 
     @property
     def ssl_context(self) -> ssl.SSLContext:
@@ -255,6 +503,195 @@ class GenericElmax(ABC):
             return 0
         return self._jwt.get("exp", -1)
 
+    async def _store_token(self, response_data: Dict) -> Dict:
+        """
+        Parses the token returned by the login/refresh APIs and publishes it to the client.
+
+        Raises:
+            ValueError: in case the json response is malformed
+        """
+        if "token" not in response_data:
+            raise ValueError("Missing token parameter in json response")
+
+        jwt_token = response_data["token"]
+        if not jwt_token.startswith("JWT "):
+            raise ValueError("API did not return JWT token as expected")
+        jt = jwt_token.split("JWT ")[1]
+
+        # We do not need to verify the signature as this is usually something the server
+        # needs to do. We will just decode it to get information about user/claims.
+        # Moreover, since the JWT is obtained over a HTTPS channel, we do not need to verify
+        # its integrity/confidentiality as the ssl does this for us
+        decoded = jwt.decode(
+            jt, algorithms=_JWT_ALGS, options={"verify_signature": False}
+        )
+        # Both the decoded and the encoded token are published together, with no await in between, so that
+        # no coroutine (e.g. the push handler) can observe a mix of old and new token
+        self._jwt = decoded
+        self._raw_jwt = (
+            jt  # keep an encoded version of the JWT for convenience and performance
+        )
+        if self._token_store is not None:
+            try:
+                await self._run_token_store(self._token_store.save, self._token_store_key(), jt)
+            except OSError:
+                _LOGGER.warning("Could not save the token to the token store", exc_info=True)
+        return self._jwt
+
+    def _token_store_key(self) -> str:
+        """Key identifying the tokens of this client in the token store"""
+        return str(self._base_url)
+
+    async def _run_token_store(self, func, *args):
+        """
+        Runs a token-store operation in the default executor: file stores wait for locks held by other processes
+        and write files, which must not block the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _load_stored_token(self) -> Optional[Dict]:
+        """
+        Adopts the token found in the token store, provided that it is newer than the current one and valid
+        for more than a minute.
+
+        Returns:
+            Dict: the decoded token, or None if no usable token was found
+        """
+        if self._token_store is None:
+            return None
+        try:
+            jt = await self._run_token_store(self._token_store.load, self._token_store_key())
+        except OSError:
+            _LOGGER.warning("Could not read the token store", exc_info=True)
+            return None
+        if jt is None:
+            return None
+        try:
+            decoded = jwt.decode(jt, algorithms=_JWT_ALGS, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            _LOGGER.warning("Ignoring the malformed token found in the token store")
+            return None
+        exp_time = decoded.get("exp", 0)
+        if exp_time - time.time() < 60 or exp_time <= self.token_expiration_time:
+            return None
+        _LOGGER.debug("Using the token found in the token store")
+        self._jwt = decoded
+        self._raw_jwt = jt
+        return self._jwt
+
+    async def _obtain_token(self, renew: bool) -> Dict:
+        token = await self._load_stored_token()
+        if token is not None:
+            self._metrics.inc("auth_total", kind="stored", outcome="ok")
+            return token
+        kind = "renew" if renew else "login"
+        started = time.perf_counter()
+        try:
+            token = await (self.renew_token() if renew else self.login())
+        except Exception:
+            self._metrics.inc("auth_total", kind=kind, outcome="error")
+            raise
+        self._metrics.observe("auth_duration_seconds", time.perf_counter() - started, kind=kind)
+        self._metrics.inc("auth_total", kind=kind, outcome="ok")
+        return token
+
+    async def _acquire_token(self, renew: bool = False) -> Dict:
+        """
+        Logs in (or renews the token, when `renew` is set), making sure that at most one such request is in
+        flight at any time: concurrent callers await the same request.
+        When a token store is configured, a newer valid token saved there by another client is used instead.
+        """
+        task = self._auth_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._obtain_token(renew))
+            self._auth_task = task
+        # Shield the shared request, so that a cancelled caller does not cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _ensure_token(self) -> Dict:
+        """
+        Returns the current token, unless it is missing or about to expire: in that case a new token is acquired
+        first (see `_acquire_token`).
+        """
+        # Check whether the client has a valid token to be used. We consider valid tokens with expiration time
+        # > 1 minute. If not, try to login first.
+        now = time.time()
+        exp_time = self.token_expiration_time
+        if exp_time == 0:
+            _LOGGER.debug("The API client was not authorized yet. Login will be attempted.")
+            await self._acquire_token()
+        elif exp_time < 0:
+            _LOGGER.debug("The API client token is expired. Login will be attempted.")
+            await self._acquire_token()
+        elif (exp_time - now) < 60:
+            _LOGGER.debug(
+                "The API client token is going to be expired soon. "
+                "Login will be attempted right now to refresh it."
+            )
+            await self._acquire_token()
+        return self._jwt
+
+    @property
+    def is_token_refresher_running(self) -> bool:
+        return self._refresher_task is not None and not self._refresher_task.done()
+
+    def start_token_refresher(self,
+                              margin: float = TOKEN_REFRESH_MARGIN,
+                              jitter: float = TOKEN_REFRESH_JITTER,
+                              loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Starts a background task that renews the token ahead of its expiration, so that API calls never
+        wait for authentication. The `Elmax` client logs in again, the `ElmaxLocal` client uses the refresh API.
+
+        Args:
+            margin: the token is renewed this many seconds before its expiration (at most half of its lifetime)
+            jitter: maximum random time, in seconds, subtracted from the renewal time, to spread the renewals
+                of many clients
+            loop: event loop to run the task on. Defaults to the running loop
+        """
+        if self.is_token_refresher_running:
+            return
+        loop = loop if loop is not None else asyncio.get_running_loop()
+        self._refresher_task = loop.create_task(self._token_refresher(margin=margin, jitter=jitter))
+
+    def stop_token_refresher(self) -> None:
+        """Stops the background token renewal task, if running"""
+        if self._refresher_task is not None:
+            self._refresher_task.cancel()
+            self._refresher_task = None
+
+    async def _token_refresher(self, margin: float, jitter: float) -> None:
+        while True:
+            try:
+                exp_time = self.token_expiration_time
+                if exp_time <= 0:
+                    await self._acquire_token()
+                    continue
+
+                remaining = exp_time - time.time()
+                lead = min(margin, remaining / 2) + random.uniform(0, max(0.0, min(jitter, remaining / 4)))
+                if remaining - lead > 0:
+                    await asyncio.sleep(remaining - lead)
+                if self.token_expiration_time != exp_time:
+                    # Somebody else replaced the token in the meantime
+                    continue
+
+                _LOGGER.debug("Renewing the API client token in background")
+                try:
+                    await self._acquire_token(renew=True)
+                except ElmaxBadLoginError:
+                    # The token could not be renewed: fall back to a full login
+                    await self._acquire_token()
+                if self.token_expiration_time <= exp_time:
+                    _LOGGER.warning("Token renewal did not extend the token expiration time")
+                    await asyncio.sleep(TOKEN_REFRESH_RETRY_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _LOGGER.exception("Background token renewal failed. It will be retried in %d seconds.",
+                                  TOKEN_REFRESH_RETRY_INTERVAL)
+                await asyncio.sleep(TOKEN_REFRESH_RETRY_INTERVAL)
+
     @async_auth
     async def logout(self) -> None:
         """
@@ -264,6 +701,11 @@ class GenericElmax(ABC):
             * Check if there is a HTTP API to invalidate the current token
         """
         self._jwt = None
+        if self._token_store is not None:
+            try:
+                await self._run_token_store(self._token_store.delete, self._token_store_key())
+            except OSError:
+                _LOGGER.warning("Could not remove the token from the token store", exc_info=True)
 
     @abstractmethod
     async def login(self, *args, **kwargs) -> Dict:
@@ -283,9 +725,20 @@ class GenericElmax(ABC):
 
     @abstractmethod
     @async_auth
-    async def get_current_panel_status(self, *args, **kwargs) -> PanelStatus:
+    async def get_current_panel_status(self,
+                                       sections: Optional[Collection[str]] = None,
+                                       lazy: bool = False,
+                                       max_age: Optional[float] = None) -> PanelStatus:
         """
         Fetches the status of the local control panel.
+
+        Args:
+            sections: names of the endpoint sections to decode (e.g. `{"areas"}`). Other sections are left empty.
+                When not set, all the sections are decoded.
+            lazy: when set, endpoint sections are decoded on first access
+            max_age: maximum age, in seconds, of a status served by the status cache. Defaults to the cache
+                `max_age`. Ignored when the client has no status cache.
+
         Returns: The current status of the control panel
 
         Raises:
@@ -294,6 +747,61 @@ class GenericElmax(ABC):
         """
         raise NotImplemented()
 
+    async def watch(self,
+                    interval_min: float = WATCH_INTERVAL_MIN,
+                    interval_max: float = WATCH_INTERVAL_MAX,
+                    sections: Optional[Collection[str]] = None,
+                    lazy: bool = False) -> AsyncIterator[PanelStatus]:
+        """
+        Polls the status of the current panel, yielding it on start and then only when it changes.
+        Meant for panels without push notifications (see `PanelStatus.push_feature`).
+        The polling interval drops to `interval_min` after every change and every command issued through this
+        client, and grows up to `interval_max` while the panel stays quiet.
+
+        Args:
+            interval_min: shortest polling interval, in seconds
+            interval_max: longest polling interval, in seconds
+            sections: names of the endpoint sections to decode and to watch. When not set, all the sections are.
+            lazy: when set, endpoint sections are decoded on first access
+
+        Raises:
+             ElmaxBadPinError: Whenever the provided PIN is incorrect or in any way refused by the server
+             ElmaxApiError: in case of underlying api call failure. Network errors and busy panels only
+                stretch the polling interval.
+        """
+        if interval_min <= 0 or interval_max < interval_min:
+            raise ValueError("Expecting 0 < interval_min <= interval_max")
+        wakeup = asyncio.Event()
+        self._watch_wakeups.add(wakeup)
+        try:
+            previous = None
+            interval = interval_min
+            while True:
+                wakeup.clear()
+                try:
+                    status = await self.get_current_panel_status(sections=sections, lazy=lazy)
+                except (ElmaxNetworkError, ElmaxPanelBusyError) as e:
+                    _LOGGER.warning("Could not poll the panel status: %r", e)
+                    status = None
+
+                # Unchanged responses may be served as the very same status object (see `skip_unchanged`)
+                if status is not None and (previous is None or (
+                        status is not previous and status.fingerprints != previous.fingerprints)):
+                    previous = status
+                    interval = interval_min
+                    yield status
+                else:
+                    interval = min(interval_max, interval * WATCH_BACKOFF_FACTOR)
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=interval)
+                    # A command was issued: its effects are expected soon
+                    interval = interval_min
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._watch_wakeups.discard(wakeup)
+
     @async_auth
     async def get_endpoint_status(self, endpoint_id: str) -> EndpointStatus:
         """
@@ -306,10 +814,47 @@ class GenericElmax(ABC):
         Returns: The current status of the given endpoint
         """
         url = self._base_url / ENDPOINT_STATUS_ENTITY_ID / endpoint_id
-        response_data = await self._request(Elmax.HttpMethod.GET, url=url, authorized=True)
+        response_data = await self._request(Elmax.HttpMethod.GET, url=url, authorized=True,
+                                            panel_key=self._panel_key(endpoint_id))
         status = EndpointStatus.from_api_response(response_entry=response_data)
         return status
 
+    @async_auth
+    async def refresh_endpoints(self,
+                                snapshot: PanelStatus,
+                                endpoint_ids: Iterable[str],
+                                concurrency: int = DEFAULT_REFRESH_CONCURRENCY) -> PanelStatus:
+        """
+        Fetches the status of the given endpoints, up to `concurrency` at the same time, and merges them into
+        a panel status snapshot, without fetching the whole panel status again.
+
+        Args:
+            snapshot: panel status to update. It is left untouched.
+            endpoint_ids: ids of the endpoints to refresh
+            concurrency: maximum number of requests in flight
+
+        Returns: A new panel status, holding the refreshed endpoints (see `PanelStatus.merge`)
+
+        Raises:
+             ElmaxApiError: in case of underlying api call failure of any endpoint
+        """
+        if concurrency < 1:
+            raise ValueError("The concurrency must be a positive number")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _fetch(endpoint_id: str) -> EndpointStatus:
+            async with semaphore:
+                return await self.get_endpoint_status(endpoint_id)
+
+        tasks = [asyncio.ensure_future(_fetch(endpoint_id)) for endpoint_id in dict.fromkeys(endpoint_ids)]
+        try:
+            statuses = await asyncio.gather(*tasks)
+        finally:
+            # A failure makes the other requests pointless
+            for task in tasks:
+                task.cancel()
+        return snapshot.merge(endpoint for status in statuses for endpoint in status.all_endpoints)
+
     @async_auth
     @abstractmethod
     async def execute_command(self,
@@ -329,17 +874,88 @@ class GenericElmax(ABC):
         """
         raise NotImplemented()
 
+    @async_auth
+    async def execute_commands(self,
+                               commands: Iterable[Sequence],
+                               concurrency: int = DEFAULT_COMMAND_CONCURRENCY,
+                               retry_attempts: int = 3) -> List[CommandResult]:
+        """
+        Executes a batch of commands, running up to `concurrency` of them at the same time.
+        Commands targeting the same endpoint are executed one after the other, in the given order. A failed
+        command does not stop the batch: its error is reported in its result.
+
+        Args:
+            commands: (endpoint_id, command) or (endpoint_id, command, extra_payload) tuples
+            concurrency: maximum number of commands in flight. Commands against the same panel are further bounded
+                by the `max_in_flight` of the command scheduler, one by default.
+            retry_attempts: Maximum retry attempts of every command in case of 422 error (panel busy)
+
+        Returns: The outcome of every command, in the given order
+
+        Raises:
+            ValueError: if any of the commands is not a (endpoint_id, command[, extra_payload]) tuple. In that case
+                no command is executed.
+        """
+        if concurrency < 1:
+            raise ValueError("The concurrency must be a positive number")
+        requests = []
+        for index, command in enumerate(commands):
+            if isinstance(command, str) or not isinstance(command, Sequence) or len(command) not in (2, 3):
+                raise ValueError(f"Invalid command #{index} {command!r}: "
+                                 f"expecting (endpoint_id, command) or (endpoint_id, command, extra_payload)")
+            requests.append(CommandResult(*command))
+        by_endpoint: Dict[str, List[int]] = {}
+        for index, request in enumerate(requests):
+            by_endpoint.setdefault(request.endpoint_id, []).append(index)
+        results: List[Optional[CommandResult]] = [None] * len(requests)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run_endpoint(indexes: List[int]):
+            for index in indexes:
+                request = requests[index]
+                async with semaphore:
+                    try:
+                        result = await self.execute_command(request.endpoint_id, request.command,
+                                                            extra_payload=request.extra_payload,
+                                                            retry_attempts=retry_attempts)
+                        results[index] = CommandResult(request.endpoint_id, request.command, request.extra_payload,
+                                                       result=result)
+                    except Exception as e:
+                        _LOGGER.error("Command %s against endpoint %s failed: %r",
+                                      request.command, request.endpoint_id, e)
+                        results[index] = CommandResult(request.endpoint_id, request.command, request.extra_payload,
+                                                       error=e)
+
+        await asyncio.gather(*(_run_endpoint(indexes) for indexes in by_endpoint.values()))
+        return results
+
     @async_auth
     async def _execute_command(self,
                                url: str,
                                extra_payload: Dict = None,
-                               retry_attempts: int = 3) -> Optional[Dict]:
+                               retry_attempts: int = 3,
+                               endpoint_id: Optional[str] = None,
+                               priority: int = PRIORITY_NORMAL) -> Optional[Dict]:
 
         if extra_payload is not None and not isinstance(extra_payload, dict):
             raise ValueError("The extra_payload parameter must be a dictionary")
 
-        response_data = await self._request(Elmax.HttpMethod.POST, url=url, authorized=True, data=extra_payload,
-                                            retry_attempts=retry_attempts)
+        panel_key = self._panel_key(endpoint_id)
+        try:
+            async with self._command_scheduler.slot(panel_key, priority=priority) as tracker:
+                # Do not hit a panel known to be busy: wait for the expected end of its busy window
+                wait = tracker.expected_wait()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                response_data = await self._request(Elmax.HttpMethod.POST, url=url, authorized=True,
+                                                    data=extra_payload, retry_attempts=retry_attempts,
+                                                    panel_key=panel_key)
+        finally:
+            # Even a failed command may have reached the panel: do not trust its cached status anymore
+            if self._status_cache is not None:
+                self._status_cache.invalidate(panel_key)
+            for wakeup in self._watch_wakeups:
+                wakeup.set()
         _LOGGER.debug(response_data)
         return response_data
 
@@ -364,17 +980,59 @@ class Elmax(GenericElmax):
     Class implementing the Cloud HTTP API.
     """
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str, base_url: str = BASE_URL,
+                 token_store: Optional[TokenStore] = None,
+                 http_session: Optional[httpx.AsyncClient] = None,
+                 limits: Optional[httpx.Limits] = None,
+                 http2: bool = False,
+                 status_cache: Optional[StatusCache] = None,
+                 skip_unchanged: bool = False,
+                 json_codec: Optional[JsonCodec] = None,
+                 command_scheduler: Optional[CommandScheduler] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+                 metrics: Optional[Metrics] = None):
         """Client constructor.
 
         Args:
             username: username to use for logging in
             password: password to use for logging in
+            base_url: API server base-URL. Override it only to target a different server (e.g. a simulator)
+            token_store: store used to share tokens with other clients and processes (e.g. `FileTokenStore`)
+            http_session: HTTP session to use, possibly shared with other clients (see `create_http_session`)
+            limits: connection pool limits of the inner HTTP client, ignored when `http_session` is set
+            http2: enables HTTP/2 on the inner HTTP client, ignored when `http_session` is set
+            status_cache: read-through cache of panel statuses, keyed by panel id and PIN
+            skip_unchanged: reuse the previously built status when a panel returns an identical response
+            json_codec: JSON codec used for requests and responses. Defaults to the fastest installed one
+            command_scheduler: per-panel scheduler of the commands. Defaults to a new scheduler
+            retry_policy: retry policy for transient failures and overall deadline of the requests
+            circuit_breakers: circuit breakers keyed by base URL and panel id, possibly shared with other clients
+            metrics: metrics registry, possibly shared with other clients
         """
-        super(Elmax, self).__init__(base_url=BASE_URL)
+        super(Elmax, self).__init__(base_url=base_url, token_store=token_store, http_session=http_session,
+                                    limits=limits, http2=http2, status_cache=status_cache,
+                                    skip_unchanged=skip_unchanged, json_codec=json_codec,
+                                    command_scheduler=command_scheduler, retry_policy=retry_policy,
+                                    circuit_breakers=circuit_breakers, metrics=metrics)
         self._username = username
         self._password = password
 
+    def _token_store_key(self) -> str:
+        return f"{self._base_url}#{self._username}"
+
+    def _panel_key(self, endpoint_id: Optional[str] = None) -> str:
+        # Cloud endpoint ids are formatted as {panel_id}-{section}-{index}
+        if endpoint_id is not None and endpoint_id.count("-") >= 2:
+            return endpoint_id.rsplit("-", 2)[0]
+        return super(Elmax, self)._panel_key(endpoint_id)
+
+    def _circuit_key(self, panel_key: Optional[str] = None) -> str:
+        # The cloud answers for every panel of the account: an offline panel must not trip the circuit of the others
+        if panel_key is not None:
+            return f"{self._base_url}#{panel_key}"
+        return super(Elmax, self)._circuit_key(panel_key)
+
     @async_auth
     async def list_control_panels(self) -> List[PanelEntry]:
         """
@@ -415,43 +1073,33 @@ class Elmax(GenericElmax):
         }
         try:
             response_data = await self._request(
-                method=Elmax.HttpMethod.POST, url=url, data=data, authorized=False
+                method=Elmax.HttpMethod.POST, url=url, data=data, authorized=False, idempotent=True
             )
         except ElmaxApiError as e:
             if e.status_code == 401:
                 raise ElmaxBadLoginError()
             raise
 
-        if "token" not in response_data:
-            raise ValueError("Missing token parameter in json response")
-
-        jwt_token = response_data["token"]
-        if not jwt_token.startswith("JWT "):
-            raise ValueError("API did not return JWT token as expected")
-        jt = jwt_token.split("JWT ")[1]
-
-        # We do not need to verify the signature as this is usually something the server
-        # needs to do. We will just decode it to get information about user/claims.
-        # Moreover, since the JWT is obtained over a HTTPS channel, we do not need to verify
-        # its integrity/confidentiality as the ssl does this for us
-        self._jwt = jwt.decode(
-            jt, algorithms=_JWT_ALGS, options={"verify_signature": False}
-        )
-        self._raw_jwt = (
-            jt  # keep an encoded version of the JWT for convenience and performance
-        )
-        return self._jwt
+        return await self._store_token(response_data)
 
     @async_auth
     async def get_panel_status(self,
                                control_panel_id: str,
-                               pin: Optional[str] = DEFAULT_PANEL_PIN) -> PanelStatus:
+                               pin: Optional[str] = DEFAULT_PANEL_PIN,
+                               sections: Optional[Collection[str]] = None,
+                               lazy: bool = False,
+                               max_age: Optional[float] = None) -> PanelStatus:
         """
         Fetches the control panel status.
 
         Args:
             control_panel_id: Id of the control panel to fetch status from
             pin: security pin (optional)
+            sections: names of the endpoint sections to decode (e.g. `{"areas"}`). Other sections are left empty.
+                When not set, all the sections are decoded.
+            lazy: when set, endpoint sections are decoded on first access
+            max_age: maximum age, in seconds, of a status served by the status cache. Defaults to the cache
+                `max_age`. Ignored when the client has no status cache.
 
         Returns: The current status of the control panel
 
@@ -459,18 +1107,28 @@ class Elmax(GenericElmax):
              ElmaxBadPinError: Whenever the provided PIN is incorrect or in any way refused by the server
              ElmaxApiError: in case of underlying api call failure
         """
+        if self._status_cache is not None:
+            return await self._status_cache.get_status(
+                panel_id=control_panel_id, pin=pin,
+                fetch=functools.partial(self._fetch_panel_status, control_panel_id, pin),
+                sections=sections, lazy=lazy, max_age=max_age, metrics=self._metrics)
+
+        response_data = await self._fetch_panel_status(control_panel_id, pin)
+        url = self._base_url / ENDPOINT_DISCOVERY / control_panel_id / str(pin)
+        return self._build_panel_status(str(url), response_data, sections=sections, lazy=lazy)
+
+    @async_auth
+    async def _fetch_panel_status(self, control_panel_id: str, pin: Optional[str]) -> Dict:
         url = self._base_url / ENDPOINT_DISCOVERY / control_panel_id / str(pin)
         try:
-            response_data = await self._request(Elmax.HttpMethod.GET, url=url, authorized=True)
+            return await self._request(Elmax.HttpMethod.GET, url=url, authorized=True, snapshot_key=str(url),
+                                       panel_key=control_panel_id)
         except ElmaxApiError as e:
             if e.status_code == 403:
                 raise ElmaxBadPinError() from e
             else:
                 raise
 
-        panel_status = PanelStatus.from_api_response(response_entry=response_data)
-        return panel_status
-
     @async_auth
     async def execute_command(self,
                               endpoint_id: str,
@@ -495,13 +1153,18 @@ class Elmax(GenericElmax):
             raise ValueError("Invalid/unsupported command")
 
         url = self._base_url / endpoint_id / cmd_str
-        return await self._execute_command(url=url, extra_payload=extra_payload, retry_attempts=retry_attempts)
+        return await self._execute_command(url=url, extra_payload=extra_payload, retry_attempts=retry_attempts,
+                                           endpoint_id=endpoint_id, priority=command_priority(command))
 
     @async_auth
-    async def get_current_panel_status(self, *args, **kwargs) -> PanelStatus:
+    async def get_current_panel_status(self,
+                                       sections: Optional[Collection[str]] = None,
+                                       lazy: bool = False,
+                                       max_age: Optional[float] = None) -> PanelStatus:
         if self._current_panel_id is None:
             raise RuntimeError("Unset/Invalid current control panel ID.")
-        return await self.get_panel_status(control_panel_id=self._current_panel_id, pin=self._current_panel_pin)
+        return await self.get_panel_status(control_panel_id=self._current_panel_id, pin=self._current_panel_pin,
+                                           sections=sections, lazy=lazy, max_age=max_age)
 
 
 class ElmaxLocal(GenericElmax):
@@ -509,19 +1172,52 @@ class ElmaxLocal(GenericElmax):
     Class implementing the Local HTTP API client.
     """
 
-    def __init__(self, panel_api_url: str, panel_code: str, ssl_context: ssl.SSLContext = None):
+    def __init__(self, panel_api_url: str, panel_code: str, ssl_context: ssl.SSLContext = None,
+                 token_store: Optional[TokenStore] = None,
+                 http_session: Optional[httpx.AsyncClient] = None,
+                 limits: Optional[httpx.Limits] = None,
+                 http2: bool = False,
+                 status_cache: Optional[StatusCache] = None,
+                 skip_unchanged: bool = False,
+                 json_codec: Optional[JsonCodec] = None,
+                 command_scheduler: Optional[CommandScheduler] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+                 metrics: Optional[Metrics] = None):
         """Client constructor.
 
         Args:
             panel_api_url: API address of the Elmax Panel
             panel_code: authentication code to be used with the panel
             ssl_context: SSLContext object to use for SSL verification
+            token_store: store used to share tokens with other clients and processes (e.g. `FileTokenStore`)
+            http_session: HTTP session to use, possibly shared with other clients (see `create_http_session`).
+                Panels sharing a session must share the SSL configuration as well, set on the session.
+            limits: connection pool limits of the inner HTTP client, ignored when `http_session` is set
+            http2: enables HTTP/2 on the inner HTTP client, ignored when `http_session` is set
+            status_cache: read-through cache of the panel status
+            skip_unchanged: reuse the previously built status when the panel returns an identical response
+            json_codec: JSON codec used for requests and responses. Defaults to the fastest installed one
+            command_scheduler: scheduler of the commands of the panel. Defaults to a new scheduler
+            retry_policy: retry policy for transient failures and overall deadline of the requests
+            circuit_breakers: circuit breakers keyed by base URL, possibly shared with other clients
+            metrics: metrics registry, possibly shared with other clients
         """
-        super(ElmaxLocal, self).__init__(base_url=panel_api_url, ssl_context=ssl_context)
+        super(ElmaxLocal, self).__init__(base_url=panel_api_url, ssl_context=ssl_context, token_store=token_store,
+                                         http_session=http_session, limits=limits, http2=http2,
+                                         status_cache=status_cache, skip_unchanged=skip_unchanged,
+                                         json_codec=json_codec, command_scheduler=command_scheduler,
+                                         retry_policy=retry_policy, circuit_breakers=circuit_breakers,
+                                         metrics=metrics)
         # The current version of the local API does not expose the panel ID attribute,
         # so we use the panel IP as ID
         self.set_current_panel(panel_id=panel_api_url, panel_pin=panel_code)
 
+    def _token_store_key(self) -> str:
+        # Nothing derived from the panel code is stored: a token is only stored after a successful login, and the
+        # panel rejects it (triggering a new login) once it is no longer valid
+        return str(self._base_url)
+
     async def renew_token(self, *args, **kwargs) -> Dict:
         """
         Renews the token used by the API client.
@@ -538,25 +1234,7 @@ class ElmaxLocal(GenericElmax):
                 raise ElmaxBadLoginError()
             raise
 
-        if "token" not in response_data:
-            raise ValueError("Missing token parameter in json response")
-
-        jwt_token = response_data["token"]
-        if not jwt_token.startswith("JWT "):
-            raise ValueError("API did not return JWT token as expected")
-        jt = jwt_token.split("JWT ")[1]
-
-        # We do not need to verify the signature as this is usually something the server
-        # needs to do. We will just decode it to get information about user/claims.
-        # Moreover, since the JWT is obtained over a HTTPS channel, we do not need to verify
-        # its integrity/confidentiality as the ssl does this for us
-        self._jwt = jwt.decode(
-            jt, algorithms=_JWT_ALGS, options={"verify_signature": False}
-        )
-        self._raw_jwt = (
-            jt  # keep an encoded version of the JWT for convenience and performance
-        )
-        return self._jwt
+        return await self._store_token(response_data)
 
     async def login(self, *args, **kwargs) -> Dict:
         """
@@ -572,32 +1250,14 @@ class ElmaxLocal(GenericElmax):
         }
         try:
             response_data = await self._request(
-                method=Elmax.HttpMethod.POST, url=url, data=data, authorized=False
+                method=Elmax.HttpMethod.POST, url=url, data=data, authorized=False, idempotent=True
             )
         except ElmaxApiError as e:
             if e.status_code in (401, 403):
                 raise ElmaxBadLoginError()
             raise
 
-        if "token" not in response_data:
-            raise ValueError("Missing token parameter in json response")
-
-        jwt_token = response_data["token"]
-        if not jwt_token.startswith("JWT "):
-            raise ValueError("API did not return JWT token as expected")
-        jt = jwt_token.split("JWT ")[1]
-
-        # We do not need to verify the signature as this is usually something the server
-        # needs to do. We will just decode it to get information about user/claims.
-        # Moreover, since the JWT is obtained over a HTTPS channel, we do not need to verify
-        # its integrity/confidentiality as the ssl does this for us
-        self._jwt = jwt.decode(
-            jt, algorithms=_JWT_ALGS, options={"verify_signature": False}
-        )
-        self._raw_jwt = (
-            jt  # keep an encoded version of the JWT for convenience and performance
-        )
-        return self._jwt
+        return await self._store_token(response_data)
 
     @async_auth
     async def execute_command(self,
@@ -623,27 +1283,47 @@ class ElmaxLocal(GenericElmax):
             raise ValueError("Invalid/unsupported command")
 
         url = self._base_url / ENDPOINT_LOCAL_CMD / endpoint_id / cmd_str
-        return await self._execute_command(url=url, extra_payload=extra_payload, retry_attempts=retry_attempts)
+        return await self._execute_command(url=url, extra_payload=extra_payload, retry_attempts=retry_attempts,
+                                           endpoint_id=endpoint_id, priority=command_priority(command))
 
     @async_auth
-    async def get_current_panel_status(self, *args, **kwargs) -> PanelStatus:
+    async def get_current_panel_status(self,
+                                       sections: Optional[Collection[str]] = None,
+                                       lazy: bool = False,
+                                       max_age: Optional[float] = None) -> PanelStatus:
         """
         Fetches the control panel status.
 
+        Args:
+            sections: names of the endpoint sections to decode (e.g. `{"areas"}`). Other sections are left empty.
+                When not set, all the sections are decoded.
+            lazy: when set, endpoint sections are decoded on first access
+            max_age: maximum age, in seconds, of a status served by the status cache. Defaults to the cache
+                `max_age`. Ignored when the client has no status cache.
+
         Returns: The current status of the control panel
 
         Raises:
              ElmaxBadPinError: Whenever the provided PIN is incorrect or in any way refused by the server
              ElmaxApiError: in case of underlying api call failure
         """
+        if self._status_cache is not None:
+            return await self._status_cache.get_status(
+                panel_id=self._current_panel_id, pin=self._current_panel_pin,
+                fetch=self._fetch_current_panel_status, sections=sections, lazy=lazy, max_age=max_age,
+                metrics=self._metrics)
+
+        response_data = await self._fetch_current_panel_status()
+        url = self._base_url / ENDPOINT_DISCOVERY
+        return self._build_panel_status(str(url), response_data, sections=sections, lazy=lazy)
+
+    @async_auth
+    async def _fetch_current_panel_status(self) -> Dict:
         url = self._base_url / ENDPOINT_DISCOVERY
         try:
-            response_data = await self._request(Elmax.HttpMethod.GET, url=url, authorized=True)
+            return await self._request(Elmax.HttpMethod.GET, url=url, authorized=True, snapshot_key=str(url))
         except ElmaxApiError as e:
             if e.status_code == 403:
                 raise ElmaxBadPinError() from e
             else:
                 raise
-
-        panel_status = PanelStatus.from_api_response(response_entry=response_data)
-        return panel_status
@@ -0,0 +1,165 @@
+"""
+This module implements the metrics recorded by the API clients and the push-notification handlers: counters and
+latency histograms, exportable as a dictionary or in the Prometheus text exposition format.
+"""
+
+import bisect
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from elmax_api.constants import METRICS_LATENCY_BUCKETS, METRICS_PREFIX
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Histogram of observed values, with fixed bucket upper bounds"""
+    __slots__ = ("_bounds", "_counts", "_sum", "_count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = bounds
+        # One more bucket for values above the last bound
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        """Returns the (upper bound, number of values lower or equal to it) pairs, ending with +Inf"""
+        res = []
+        total = 0
+        for bound, count in zip(list(self._bounds) + [math.inf], self._counts):
+            total += count
+            res.append((bound, total))
+        return res
+
+
+class Metrics:
+    """
+    Registry of labelled counters and histograms.
+    Recording a value costs a dictionary lookup (and a binary search for histograms), so metrics can be left
+    on in production. A registry can be shared by many clients and push-notification handlers.
+    """
+    _counters: Dict[str, Dict[_Labels, float]]
+    _histograms: Dict[str, Dict[_Labels, Histogram]]
+
+    def __init__(self, buckets: Sequence[float] = METRICS_LATENCY_BUCKETS, enabled: bool = True):
+        """
+        Constructor.
+
+        Args:
+            buckets: upper bounds, in seconds, of the histogram buckets
+            enabled: when not set, nothing is recorded
+        """
+        self._buckets = tuple(sorted(buckets))
+        self._enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Increments the counter with the given name and labels"""
+        if not self._enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Records a value, usually a duration in seconds, in the histogram with the given name and labels"""
+        if not self._enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = Histogram(self._buckets)
+            series[key] = histogram
+        histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        """Returns the value of the counter with the given name and labels"""
+        return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        """Returns the histogram with the given name and labels, if any value was recorded"""
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, List[Dict]]]:
+        """
+        Returns all the recorded metrics, e.g.:
+
+            {"counters": {"responses_total": [{"labels": {"endpoint": "login", "status": "200"}, "value": 1}]},
+             "histograms": {"request_duration_seconds": [{"labels": {...}, "count": 1, "sum": 0.05,
+                                                          "buckets": {"0.005": 0, ..., "+Inf": 1}}]}}
+        """
+        return {
+            "counters": {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            },
+            "histograms": {
+                name: [{
+                    "labels": dict(key),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": {_format_bound(bound): count for bound, count in histogram.cumulative_counts()},
+                } for key, histogram in series.items()]
+                for name, series in self._histograms.items()
+            },
+        }
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Returns all the recorded metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for key, value in series.items():
+                lines.append(f"{metric}{_format_labels(key)} {_format_value(value)}")
+        for name, series in sorted(self._histograms.items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for key, histogram in series.items():
+                for bound, count in histogram.cumulative_counts():
+                    lines.append(f"{metric}_bucket{_format_labels(key + (('le', _format_bound(bound)),))} {count}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}"
@@ -5,6 +5,8 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Actuator(DeviceEndpoint):
     """Representation of an actuator"""
+    __slots__ = ("_opened",)
+    FINGERPRINT_FIELDS = DeviceEndpoint.FINGERPRINT_FIELDS + ("opened",)
 
     def __init__(self,
                  endpoint_id: str,
@@ -6,6 +6,9 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Area(DeviceEndpoint):
     """Representation of an Area configuration"""
+    __slots__ = ("_status", "_armed_status", "_available_arm_statuses", "_available_statuses")
+    FINGERPRINT_FIELDS = DeviceEndpoint.FINGERPRINT_FIELDS + ("status", "armed_status", "available_statuses",
+                                                              "available_arm_statuses")
 
     def __init__(self,
                  endpoint_id: str,
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Dict, Optional, Union
 
 
 class Command(Enum):
@@ -26,3 +27,46 @@ class AreaCommand(Command):
 class SceneCommand(Command):
     TRIGGER_SCENE = "on"
 
+
+
+class CommandResult:
+    """Outcome of a command issued through a batch (see `GenericElmax.execute_commands`)"""
+    __slots__ = ("_endpoint_id", "_command", "_extra_payload", "_result", "_error")
+
+    def __init__(self, endpoint_id: str, command: Union[Command, str], extra_payload: Optional[Dict] = None,
+                 result: Optional[Dict] = None, error: Optional[BaseException] = None):
+        self._endpoint_id = endpoint_id
+        self._command = command
+        self._extra_payload = extra_payload
+        self._result = result
+        self._error = error
+
+    @property
+    def endpoint_id(self) -> str:
+        return self._endpoint_id
+
+    @property
+    def command(self) -> Union[Command, str]:
+        return self._command
+
+    @property
+    def extra_payload(self) -> Optional[Dict]:
+        return self._extra_payload
+
+    @property
+    def result(self) -> Optional[Dict]:
+        """Json response data returned by the API, if the command succeeded"""
+        return self._result
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        """Exception raised by the command, if it failed"""
+        return self._error
+
+    @property
+    def succeeded(self) -> bool:
+        return self._error is None
+
+    def __repr__(self):
+        outcome = f"error={self._error!r}" if self._error is not None else f"result={self._result}"
+        return f"CommandResult({self._endpoint_id}, {self._command}, {outcome})"
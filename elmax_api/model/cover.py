@@ -6,6 +6,8 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Cover(DeviceEndpoint):
     """Representation of a cover"""
+    __slots__ = ("_position", "_status")
+    FINGERPRINT_FIELDS = DeviceEndpoint.FINGERPRINT_FIELDS + ("position", "status")
 
     def __init__(self,
                  endpoint_id: str,
@@ -0,0 +1,87 @@
+from typing import Any, Dict, List, Tuple
+
+from elmax_api.model.endpoint import DeviceEndpoint
+
+
+class EndpointChange:
+    """Representation of an endpoint whose state differs between two status snapshots"""
+    __slots__ = ("_previous", "_current", "_changed_fields")
+
+    def __init__(self, previous: DeviceEndpoint, current: DeviceEndpoint, changed_fields: Dict[str, Tuple[Any, Any]]):
+        self._previous = previous
+        self._current = current
+        self._changed_fields = changed_fields
+
+    @property
+    def endpoint_id(self) -> str:
+        return self._current.endpoint_id
+
+    @property
+    def previous(self) -> DeviceEndpoint:
+        return self._previous
+
+    @property
+    def current(self) -> DeviceEndpoint:
+        return self._current
+
+    @property
+    def changed_fields(self) -> Dict[str, Tuple[Any, Any]]:
+        """
+        Fields that changed, mapped to their (previous, current) values.
+        E.g. `{"opened": (False, True)}`
+        """
+        return self._changed_fields
+
+    def __repr__(self):
+        return f"EndpointChange({self.endpoint_id}, {self._changed_fields})"
+
+    @staticmethod
+    def between(previous: DeviceEndpoint, current: DeviceEndpoint) -> 'EndpointChange':
+        """Builds the change set between two states of the same endpoint"""
+        changed = {}
+        if type(previous) is not type(current):
+            changed["type"] = (type(previous).__name__, type(current).__name__)
+            fields = [f for f in current.FINGERPRINT_FIELDS if f in previous.FINGERPRINT_FIELDS]
+        else:
+            fields = current.FINGERPRINT_FIELDS
+        for field in fields:
+            old, new = getattr(previous, field), getattr(current, field)
+            if old != new:
+                changed[field] = (old, new)
+        return EndpointChange(previous=previous, current=current, changed_fields=changed)
+
+
+class StatusDiff:
+    """Representation of the differences between two status snapshots"""
+    __slots__ = ("_added", "_removed", "_changed")
+
+    def __init__(self, added: List[DeviceEndpoint], removed: List[DeviceEndpoint], changed: List[EndpointChange]):
+        self._added = added
+        self._removed = removed
+        self._changed = changed
+
+    @property
+    def added(self) -> List[DeviceEndpoint]:
+        """Endpoints found only in the current snapshot"""
+        return self._added
+
+    @property
+    def removed(self) -> List[DeviceEndpoint]:
+        """Endpoints found only in the previous snapshot"""
+        return self._removed
+
+    @property
+    def changed(self) -> List[EndpointChange]:
+        """Endpoints found in both the snapshots, whose state has changed"""
+        return self._changed
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self._added or self._removed or self._changed)
+
+    def __bool__(self):
+        return not self.is_empty
+
+    def __repr__(self):
+        return f"StatusDiff(added={[e.endpoint_id for e in self._added]}, " \
+               f"removed={[e.endpoint_id for e in self._removed]}, changed={self._changed})"
@@ -1,7 +1,14 @@
-from typing import Dict
+from typing import Any, Dict, Tuple
 
 
 class DeviceEndpoint:
+    # Endpoints are kept alive by the thousands (many panels, rolling snapshots), so the whole hierarchy is
+    # slotted: subclasses must declare the slots for the attributes they add.
+    __slots__ = ("_endpoint_id", "_visible", "_index", "_name")
+    # Properties describing the endpoint state, compared when diffing status snapshots.
+    # Subclasses extend this tuple with their own properties.
+    FINGERPRINT_FIELDS = ("visible", "index", "name")
+
     def __init__(self, endpoint_id: str, visible: bool, index: int, name: str):
         self._endpoint_id = endpoint_id
         self._visible = visible
@@ -24,6 +31,14 @@ class DeviceEndpoint:
     def name(self) -> str:
         return self._name
 
+    @property
+    def fingerprint(self) -> Tuple[Any, ...]:
+        """
+        Hashable summary of the endpoint state: two endpoints with the same id and fingerprint are in the same state.
+        """
+        return (type(self).__name__,) + tuple(
+            tuple(v) if isinstance(v, list) else v for v in (getattr(self, f) for f in self.FINGERPRINT_FIELDS))
+
     def __eq__(self, other):
         return self.endpoint_id == other.endpoint_id and \
                self.visible==other.visible and \
@@ -5,6 +5,7 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Group(DeviceEndpoint):
     """Representation of a Group configuration"""
+    __slots__ = ()
 
     def __init__(self,
                  endpoint_id: str,
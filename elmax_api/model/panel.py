@@ -1,10 +1,11 @@
 import json
 from enum import Enum
-from typing import Dict, List, Any
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple
 
 from elmax_api.model.actuator import Actuator
 from elmax_api.model.area import Area
 from elmax_api.model.cover import Cover
+from elmax_api.model.diff import EndpointChange, StatusDiff
 from elmax_api.model.endpoint import DeviceEndpoint
 from elmax_api.model.goup import Group
 from elmax_api.model.scene import Scene
@@ -55,8 +56,196 @@ class PanelEntry:
         return control_panel
 
 
-class PanelStatus:
+# Endpoint sections of panel and endpoint status payloads: attribute name -> (json key, endpoint class)
+STATUS_SECTIONS = {
+    "zones": ("zone", Zone),
+    "actuators": ("uscite", Actuator),
+    "areas": ("aree", Area),
+    "covers": ("tapparelle", Cover),
+    "groups": ("gruppi", Group),
+    "scenes": ("scenari", Scene),
+}
+_SECTION_BY_CLASS = {cls: name for name, (_, cls) in STATUS_SECTIONS.items()}
+
+
+class _SectionedStatus:
+    """
+    Base class for status objects holding the endpoint sections of a panel (zones, actuators, areas...).
+    Sections can be decoded lazily: in that case the raw json payload is kept and each section is decoded
+    on first access.
+    Status objects are snapshots: the endpoint lists and the endpoint_id lookup indexes are built once
+    and cached, so they must not be modified by callers.
+    """
+    __slots__ = ("_zones", "_actuators", "_areas", "_groups", "_scenes", "_covers", "_raw", "_all_endpoints",
+                 "_endpoint_index", "_section_indexes", "_fingerprints")
+    # Slots holding raw data and caches, which are not part of the status representation
+    _INTERNAL_SLOTS = ("_raw", "_all_endpoints", "_endpoint_index", "_section_indexes", "_fingerprints")
+
+    def _init_sections(self,
+                       zones: Optional[List[Zone]],
+                       actuators: Optional[List[Actuator]],
+                       areas: Optional[List[Area]],
+                       groups: Optional[List[Group]],
+                       scenes: Optional[List[Scene]],
+                       covers: Optional[List[Cover]]):
+        self._zones = zones
+        self._actuators = actuators
+        self._areas = areas
+        self._groups = groups
+        self._scenes = scenes
+        self._covers = covers
+        self._raw = None
+        self._all_endpoints = None
+        self._endpoint_index = None
+        self._section_indexes = None
+        self._fingerprints = None
+
+    def _decode_section(self, name: str) -> List[DeviceEndpoint]:
+        key, cls = STATUS_SECTIONS[name]
+        raw = self._raw if self._raw is not None else {}
+        value = [cls.from_api_response(x) for x in raw.get(key, [])]
+        setattr(self, f"_{name}", value)
+        # Once every section has been decoded, there is no reason to keep the raw payload alive
+        if all(getattr(self, f"_{n}") is not None for n in STATUS_SECTIONS):
+            self._raw = None
+        return value
+
+    @staticmethod
+    def _parse_sections(response_entry: Dict,
+                        lazy: bool = False,
+                        sections: Optional[Collection[str]] = None) -> Dict[str, Optional[List[DeviceEndpoint]]]:
+        if sections is not None:
+            unknown = set(sections).difference(STATUS_SECTIONS)
+            if unknown:
+                raise ValueError(f"Invalid sections {', '.join(sorted(unknown))}. "
+                                 f"Expecting any of {', '.join(STATUS_SECTIONS)}")
+        res = {}
+        for name, (key, cls) in STATUS_SECTIONS.items():
+            if sections is not None and name not in sections:
+                res[name] = []
+            elif lazy:
+                res[name] = None
+            else:
+                res[name] = [cls.from_api_response(x) for x in response_entry.get(key, [])]
+        return res
+
+    @property
+    def zones(self) -> List[Zone]:
+        return self._zones if self._zones is not None else self._decode_section("zones")
+
+    @property
+    def actuators(self) -> List[Actuator]:
+        return self._actuators if self._actuators is not None else self._decode_section("actuators")
+
+    @property
+    def areas(self) -> List[Area]:
+        return self._areas if self._areas is not None else self._decode_section("areas")
+
+    @property
+    def groups(self) -> List[Group]:
+        return self._groups if self._groups is not None else self._decode_section("groups")
+
+    @property
+    def scenes(self) -> List[Scene]:
+        return self._scenes if self._scenes is not None else self._decode_section("scenes")
+
+    @property
+    def covers(self) -> List[Cover]:
+        return self._covers if self._covers is not None else self._decode_section("covers")
+
+    @property
+    def all_endpoints(self) -> List[DeviceEndpoint]:
+        if self._all_endpoints is None:
+            res = []
+            res.extend(self.actuators)
+            res.extend(self.areas)
+            res.extend(self.groups)
+            res.extend(self.scenes)
+            res.extend(self.zones)
+            res.extend(self.covers)
+            self._all_endpoints = res
+        return self._all_endpoints
+
+    def _section_index(self, name: str) -> Dict[str, DeviceEndpoint]:
+        # Per-section indexes only decode the section they refer to, which keeps lazy statuses lazy
+        if self._section_indexes is None:
+            self._section_indexes = {}
+        index = self._section_indexes.get(name)
+        if index is None:
+            index = {e.endpoint_id: e for e in getattr(self, name)}
+            self._section_indexes[name] = index
+        return index
+
+    def get_endpoint(self, endpoint_id: str) -> Optional[DeviceEndpoint]:
+        """
+        Looks up an endpoint of any type by its id.
+
+        Returns: The endpoint with the given id, or None if there is no such endpoint
+        """
+        if self._endpoint_index is None:
+            self._endpoint_index = {e.endpoint_id: e for e in self.all_endpoints}
+        return self._endpoint_index.get(endpoint_id)
+
+    @property
+    def fingerprints(self) -> Dict[str, Tuple[Any, ...]]:
+        """Fingerprints of all the endpoints, by endpoint_id. See `DeviceEndpoint.fingerprint`"""
+        if self._fingerprints is None:
+            self._fingerprints = {e.endpoint_id: e.fingerprint for e in self.all_endpoints}
+        return self._fingerprints
+
+    def diff(self, previous: '_SectionedStatus') -> StatusDiff:
+        """
+        Computes the endpoint changes from a previous status snapshot to this one.
+        Endpoints are matched by id and compared by fingerprint, so the cost is linear in the number of endpoints.
+
+        Args:
+            previous: the previous status snapshot
+
+        Returns: The added, removed and changed endpoints
+        """
+        current_fingerprints = self.fingerprints
+        previous_fingerprints = previous.fingerprints
+        added = []
+        changed = []
+        for endpoint in self.all_endpoints:
+            endpoint_id = endpoint.endpoint_id
+            previous_fingerprint = previous_fingerprints.get(endpoint_id)
+            if previous_fingerprint is None:
+                added.append(endpoint)
+            elif previous_fingerprint != current_fingerprints[endpoint_id]:
+                changed.append(EndpointChange.between(previous.get_endpoint(endpoint_id), endpoint))
+        removed = [e for e in previous.all_endpoints if e.endpoint_id not in current_fingerprints]
+        return StatusDiff(added=added, removed=removed, changed=changed)
+
+    def get_zone(self, endpoint_id: str) -> Optional[Zone]:
+        """Returns the zone with the given endpoint id, or None if there is no such zone"""
+        return self._section_index("zones").get(endpoint_id)
+
+    def get_actuator(self, endpoint_id: str) -> Optional[Actuator]:
+        """Returns the actuator with the given endpoint id, or None if there is no such actuator"""
+        return self._section_index("actuators").get(endpoint_id)
+
+    def get_area(self, endpoint_id: str) -> Optional[Area]:
+        """Returns the area with the given endpoint id, or None if there is no such area"""
+        return self._section_index("areas").get(endpoint_id)
+
+    def get_cover(self, endpoint_id: str) -> Optional[Cover]:
+        """Returns the cover with the given endpoint id, or None if there is no such cover"""
+        return self._section_index("covers").get(endpoint_id)
+
+    def get_group(self, endpoint_id: str) -> Optional[Group]:
+        """Returns the group with the given endpoint id, or None if there is no such group"""
+        return self._section_index("groups").get(endpoint_id)
+
+    def get_scene(self, endpoint_id: str) -> Optional[Scene]:
+        """Returns the scene with the given endpoint id, or None if there is no such scene"""
+        return self._section_index("scenes").get(endpoint_id)
+
+
+class PanelStatus(_SectionedStatus):
     """Representation of a panel status"""
+    __slots__ = ("_panel_id", "_user_email", "_release", "_cover_feature", "_scene_feature", "_push_feature",
+                 "_accessory_type", "_accessory_release")
 
     def __init__(self,
                  panel_id: str,
@@ -82,12 +271,8 @@ class PanelStatus:
         self._release = release
         self._cover_feature = cover_feature
         self._scene_feature = scene_feature
-        self._zones = zones
-        self._actuators = actuators
-        self._areas = areas
-        self._groups = groups
-        self._scenes = scenes
-        self._covers = covers
+        self._init_sections(zones=zones, actuators=actuators, areas=areas, groups=groups, scenes=scenes,
+                            covers=covers)
         self._push_feature = push_feature
         self._accessory_type = accessory_type
         self._accessory_release = accessory_release
@@ -112,41 +297,6 @@ class PanelStatus:
     def scene_feature(self) -> bool:
         return self._scene_feature
 
-    @property
-    def zones(self) -> List[Zone]:
-        return self._zones
-
-    @property
-    def actuators(self) -> List[Actuator]:
-        return self._actuators
-
-    @property
-    def areas(self) -> List[Area]:
-        return self._areas
-
-    @property
-    def groups(self) -> List[Group]:
-        return self._groups
-
-    @property
-    def scenes(self) -> List[Scene]:
-        return self._scenes
-
-    @property
-    def covers(self) -> List[Cover]:
-        return self._covers
-
-    @property
-    def all_endpoints(self) -> List[DeviceEndpoint]:
-        res = []
-        res.extend(self.actuators)
-        res.extend(self.areas)
-        res.extend(self.groups)
-        res.extend(self.scenes)
-        res.extend(self.zones)
-        res.extend(self.covers)
-        return res
-
     @property
     def push_feature(self) -> bool:
         return self._push_feature
@@ -160,19 +310,77 @@ class PanelStatus:
         return self._accessory_release
 
     def __repr__(self):
+        # Make sure lazy sections are decoded, so that they are rendered
+        _ = self.all_endpoints
+
         def inspectobj(obj):
             if isinstance(obj,Enum):
                 return obj.name
             elif hasattr(obj, "__dict__"):
                 return vars(obj)
+            elif hasattr(obj, "__slots__"):
+                return {slot: getattr(obj, slot) for cls in type(obj).__mro__ for slot in getattr(cls, "__slots__", ())
+                        if slot not in _SectionedStatus._INTERNAL_SLOTS}
             else:
                 return str(obj)
 
         return json.dumps(self, default=inspectobj)
 
+    def merge(self, endpoints: Iterable[DeviceEndpoint]) -> 'PanelStatus':
+        """
+        Returns a new status, where the given endpoints replace the ones with the same id. Endpoints missing from
+        this status are appended to their section. This status is left untouched, and sections not involved are
+        shared with the new status, lazy ones included.
+
+        Args:
+            endpoints: up-to-date endpoints, e.g. from `EndpointStatus.all_endpoints`
+        """
+        updates: Dict[str, Dict[str, DeviceEndpoint]] = {}
+        for endpoint in endpoints:
+            name = _SECTION_BY_CLASS.get(type(endpoint))
+            if name is None:
+                raise ValueError(f"Unexpected endpoint type {type(endpoint).__name__}")
+            updates.setdefault(name, {})[endpoint.endpoint_id] = endpoint
+
+        sections = {}
+        for name in STATUS_SECTIONS:
+            section_updates = updates.get(name)
+            if section_updates is None:
+                # Possibly None, when lazy and not decoded yet
+                sections[name] = getattr(self, f"_{name}")
+                continue
+            merged = [section_updates.pop(e.endpoint_id, e) for e in getattr(self, name)]
+            merged.extend(section_updates.values())
+            sections[name] = merged
+
+        status = PanelStatus(
+            panel_id=self._panel_id,
+            user_email=self._user_email,
+            release=self._release,
+            cover_feature=self._cover_feature,
+            scene_feature=self._scene_feature,
+            push_feature=self._push_feature,
+            accessory_type=self._accessory_type,
+            accessory_release=self._accessory_release,
+            **sections
+        )
+        if any(section is None for section in sections.values()):
+            status._raw = self._raw
+        return status
+
     @staticmethod
-    def from_api_response(response_entry: Dict) -> 'PanelStatus':
-        """Create a new panel status object from the API json response"""
+    def from_api_response(response_entry: Dict,
+                          lazy: bool = False,
+                          sections: Optional[Collection[str]] = None) -> 'PanelStatus':
+        """
+        Create a new panel status object from the API json response
+
+        Args:
+            response_entry: the json response
+            lazy: when set, endpoint sections are decoded on first access rather than right away
+            sections: names of the sections to decode (see `STATUS_SECTIONS`). Other sections are left empty.
+                When not set, all the sections are decoded.
+        """
         panel_status = PanelStatus(
             panel_id=response_entry.get('centrale'),
             user_email=response_entry.get('utente'),
@@ -182,17 +390,16 @@ class PanelStatus:
             push_feature=response_entry.get('pushFeature', False),
             accessory_type=response_entry.get('tipo_accessorio', 'Unknown'),
             accessory_release=response_entry.get('release_accessorio', 'Unknown'),
-            zones=[Zone.from_api_response(x) for x in response_entry.get('zone', [])],
-            actuators=[Actuator.from_api_response(x) for x in response_entry.get('uscite', [])],
-            areas=[Area.from_api_response(x) for x in response_entry.get('aree', [])],
-            covers=[Cover.from_api_response(x) for x in response_entry.get('tapparelle', [])],
-            groups=[Group.from_api_response(x) for x in response_entry.get('gruppi', [])],
-            scenes=[Scene.from_api_response(x) for x in response_entry.get('scenari', [])]
+            **_SectionedStatus._parse_sections(response_entry, lazy=lazy, sections=sections)
         )
+        if lazy:
+            panel_status._raw = response_entry
         return panel_status
 
-class EndpointStatus:
+class EndpointStatus(_SectionedStatus):
     """Representation of an endpoint status"""
+    __slots__ = ("_release", "_cover_feature", "_scene_feature", "_push_feature", "_accessory_type",
+                 "_accessory_release")
 
     def __init__(self,
                  release: str,
@@ -213,12 +420,8 @@ class EndpointStatus:
         self._release = release
         self._cover_feature = cover_feature
         self._scene_feature = scene_feature
-        self._zones = zones
-        self._actuators = actuators
-        self._areas = areas
-        self._groups = groups
-        self._scenes = scenes
-        self._covers = covers
+        self._init_sections(zones=zones, actuators=actuators, areas=areas, groups=groups, scenes=scenes,
+                            covers=covers)
         self._push_feature = push_feature
         self._accessory_type = accessory_type
         self._accessory_release = accessory_release
@@ -235,40 +438,6 @@ class EndpointStatus:
     def scene_feature(self) -> bool:
         return self._scene_feature
 
-    @property
-    def zones(self) -> List[Zone]:
-        return self._zones
-
-    @property
-    def actuators(self) -> List[Actuator]:
-        return self._actuators
-
-    @property
-    def areas(self) -> List[Area]:
-        return self._areas
-
-    @property
-    def groups(self) -> List[Group]:
-        return self._groups
-
-    @property
-    def scenes(self) -> List[Scene]:
-        return self._scenes
-
-    @property
-    def covers(self) -> List[Cover]:
-        return self._covers
-
-    @property
-    def all_endpoints(self) -> List[DeviceEndpoint]:
-        res = []
-        res.extend(self.actuators)
-        res.extend(self.areas)
-        res.extend(self.groups)
-        res.extend(self.scenes)
-        res.extend(self.zones)
-        return res
-
     @property
     def push_feature(self) -> bool:
         return self._push_feature
@@ -282,8 +451,18 @@ class EndpointStatus:
         return self._accessory_release
 
     @staticmethod
-    def from_api_response(response_entry: Dict) -> 'EndpointStatus':
-        """Create a new endpoint status object from the API json response"""
+    def from_api_response(response_entry: Dict,
+                          lazy: bool = False,
+                          sections: Optional[Collection[str]] = None) -> 'EndpointStatus':
+        """
+        Create a new endpoint status object from the API json response
+
+        Args:
+            response_entry: the json response
+            lazy: when set, endpoint sections are decoded on first access rather than right away
+            sections: names of the sections to decode (see `STATUS_SECTIONS`). Other sections are left empty.
+                When not set, all the sections are decoded.
+        """
         status = EndpointStatus(
             release=response_entry.get('release', 'Unknown'),
             cover_feature=response_entry.get('tappFeature', False),
@@ -291,11 +470,8 @@ class EndpointStatus:
             push_feature=response_entry.get('pushFeature', False),
             accessory_type=response_entry.get('tipo_accessorio', 'Unknown'),
             accessory_release=response_entry.get('release_accessorio', 'Unknown'),
-            zones=[Zone.from_api_response(x) for x in response_entry.get('zone', [])],
-            actuators=[Actuator.from_api_response(x) for x in response_entry.get('uscite', [])],
-            areas=[Area.from_api_response(x) for x in response_entry.get('aree', [])],
-            covers=[Cover.from_api_response(x) for x in response_entry.get('tapparelle', [])],
-            groups=[Group.from_api_response(x) for x in response_entry.get('gruppi', [])],
-            scenes=[Scene.from_api_response(x) for x in response_entry.get('scenari', [])]
+            **_SectionedStatus._parse_sections(response_entry, lazy=lazy, sections=sections)
         )
-        return status
\ No newline at end of file
+        if lazy:
+            status._raw = response_entry
+        return status
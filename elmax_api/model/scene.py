@@ -5,6 +5,7 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Scene(DeviceEndpoint):
     """Representation of a Scene configuration"""
+    __slots__ = ()
 
     def __init__(self,
                  endpoint_id: str,
@@ -5,6 +5,8 @@ from elmax_api.model.endpoint import DeviceEndpoint
 
 class Zone(DeviceEndpoint):
     """Representation of a zone configuration"""
+    __slots__ = ("_opened", "_excluded")
+    FINGERPRINT_FIELDS = DeviceEndpoint.FINGERPRINT_FIELDS + ("opened", "excluded")
 
     def __init__(self,
                  endpoint_id: str,
@@ -1,21 +1,44 @@
 import asyncio
-import json
+import hashlib
+import inspect
 import logging
+import random
 import ssl
+import time
 from asyncio import FIRST_COMPLETED, Event, Task, AbstractEventLoop
-from typing import Awaitable, Callable, Optional
+from enum import Enum
+from typing import Awaitable, Callable, Collection, Dict, Optional, Union
 from datetime import datetime
 from websockets.asyncio import client as ws_client
-from websockets.exceptions import ConnectionClosedError
+from websockets.exceptions import ConnectionClosedError, InvalidStatus
 
+from elmax_api.codec import JsonCodec
+from elmax_api.constants import TOKEN_REFRESH_RETRY_INTERVAL
 from elmax_api.exceptions import ElmaxBadLoginError
-from elmax_api.http import GenericElmax
+from elmax_api.http import GenericElmax, helper
+from elmax_api.metrics import Metrics
 from elmax_api.model.panel import PanelStatus
 
 _LOGGER = logging.getLogger(__name__)
 
 _WS_ERROR_COOLDOWN_SECONDS = 15
 _WS_DROP_COOLDOWN_SECONDS = 0
+# Tokens are renewed this many seconds before their expiration
+_TOKEN_RENEW_INTERVAL = 30
+
+PushHandler = Union[Callable[[PanelStatus], Awaitable[None]], Callable[[PanelStatus], None]]
+HandlerErrorCallback = Callable[[PushHandler, BaseException], Optional[Awaitable[None]]]
+
+
+class DispatchMode(Enum):
+    """Strategies used to deliver push notifications to the registered handlers"""
+
+    # Handlers are awaited one after the other, inside the websocket receive loop
+    SEQUENTIAL = "sequential"
+    # Every event is fanned out to all the handlers at once, outside the receive loop. Coroutine handlers run
+    # as tasks, plain callables run in the default executor. A slow handler does not delay the others, but
+    # a handler slower than the event rate may observe events out of order.
+    CONCURRENT = "concurrent"
 
 
 class PushNotificationHandler:
@@ -31,16 +54,96 @@ class PushNotificationHandler:
     _task: Optional[Task]
     _loop: Optional[AbstractEventLoop]
     _stop_event: Event
+    _lazy: bool
+    _sections: Optional[Collection[str]]
+    _dispatch_mode: DispatchMode
+    _handler_timeout: Optional[float]
+    _on_handler_error: Optional[HandlerErrorCallback]
+    _dispatch_tasks: set[Task]
+    _coalesce_window: Optional[float]
+    _coalesce_max_delay: Optional[float]
+    _urgent_keys: Collection[str]
+    _pending_message: Optional[Dict]
+    _pending_since: float
+    _flush_handle: Optional[asyncio.TimerHandle]
+    _last_delivered: Optional[Dict]
+    _coalesced_count: int
+    _skip_unchanged: bool
+    _last_digest: Optional[bytes]
+    _skipped_count: int
+    _json_codec: JsonCodec
+    _metrics: Metrics
+    _reconnect_jitter: float
+    _connected: bool
+    _message_count: int
+    _connection_count: int
+    _error_count: int
+    _last_message_time: Optional[float]
+    _last_error: Optional[BaseException]
 
-    def __init__(self, endpoint: str, http_client: GenericElmax, ssl_context: ssl.SSLContext = None):
+    def __init__(self, endpoint: str, http_client: GenericElmax, ssl_context: ssl.SSLContext = None,
+                 lazy: bool = False, sections: Optional[Collection[str]] = None,
+                 dispatch_mode: DispatchMode = DispatchMode.SEQUENTIAL, handler_timeout: Optional[float] = None,
+                 on_handler_error: Optional[HandlerErrorCallback] = None, coalesce_window: Optional[float] = None,
+                 coalesce_max_delay: Optional[float] = None, urgent_keys: Collection[str] = ("aree",),
+                 reconnect_jitter: float = 0.0, skip_unchanged: bool = False,
+                 json_codec: Optional[JsonCodec] = None, metrics: Optional[Metrics] = None):
         """
         Constructor.
         @param endpoint: panel push-notification websocket endpoint. It should start with ws:// or wss://. It should be wss://ELMAX_PANEL_IP/api/v2/push
         @param http_client: instance of GenericElmax (or Elmax) object to use as http API client
         @param ssl_context: custom ssl context configuration. Useful to accept self-signed certificates or similar.
+        @param lazy: when set, endpoint sections of the notified PanelStatus are decoded on first access
+        @param sections: names of the endpoint sections to decode (e.g. {"areas"}). Others are left empty.
+        @param dispatch_mode: how events are delivered to the handlers. See `DispatchMode`.
+        @param handler_timeout: maximum time, in seconds, granted to each handler to process an event.
+            Only enforced in CONCURRENT dispatch mode.
+        @param on_handler_error: callback (or coroutine) invoked with the handler and the exception whenever a
+            handler fails or times out (asyncio.TimeoutError).
+        @param coalesce_window: when set, frames received within this many seconds from each other are collapsed,
+            so that only the latest panel status is parsed and delivered to the handlers.
+        @param coalesce_max_delay: maximum time, in seconds, a frame can be held back while coalescing.
+            Defaults to 4 times the coalesce window.
+        @param urgent_keys: payload keys (e.g. "aree" for areas) whose changes are delivered right away, bypassing
+            the coalescing window.
+        @param reconnect_jitter: maximum random delay, in seconds, added before every reconnection attempt. It
+            spreads reconnections of many handlers over time after a network outage.
+        @param skip_unchanged: when set, frames byte-identical to the previous one are neither parsed nor
+            dispatched.
+        @param json_codec: JSON codec used to decode the frames. Defaults to the codec of the http client.
+        @param metrics: registry recording the received messages and the decode, parse and dispatch times.
+            Defaults to the registry of the http client.
         """
         self._endpoint = endpoint
+        self._lazy = lazy
+        self._sections = sections
+        self._dispatch_mode = dispatch_mode
+        self._handler_timeout = handler_timeout
+        self._on_handler_error = on_handler_error
+        self._dispatch_tasks = set()
+        self._coalesce_window = coalesce_window
+        if coalesce_max_delay is None and coalesce_window is not None:
+            coalesce_max_delay = 4 * coalesce_window
+        self._coalesce_max_delay = coalesce_max_delay
+        self._urgent_keys = urgent_keys
+        self._pending_message = None
+        self._pending_since = 0.0
+        self._flush_handle = None
+        self._last_delivered = None
+        self._coalesced_count = 0
+        self._skip_unchanged = skip_unchanged
+        self._last_digest = None
+        self._skipped_count = 0
+        self._reconnect_jitter = reconnect_jitter
+        self._connected = False
+        self._message_count = 0
+        self._connection_count = 0
+        self._error_count = 0
+        self._last_message_time = None
+        self._last_error = None
         self._client = http_client
+        self._json_codec = json_codec if json_codec is not None else http_client.json_codec
+        self._metrics = metrics if metrics is not None else http_client.metrics
         self._event_handlers = set()
         if ssl_context is None:
             self._ssl_context = ssl.create_default_context()
@@ -51,17 +154,19 @@ class PushNotificationHandler:
         self._task = None
         self._loop = None
 
-    def register_push_notification_handler(self, coro: Callable[[PanelStatus], Awaitable[None]]) -> None:
+    def register_push_notification_handler(self, coro: PushHandler) -> None:
         """
         Registers a push notification handler coroutine. Every time a new event is received, that coro will be
         invoked and awaited.
+        In CONCURRENT dispatch mode, plain (non-coroutine) callables are accepted too: they run in the default
+        executor.
         @param coro: callback coroutine which takes a PanelStatus object as argument
         @return:
         """
         if coro not in self._event_handlers:
             self._event_handlers.add(coro)
 
-    def unregister_push_notification_handler(self, coro: Callable[[PanelStatus], Awaitable[None]]):
+    def unregister_push_notification_handler(self, coro: PushHandler):
         """
         Unregisters the given coroutine callback from the event push notifications
         @param coro: callback to unregister
@@ -70,6 +175,50 @@ class PushNotificationHandler:
         if coro in self._event_handlers:
             self._event_handlers.remove(coro)
 
+    @property
+    def coalesced_count(self) -> int:
+        """Number of frames that were dropped in favour of a newer one by the coalescing window"""
+        return self._coalesced_count
+
+    @property
+    def skipped_count(self) -> int:
+        """Number of frames skipped since identical to the previous one (see `skip_unchanged`)"""
+        return self._skipped_count
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether the websocket is currently connected"""
+        return self._connected
+
+    @property
+    def message_count(self) -> int:
+        """Number of frames received since the handler was created"""
+        return self._message_count
+
+    @property
+    def connection_count(self) -> int:
+        """Number of successful websocket connections since the handler was created"""
+        return self._connection_count
+
+    @property
+    def error_count(self) -> int:
+        """Number of websocket connections that failed or were dropped since the handler was created"""
+        return self._error_count
+
+    @property
+    def last_message_time(self) -> Optional[float]:
+        """Unix timestamp of the last received frame, if any"""
+        return self._last_message_time
+
+    @property
+    def last_error(self) -> Optional[BaseException]:
+        """Last error that caused the websocket connection to fail, if any"""
+        return self._last_error
+
     def start(self, loop: AbstractEventLoop):
         """
         Starts the push-notification loop handler task.
@@ -81,6 +230,14 @@ class PushNotificationHandler:
         self._loop = loop
         self._task = loop.create_task(self._looper())
 
+    async def wait_stopped(self):
+        """
+        Waits for the push-notification loop handler task to terminate, whatever the reason.
+        Cancelling the wait does not stop the handler.
+        """
+        if self._task is not None:
+            await asyncio.wait({self._task})
+
     def stop(self):
         """
         Stops the push-notification loop handler task.
@@ -88,9 +245,24 @@ class PushNotificationHandler:
         """
         self._should_run = False
         self._stop_event.set()
+        self._cancel_pending()
+        for task in list(self._dispatch_tasks):
+            task.cancel()
 
     async def _connect(self):
-        token = await self._client.login()
+        # Reuse the token of the client, shared with its API calls, unless it is about to expire
+        await self._client._ensure_token()
+        try:
+            return await self._open_connection()
+        except InvalidStatus as e:
+            if e.response.status_code not in (401, 403):
+                raise
+            # The panel refused a token still valid on paper (e.g. after a reboot): log in again, once
+            _LOGGER.debug("The websocket refused the token. Issuing a new login.")
+            await self._client._acquire_token()
+            return await self._open_connection()
+
+    async def _open_connection(self):
         index = self._endpoint.find('wss')
         if index == -1:
             return await ws_client.connect(self._endpoint, ssl=None, additional_headers={
@@ -103,64 +275,204 @@ class PushNotificationHandler:
 
     async def _notify_handlers(self, message):
         _LOGGER.debug("Handling message dispatching for handlers")
-        message_dict = json.loads(message)
-        status = PanelStatus.from_api_response(message_dict)
+        if self._skip_unchanged:
+            raw = message.encode("utf-8") if isinstance(message, str) else message
+            digest = hashlib.blake2b(raw, digest_size=16).digest()
+            if digest == self._last_digest:
+                self._skipped_count += 1
+                self._metrics.inc("push_skipped_total", endpoint=self._endpoint)
+                return
+            self._last_digest = digest
+        started = time.perf_counter()
+        message_dict = self._json_codec.loads(message)
+        self._metrics.observe("push_decode_duration_seconds", time.perf_counter() - started, endpoint=self._endpoint)
+        if self._coalesce_window is None or self._is_urgent(message_dict):
+            # Every frame carries the full panel status, so a newer one supersedes any pending frame
+            if self._pending_message is not None:
+                self._coalesced_count += 1
+                self._metrics.inc("push_coalesced_total", endpoint=self._endpoint)
+            self._cancel_pending()
+            await self._deliver(message_dict)
+        else:
+            self._hold(message_dict)
+
+    def _is_urgent(self, message_dict: Dict) -> bool:
+        if self._last_delivered is None:
+            return True
+        return any(message_dict.get(key) != self._last_delivered.get(key) for key in self._urgent_keys)
+
+    def _hold(self, message_dict: Dict):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._pending_message is None:
+            self._pending_since = now
+        else:
+            self._coalesced_count += 1
+            self._metrics.inc("push_coalesced_total", endpoint=self._endpoint)
+        self._pending_message = message_dict
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        # Wait for the burst to settle, but never hold a frame for longer than the max delay
+        delay = min(self._coalesce_window, self._pending_since + self._coalesce_max_delay - now)
+        self._flush_handle = loop.call_later(max(delay, 0), self._flush_pending)
+
+    def _flush_pending(self):
+        self._flush_handle = None
+        message_dict = self._pending_message
+        self._pending_message = None
+        if message_dict is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._deliver(message_dict))
+        self._dispatch_tasks.add(task)
+        task.add_done_callback(self._dispatch_tasks.discard)
+
+    def _cancel_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending_message = None
+
+    async def _deliver(self, message_dict: Dict):
+        self._last_delivered = message_dict
+        started = time.perf_counter()
+        status = PanelStatus.from_api_response(message_dict, lazy=self._lazy, sections=self._sections)
+        self._metrics.observe("push_parse_duration_seconds", time.perf_counter() - started, endpoint=self._endpoint)
         _LOGGER.debug("Parsed panel-status: %s", status)
+        await self._dispatch(status)
+
+    async def _dispatch(self, status: PanelStatus):
         _LOGGER.debug("There are %d registered event handlers.", len(self._event_handlers))
-        for coro in self._event_handlers:
+        if self._dispatch_mode == DispatchMode.CONCURRENT:
+            # Do not hold the receive loop: handlers run in a separate task
+            task = asyncio.get_running_loop().create_task(self._dispatch_concurrently(status))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+            return
+
+        started = time.perf_counter()
+        for coro in list(self._event_handlers):
             try:
                 _LOGGER.debug("Dispatching to event handler %s.", str(coro))
                 await coro(status)
             except Exception as e:
                 _LOGGER.exception("Error occurred when notifying a push-notification handler")
+                await self._report_handler_error(coro, e)
+        self._metrics.observe("push_dispatch_duration_seconds", time.perf_counter() - started,
+                              endpoint=self._endpoint)
+
+    async def _dispatch_concurrently(self, status: PanelStatus):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_handler(handler, status) for handler in list(self._event_handlers)))
+        self._metrics.observe("push_dispatch_duration_seconds", time.perf_counter() - started,
+                              endpoint=self._endpoint)
+
+    async def _run_handler(self, handler: PushHandler, status: PanelStatus):
+        try:
+            _LOGGER.debug("Dispatching to event handler %s.", str(handler))
+            if inspect.iscoroutinefunction(handler) or inspect.iscoroutinefunction(getattr(handler, "__call__", None)):
+                awaitable = handler(status)
+            else:
+                awaitable = asyncio.get_running_loop().run_in_executor(None, handler, status)
+            if self._handler_timeout is None:
+                await awaitable
+            else:
+                await asyncio.wait_for(awaitable, timeout=self._handler_timeout)
+        except asyncio.TimeoutError as e:
+            _LOGGER.warning("Push-notification handler %s did not complete within %.3f seconds",
+                            str(handler), self._handler_timeout)
+            await self._report_handler_error(handler, e)
+        except Exception as e:
+            _LOGGER.exception("Error occurred when notifying a push-notification handler")
+            await self._report_handler_error(handler, e)
+
+    async def _report_handler_error(self, handler: PushHandler, error: BaseException):
+        if self._on_handler_error is None:
+            return
+        try:
+            await helper(self._on_handler_error, handler, error)
+        except Exception:
+            _LOGGER.exception("Error occurred when reporting a push-notification handler failure")
 
     async def _wait_for_messages(self, connection):
-        _TOKEN_RENEW_INTERVAL = 30
         while self._should_run:
-            # Calculate how much time we have before the token expires. If necessary, renew the token right-away
-            seconds_remaining = self._client.token_expiration_time - datetime.now().timestamp()
-            if seconds_remaining <= _TOKEN_RENEW_INTERVAL:
-                _LOGGER.debug("Renewing token as it is close to the expiration deadline")
-                await self._client.renew_token()
-                _LOGGER.debug("Token has been renewed")
+            if self._client.is_token_refresher_running:
+                # The client renews its token in background: there is no need to wake up for that
+                deadline = None
+            else:
+                # Calculate how much time we have before the token expires. If necessary, renew the token right-away
+                seconds_remaining = self._client.token_expiration_time - datetime.now().timestamp()
+                deadline = seconds_remaining - _TOKEN_RENEW_INTERVAL
+                if seconds_remaining <= _TOKEN_RENEW_INTERVAL:
+                    _LOGGER.debug("Renewing token as it is close to the expiration deadline")
+                    try:
+                        await self._client._acquire_token(renew=True)
+                    except ElmaxBadLoginError:
+                        raise
+                    except Exception as e:
+                        # The connection is still up: keep receiving, and try again later
+                        _LOGGER.warning("Could not renew the token: %r", e)
+                    else:
+                        _LOGGER.debug("Token has been renewed")
+                        seconds_remaining = self._client.token_expiration_time - datetime.now().timestamp()
+                        deadline = seconds_remaining - _TOKEN_RENEW_INTERVAL
+                # Renewals are spaced out even after failures, or when tokens are shorter-lived than the interval
+                deadline = max(deadline, TOKEN_REFRESH_RETRY_INTERVAL)
 
             # Wait for a new message to be received, a stop event or a timeout (driven by the token expiration)
             stop_event_waiter = self._loop.create_task(self._stop_event.wait())
-            receive_waiter = self._loop.create_task(connection.recv())
-            deadline = seconds_remaining-_TOKEN_RENEW_INTERVAL
+            receive_waiter = self._loop.create_task(connection.recv(decode=False))
             done, pending = await asyncio.wait([receive_waiter, stop_event_waiter], return_when=FIRST_COMPLETED, timeout=deadline)
             if stop_event_waiter in done:
                 _LOGGER.info("Push notification handler has received stop signal. Aborting wait for messages...")
                 receive_waiter.cancel()
                 return
+            stop_event_waiter.cancel()
             if receive_waiter in done:
                 message = receive_waiter.result()
                 _LOGGER.debug("Push notification message received from websocket: %s", str(message))
+                self._message_count += 1
+                self._metrics.inc("push_messages_total", endpoint=self._endpoint)
+                self._last_message_time = time.time()
                 await self._notify_handlers(message)
             if not receive_waiter.cancelled() and not receive_waiter.cancelling():
                 receive_waiter.cancel()
 
+    async def _cooldown(self, seconds: float):
+        await asyncio.sleep(seconds + (random.uniform(0, self._reconnect_jitter) if self._reconnect_jitter else 0))
+
     async def _looper(self):
         while self._should_run:
             _LOGGER.debug("Push Notification looper has started.")
-            # Verify the token we have is still valid or if it's going to expire soon.
-            # If expired, issue a login. If still valid, but close to expiration, renew it.
-            if datetime.now().timestamp() >= self._client.token_expiration_time:
-                _LOGGER.debug("Token expired. Issuing a new login.")
-                await self._client.login() # In case of login error, we must abort and terminate.
+            connection = None
             try:
+                # The token is renewed when needed. In case of login error, we must abort and terminate.
                 connection = await self._connect()
+                self._connected = True
+                self._connection_count += 1
+                # Always deliver the first frame of a new connection, even if unchanged
+                self._last_digest = None
                 _LOGGER.debug("Push Notification looper has connected successfully to the websocket. Waiting for messages...")
                 await self._wait_for_messages(connection)
             except ElmaxBadLoginError as e:
                 _LOGGER.error("Websocket connection failed: token was expired and we were unable to "
                               "login again.")
+                self._last_error = e
                 raise
             except ConnectionClosedError as e:
                 _LOGGER.debug("Connection closed from the server.")
-                await asyncio.sleep(_WS_DROP_COOLDOWN_SECONDS)
+                self._error_count += 1
+                self._metrics.inc("push_connection_errors_total", endpoint=self._endpoint)
+                self._last_error = e
+                await self._cooldown(_WS_DROP_COOLDOWN_SECONDS)
             except Exception as e:
                 _LOGGER.exception("Error occurred when handling websocket connection. We will re-establish the "
                                   "connection in %d seconds.", _WS_ERROR_COOLDOWN_SECONDS)
-                await asyncio.sleep(_WS_ERROR_COOLDOWN_SECONDS)
+                self._error_count += 1
+                self._metrics.inc("push_connection_errors_total", endpoint=self._endpoint)
+                self._last_error = e
+                await self._cooldown(_WS_ERROR_COOLDOWN_SECONDS)
+            finally:
+                self._connected = False
+                if connection is not None:
+                    await connection.close()
 
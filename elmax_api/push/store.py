@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import ssl
+import time
+from asyncio import AbstractEventLoop
+from enum import Enum
+from typing import Collection, Dict, List, Optional
+
+from elmax_api.constants import STATE_STORE_CHECK_INTERVAL, STATE_STORE_POLL_INTERVAL
+from elmax_api.exceptions import ElmaxApiError, ElmaxError
+from elmax_api.http import GenericElmax
+from elmax_api.model.panel import PanelStatus
+from elmax_api.push.push import DispatchMode
+from elmax_api.push.supervisor import PanelHandlers, PanelPushHandler, PushSupervisor
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StatusSource(Enum):
+    """Source of the latest status of a panel"""
+
+    PUSH = "push"
+    POLL = "poll"
+
+
+class _PanelFeed:
+    __slots__ = ("client", "endpoint", "ssl_context", "task", "status", "source", "updated_at", "push_updates",
+                 "poll_updates", "poll_errors")
+
+    def __init__(self, client: GenericElmax, endpoint: Optional[str], ssl_context: Optional[ssl.SSLContext]):
+        self.client = client
+        self.endpoint = endpoint
+        self.ssl_context = ssl_context
+        self.task: Optional[asyncio.Task] = None
+        self.status: Optional[PanelStatus] = None
+        self.source: Optional[StatusSource] = None
+        self.updated_at: Optional[float] = None
+        self.push_updates = 0
+        self.poll_updates = 0
+        self.poll_errors = 0
+
+
+class PanelStateStore:
+    """
+    Holds the latest status of many panels.
+    The status of a panel is fed by push notifications while the panel supports them (`PanelStatus.push_feature`)
+    and its websocket is connected. During websocket outages, and for panels without push notifications, the
+    store falls back to polling the panel through its API client. Every new push connection triggers a poll as
+    well, since the changes occurred during the outage are not notified.
+    Push connections are run by a `PushSupervisor`, which also restarts the connections stopping for good.
+    Consumers read the statuses from the store, without issuing any request.
+    """
+    _panels: Dict[str, _PanelFeed]
+    _handlers: PanelHandlers
+    _supervisor: PushSupervisor
+    _loop: Optional[AbstractEventLoop]
+
+    def __init__(self, poll_interval: float = STATE_STORE_POLL_INTERVAL,
+                 check_interval: float = STATE_STORE_CHECK_INTERVAL, lazy: bool = False,
+                 sections: Optional[Collection[str]] = None, **handler_kwargs):
+        """
+        Constructor.
+        @param poll_interval: time, in seconds, between two polls of a panel whose status is not pushed
+        @param check_interval: time, in seconds, between two checks of the push connection of a panel
+        @param lazy: when set, endpoint sections of the statuses are decoded on first access
+        @param sections: names of the endpoint sections to decode (e.g. {"areas"}). Others are left empty.
+        @param handler_kwargs: any other argument for the underlying `PushSupervisor` (e.g. restart_delay) and
+            `PushNotificationHandler` objects (e.g. reconnect_jitter or skip_unchanged). Push connections are
+            started as soon as a panel has been polled, and without reconnection jitter, unless stated otherwise.
+        """
+        self._poll_interval = poll_interval
+        self._check_interval = check_interval
+        self._lazy = lazy
+        self._sections = sections
+        self._panels = {}
+        self._handlers = PanelHandlers()
+        handler_kwargs.setdefault("start_spread", 0.0)
+        handler_kwargs.setdefault("reconnect_jitter", 0.0)
+        handler_kwargs.setdefault("dispatch_mode", DispatchMode.SEQUENTIAL)
+        self._supervisor = PushSupervisor(lazy=lazy, sections=sections, **handler_kwargs)
+        self._supervisor.register_push_notification_handler(self._on_push)
+        self._loop = None
+
+    @property
+    def panel_ids(self) -> List[str]:
+        return list(self._panels)
+
+    @property
+    def statuses(self) -> Dict[str, PanelStatus]:
+        """Latest status of every panel whose status is known"""
+        return {panel_id: feed.status for panel_id, feed in self._panels.items() if feed.status is not None}
+
+    def get_status(self, panel_id: str) -> Optional[PanelStatus]:
+        """Returns the latest status of the given panel, or None if it is not known yet"""
+        return self._panels[panel_id].status
+
+    def get_source(self, panel_id: str) -> Optional[StatusSource]:
+        """Returns the source of the latest status of the given panel"""
+        return self._panels[panel_id].source
+
+    def add_panel(self, panel_id: str, http_client: GenericElmax, push_endpoint: Optional[str] = None,
+                  ssl_context: ssl.SSLContext = None) -> None:
+        """
+        Adds a panel to the store. If the store is running, the panel is fed right away.
+        @param panel_id: identifier of the panel in the store
+        @param http_client: API client of the panel, used for polling. Its current panel is polled.
+        @param push_endpoint: panel push-notification websocket endpoint, e.g. wss://ELMAX_PANEL_IP/api/v2/push.
+            When not set, the panel is always polled.
+        @param ssl_context: custom ssl context configuration of the websocket
+        """
+        if panel_id in self._panels:
+            raise ValueError(f"Panel {panel_id} is already in the store")
+        feed = _PanelFeed(http_client, push_endpoint, ssl_context)
+        self._panels[panel_id] = feed
+        if self._loop is not None:
+            feed.task = self._loop.create_task(self._feed(panel_id, feed))
+
+    def remove_panel(self, panel_id: str) -> None:
+        """Stops feeding and removes the given panel from the store"""
+        self._stop_feed(self._panels.pop(panel_id))
+        if self._supervisor.get_handler(panel_id) is not None:
+            self._supervisor.remove_panel(panel_id)
+
+    def register_update_handler(self, coro: PanelPushHandler, panel_ids: Optional[Collection[str]] = None) -> None:
+        """
+        Registers a handler coroutine, invoked with (panel_id, status) whenever the status of a panel changes,
+        whatever its source.
+        @param coro: handler coroutine
+        @param panel_ids: panels the handler is interested in. When not set, the handler receives all the updates.
+        """
+        self._handlers.register(coro, panel_ids)
+
+    def unregister_update_handler(self, coro: PanelPushHandler) -> None:
+        self._handlers.unregister(coro)
+
+    def start(self, loop: AbstractEventLoop) -> None:
+        """Starts feeding all the panels of the store"""
+        self._loop = loop
+        self._supervisor.start(loop)
+        for panel_id, feed in self._panels.items():
+            feed.task = loop.create_task(self._feed(panel_id, feed))
+
+    def stop(self) -> None:
+        """Stops feeding all the panels of the store. The latest statuses are kept."""
+        for feed in self._panels.values():
+            self._stop_feed(feed)
+        self._supervisor.stop()
+        self._loop = None
+
+    def health(self) -> Dict[str, Dict]:
+        """Returns, for every panel, the source and age of its status and the state of its push connection"""
+        now = time.time()
+        push = self._supervisor.health()
+        return {
+            panel_id: {
+                "source": feed.source.value if feed.source is not None else None,
+                "push_connected": panel_id in push and push[panel_id]["connected"],
+                "age": now - feed.updated_at if feed.updated_at is not None else None,
+                "push_updates": feed.push_updates,
+                "poll_updates": feed.poll_updates,
+                "poll_errors": feed.poll_errors,
+            } for panel_id, feed in self._panels.items()
+        }
+
+    @staticmethod
+    def _stop_feed(feed: _PanelFeed) -> None:
+        if feed.task is not None:
+            feed.task.cancel()
+            feed.task = None
+
+    async def _feed(self, panel_id: str, feed: _PanelFeed) -> None:
+        # Push connection whose changes are known to be reflected by the status
+        synced_connection = None
+        while True:
+            handler = self._supervisor.get_handler(panel_id)
+            connection = handler.connection_count if handler is not None and handler.is_connected else None
+            if connection is not None and connection == synced_connection:
+                await asyncio.sleep(self._check_interval)
+                continue
+
+            polled = await self._poll(panel_id, feed)
+            if polled:
+                synced_connection = connection
+            if handler is None and polled and feed.endpoint is not None and feed.status.push_feature:
+                self._start_push(panel_id, feed)
+                await asyncio.sleep(self._check_interval)
+            elif connection is None or synced_connection != connection:
+                await asyncio.sleep(self._poll_interval)
+
+    async def _poll(self, panel_id: str, feed: _PanelFeed) -> bool:
+        push_updates = feed.push_updates
+        try:
+            status = await feed.client.get_current_panel_status(sections=self._sections, lazy=self._lazy)
+        except (ElmaxError, ElmaxApiError) as e:
+            feed.poll_errors += 1
+            _LOGGER.error("Could not poll the status of panel %s: %r", panel_id, e)
+            return False
+        except Exception:
+            # e.g. a malformed status: the feed of the panel keeps running and polls it again later
+            feed.poll_errors += 1
+            _LOGGER.exception("Unexpected error while polling the status of panel %s", panel_id)
+            return False
+        # A status pushed while polling is newer than the polled one
+        if feed.push_updates == push_updates:
+            await self._update(panel_id, feed, status, StatusSource.POLL)
+        return True
+
+    def _start_push(self, panel_id: str, feed: _PanelFeed) -> None:
+        _LOGGER.debug("Supervising the push-notification connection of panel %s", panel_id)
+        self._supervisor.add_panel(panel_id, feed.endpoint, feed.client, ssl_context=feed.ssl_context)
+
+    async def _on_push(self, panel_id: str, status: PanelStatus) -> None:
+        feed = self._panels.get(panel_id)
+        if feed is not None:
+            await self._update(panel_id, feed, status, StatusSource.PUSH)
+
+    async def _update(self, panel_id: str, feed: _PanelFeed, status: PanelStatus, source: StatusSource) -> None:
+        previous = feed.status
+        feed.status = status
+        feed.source = source
+        feed.updated_at = time.time()
+        if source == StatusSource.PUSH:
+            feed.push_updates += 1
+        else:
+            feed.poll_updates += 1
+        if previous is not None and (status is previous or status.fingerprints == previous.fingerprints):
+            return
+        await self._handlers.dispatch(panel_id, status)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import ssl
+from asyncio import AbstractEventLoop
+from typing import Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from elmax_api.constants import PUSH_RESTART_DELAY
+from elmax_api.http import GenericElmax
+from elmax_api.model.panel import PanelStatus
+from elmax_api.push.push import DispatchMode, PushNotificationHandler
+
+_LOGGER = logging.getLogger(__name__)
+
+PanelPushHandler = Callable[[str, PanelStatus], Awaitable[None]]
+
+
+class PanelHandlers:
+    """
+    Handler coroutines of the statuses of many panels, invoked with (panel_id, status).
+    Every handler may be interested in some panels only.
+    """
+    _handlers: List[Tuple[PanelPushHandler, Optional[frozenset]]]
+
+    def __init__(self):
+        self._handlers = []
+
+    def register(self, coro: PanelPushHandler, panel_ids: Optional[Collection[str]] = None) -> None:
+        """
+        Registers a handler coroutine.
+        @param coro: handler coroutine
+        @param panel_ids: panels the handler is interested in. When not set, the handler receives all the statuses.
+        """
+        self._handlers.append((coro, frozenset(panel_ids) if panel_ids is not None else None))
+
+    def unregister(self, coro: PanelPushHandler) -> None:
+        self._handlers = [(h, ids) for h, ids in self._handlers if h != coro]
+
+    async def dispatch(self, panel_id: str, status: PanelStatus) -> None:
+        """Invokes, concurrently, the handlers interested in the given panel. Their failures are logged."""
+        handlers = [h for h, ids in self._handlers if ids is None or panel_id in ids]
+        results = await asyncio.gather(*(h(panel_id, status) for h in handlers), return_exceptions=True)
+        for handler, result in zip(handlers, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("Handler %s failed for panel %s: %r", handler, panel_id, result)
+
+
+class PushSupervisor:
+    """
+    Manages the push-notification websockets of many panels under a single supervisor.
+    Handlers are registered once on the supervisor and receive the id of the panel along with its status.
+    Connections are started, and re-established after failures, at randomized times so that a network outage
+    affecting many panels does not turn into a synchronized reconnection storm. Connections stopping for good
+    (e.g. after a refused login) are restarted as well, after a jittered delay.
+    """
+    _panels: Dict[str, PushNotificationHandler]
+    _tasks: Dict[str, asyncio.Task]
+    _handlers: PanelHandlers
+    _loop: Optional[AbstractEventLoop]
+
+    def __init__(self, start_spread: float = 5.0, reconnect_jitter: float = 10.0,
+                 restart_delay: float = PUSH_RESTART_DELAY, dispatch_mode: DispatchMode = DispatchMode.CONCURRENT,
+                 **handler_kwargs):
+        """
+        Constructor.
+        @param start_spread: connections are opened at random times within this many seconds from start()
+        @param reconnect_jitter: maximum random delay, in seconds, added before every reconnection attempt and
+            every restart of a stopped connection
+        @param restart_delay: time, in seconds, before a connection that stopped for good is restarted
+        @param dispatch_mode: dispatch mode of the underlying per-panel handlers
+        @param handler_kwargs: any other argument for the underlying `PushNotificationHandler` objects,
+            e.g. handler_timeout or coalesce_window
+        """
+        self._start_spread = start_spread
+        self._reconnect_jitter = reconnect_jitter
+        self._restart_delay = restart_delay
+        self._dispatch_mode = dispatch_mode
+        self._handler_kwargs = handler_kwargs
+        self._panels = {}
+        self._tasks = {}
+        self._handlers = PanelHandlers()
+        self._loop = None
+
+    @property
+    def panel_ids(self) -> List[str]:
+        return list(self._panels)
+
+    def add_panel(self, panel_id: str, endpoint: str, http_client: GenericElmax,
+                  ssl_context: ssl.SSLContext = None) -> None:
+        """
+        Adds a panel to the supervisor. If the supervisor is running, the panel connection is started right away.
+        @param panel_id: identifier used to tag the notifications of this panel
+        @param endpoint: panel push-notification websocket endpoint, e.g. wss://ELMAX_PANEL_IP/api/v2/push
+        @param http_client: API client of the panel
+        @param ssl_context: custom ssl context configuration
+        """
+        if panel_id in self._panels:
+            raise ValueError(f"Panel {panel_id} is already supervised")
+        handler = PushNotificationHandler(endpoint, http_client, ssl_context=ssl_context,
+                                          dispatch_mode=self._dispatch_mode, reconnect_jitter=self._reconnect_jitter,
+                                          **self._handler_kwargs)
+        handler.register_push_notification_handler(self._make_dispatcher(panel_id))
+        self._panels[panel_id] = handler
+        if self._loop is not None:
+            self._supervise(panel_id, delay=random.uniform(0, self._start_spread))
+
+    def get_handler(self, panel_id: str) -> Optional[PushNotificationHandler]:
+        """Returns the push-notification handler of the given panel, or None if the panel is not supervised"""
+        return self._panels.get(panel_id)
+
+    def remove_panel(self, panel_id: str) -> None:
+        """Stops and removes the given panel from the supervisor"""
+        handler = self._panels.pop(panel_id)
+        task = self._tasks.pop(panel_id, None)
+        if task is not None:
+            task.cancel()
+        handler.stop()
+
+    def register_push_notification_handler(self, coro: PanelPushHandler,
+                                           panel_ids: Optional[Collection[str]] = None) -> None:
+        """
+        Registers a handler coroutine, invoked with (panel_id, status) for every notification.
+        @param coro: handler coroutine
+        @param panel_ids: panels the handler is interested in. When not set, the handler receives all notifications.
+        """
+        self._handlers.register(coro, panel_ids)
+
+    def unregister_push_notification_handler(self, coro: PanelPushHandler) -> None:
+        self._handlers.unregister(coro)
+
+    def start(self, loop: AbstractEventLoop) -> None:
+        """Starts the connections of all the supervised panels, spread over `start_spread` seconds"""
+        self._loop = loop
+        for panel_id in self._panels:
+            self._supervise(panel_id, delay=random.uniform(0, self._start_spread))
+
+    def stop(self) -> None:
+        """Stops the connections of all the supervised panels"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        for handler in self._panels.values():
+            handler.stop()
+        self._loop = None
+
+    def health(self) -> Dict[str, Dict]:
+        """Returns, for every panel, the state of its push-notification connection"""
+        return {
+            panel_id: {
+                "running": handler.is_running,
+                "connected": handler.is_connected,
+                "messages": handler.message_count,
+                "connections": handler.connection_count,
+                "errors": handler.error_count,
+                "last_message_time": handler.last_message_time,
+                "last_error": repr(handler.last_error) if handler.last_error is not None else None,
+            } for panel_id, handler in self._panels.items()
+        }
+
+    def metrics(self) -> Dict[str, int]:
+        """Returns metrics aggregated over all the supervised panels"""
+        handlers = list(self._panels.values())
+        return {
+            "panels": len(handlers),
+            "connected": sum(1 for h in handlers if h.is_connected),
+            "messages": sum(h.message_count for h in handlers),
+            "connections": sum(h.connection_count for h in handlers),
+            "errors": sum(h.error_count for h in handlers),
+            "coalesced": sum(h.coalesced_count for h in handlers),
+            "skipped": sum(h.skipped_count for h in handlers),
+        }
+
+    def _supervise(self, panel_id: str, delay: float) -> None:
+        self._tasks[panel_id] = self._loop.create_task(self._run(panel_id, self._panels[panel_id], delay))
+
+    async def _run(self, panel_id: str, handler: PushNotificationHandler, delay: float) -> None:
+        # Runs until the panel is removed or the supervisor stopped, which cancel this task
+        while True:
+            await asyncio.sleep(delay)
+            if not handler.is_running:
+                _LOGGER.debug("Starting push-notification connection of panel %s", panel_id)
+                handler.start(asyncio.get_running_loop())
+            await handler.wait_stopped()
+            delay = self._restart_delay + (random.uniform(0, self._reconnect_jitter) if self._reconnect_jitter else 0)
+            _LOGGER.warning("Push-notification connection of panel %s stopped: %r. Restarting it in %.1f seconds.",
+                            panel_id, handler.last_error, delay)
+
+    def _make_dispatcher(self, panel_id: str) -> Callable[[PanelStatus], Awaitable[None]]:
+        async def _dispatch(status: PanelStatus):
+            await self._handlers.dispatch(panel_id, status)
+        return _dispatch
@@ -0,0 +1,91 @@
+"""
+This module implements the retry policy applied by the API clients to transient failures: network errors and
+server-side errors (5xx).
+"""
+
+import random
+from typing import Collection, Optional
+
+from elmax_api.constants import DEFAULT_REQUEST_DEADLINE, RETRY_ATTEMPTS, RETRY_BACKOFF_INITIAL, RETRY_BACKOFF_MAX
+from elmax_api.exceptions import ElmaxApiError, ElmaxCircuitOpenError, ElmaxConnectionError, ElmaxNetworkError
+
+
+class RetryPolicy:
+    """
+    Retry policy for transient failures.
+    Failed attempts are retried after an exponential backoff with full jitter, as long as the overall deadline
+    of the request allows it. Busy panels (HTTP 422) are handled separately, by the command scheduler, but
+    their retries are bound to the same deadline.
+    """
+
+    def __init__(self,
+                 attempts: int = RETRY_ATTEMPTS,
+                 backoff_initial: float = RETRY_BACKOFF_INITIAL,
+                 backoff_max: float = RETRY_BACKOFF_MAX,
+                 deadline: Optional[float] = DEFAULT_REQUEST_DEADLINE,
+                 retry_status_codes: Collection[int] = (500, 502, 503, 504),
+                 retry_non_idempotent: bool = False):
+        """
+        Constructor.
+
+        Args:
+            attempts: maximum number of attempts of a request failing with transient errors (1 disables retries)
+            backoff_initial: upper bound, in seconds, of the delay before the first retry. It doubles at every retry
+            backoff_max: upper bound, in seconds, of the delay between two attempts
+            deadline: overall time budget, in seconds, of a request, across all its attempts and waits. Every
+                attempt is given the remaining budget as timeout at most. None disables the deadline.
+            retry_status_codes: HTTP status codes considered transient
+            retry_non_idempotent: when set, non-idempotent requests (i.e. commands) are retried after any
+                transient failure. Otherwise they are retried only when they could not be sent at all.
+        """
+        if attempts < 1:
+            raise ValueError("attempts must be a positive number")
+        self._attempts = attempts
+        self._backoff_initial = backoff_initial
+        self._backoff_max = backoff_max
+        self._deadline = deadline
+        self._retry_status_codes = frozenset(retry_status_codes)
+        self._retry_non_idempotent = retry_non_idempotent
+
+    @property
+    def attempts(self) -> int:
+        return self._attempts
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self._deadline
+
+    @property
+    def retry_non_idempotent(self) -> bool:
+        return self._retry_non_idempotent
+
+    def is_transient(self, error: Exception) -> bool:
+        """Whether the given error is worth a retry"""
+        if isinstance(error, ElmaxCircuitOpenError):
+            # The server is known to be failing: fail fast
+            return False
+        if isinstance(error, ElmaxNetworkError):
+            return True
+        return isinstance(error, ElmaxApiError) and error.status_code in self._retry_status_codes
+
+    def should_retry(self, error: Exception, attempt: int, idempotent: bool) -> bool:
+        """
+        Whether a request should be retried.
+
+        Args:
+            error: error raised by the last attempt
+            attempt: number of attempts performed so far
+            idempotent: whether the request can be safely repeated
+        """
+        if attempt >= self._attempts or not self.is_transient(error):
+            return False
+        # A request which could not be sent can always be repeated
+        return idempotent or self._retry_non_idempotent or isinstance(error, ElmaxConnectionError)
+
+    def backoff(self, attempt: int) -> float:
+        """Returns the delay, in seconds, before the retry following the given failed attempt"""
+        return random.uniform(0, min(self._backoff_max, self._backoff_initial * 2 ** (attempt - 1)))
+
+    def __repr__(self):
+        return f"RetryPolicy(attempts={self._attempts}, deadline={self._deadline}, " \
+               f"retry_non_idempotent={self._retry_non_idempotent})"
@@ -0,0 +1,217 @@
+"""
+This module implements the per-panel command scheduler used by the API clients. It limits the number of
+commands in flight against every panel, lets security-critical commands jump the queue, and tracks the busy
+windows of every panel (HTTP 422) to back off adaptively.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple, Union
+
+from elmax_api.constants import BUSY_BACKOFF_MIN, BUSY_BACKOFF_MAX, BUSY_WAIT_INTERVAL, \
+    DEFAULT_PANEL_MAX_IN_FLIGHT
+from elmax_api.model.command import AreaCommand, Command
+
+# Command priorities: lower values are served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+def command_priority(command: Union[Command, str]) -> int:
+    """Returns the scheduling priority of a command: arming and disarming areas come first"""
+    return PRIORITY_HIGH if isinstance(command, AreaCommand) else PRIORITY_NORMAL
+
+
+class BusyTracker:
+    """
+    Tracks the busy windows of a panel.
+    The duration of the busy windows is learnt as they end, so that requests hitting a busy panel wait for the
+    expected end of the window, rather than for a fixed interval.
+    """
+    __slots__ = ("_window_estimate", "_min_delay", "_busy_since", "_last_busy", "_busy_count")
+
+    # Weight of the last observed window in the estimate
+    _SMOOTHING = 0.5
+
+    def __init__(self, initial_window: float = BUSY_WAIT_INTERVAL):
+        """
+        Constructor.
+
+        Args:
+            initial_window: expected duration, in seconds, of a busy window before any has been observed
+        """
+        self._window_estimate = initial_window
+        self._min_delay = min(BUSY_BACKOFF_MIN, initial_window)
+        self._busy_since: Optional[float] = None
+        self._last_busy = 0.0
+        self._busy_count = 0
+
+    @property
+    def window_estimate(self) -> float:
+        """Expected duration, in seconds, of a busy window"""
+        return self._window_estimate
+
+    @property
+    def busy_count(self) -> int:
+        """Number of busy responses received from the panel"""
+        return self._busy_count
+
+    @property
+    def is_busy(self) -> bool:
+        return self._busy_since is not None
+
+    def expected_wait(self) -> float:
+        """Time, in seconds, until the expected end of the current busy window. Zero when the panel is not busy."""
+        if self._busy_since is None:
+            return 0.0
+        return max(0.0, self._window_estimate - (time.monotonic() - self._busy_since))
+
+    def on_busy(self, attempt: int) -> float:
+        """
+        Records a busy response and returns the time to wait before retrying.
+
+        Args:
+            attempt: number of busy responses received so far by the request being retried, starting from 1
+        """
+        self._busy_count += 1
+        self._last_busy = time.monotonic()
+        if self._busy_since is None:
+            self._busy_since = self._last_busy
+        delay = self.expected_wait()
+        if delay < self._min_delay:
+            # The window lasts longer than expected: back off exponentially
+            delay = self._min_delay * 2 ** (attempt - 1)
+        delay = min(delay, BUSY_BACKOFF_MAX)
+        # Spread the retries of concurrent requests
+        return delay + random.uniform(0, delay / 10)
+
+    def on_success(self) -> None:
+        """Records a successful response, closing the current busy window if any"""
+        if self._busy_since is None:
+            return
+        # The window ended between the last busy response and now
+        observed = (self._last_busy + time.monotonic()) / 2 - self._busy_since
+        self._busy_since = None
+        estimate = (1 - self._SMOOTHING) * self._window_estimate + self._SMOOTHING * observed
+        self._window_estimate = min(BUSY_BACKOFF_MAX, max(self._min_delay, estimate))
+
+
+class _PanelQueue:
+    __slots__ = ("waiters", "in_flight", "commands", "wait_total", "wait_max", "tracker")
+
+    def __init__(self, tracker: BusyTracker):
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.in_flight = 0
+        self.commands = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.tracker = tracker
+
+
+class CommandScheduler:
+    """
+    Per-panel command scheduler.
+    At most `max_in_flight` commands run against the same panel at any time; the others wait in a priority
+    queue, where area commands come before switch, cover and scene commands. A scheduler can be shared by all
+    the clients targeting the same panels.
+    """
+    _queues: Dict[str, _PanelQueue]
+
+    def __init__(self, max_in_flight: int = DEFAULT_PANEL_MAX_IN_FLIGHT):
+        """
+        Constructor.
+
+        Args:
+            max_in_flight: maximum number of commands running at the same time against a panel. The default of 1
+                serializes the commands of every panel, which reports busy (HTTP 422) when handling overlapping
+                writes.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be a positive number")
+        self._max_in_flight = max_in_flight
+        self._queues = {}
+        self._sequence = itertools.count()
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight
+
+    def busy_tracker(self, panel_key: str, initial_window: float = BUSY_WAIT_INTERVAL) -> BusyTracker:
+        """Returns the busy tracker of the given panel, creating it with the given initial window if needed"""
+        return self._queue(panel_key, initial_window).tracker
+
+    def queue_depth(self, panel_key: str) -> int:
+        """Number of commands waiting to be run against the given panel"""
+        queue = self._queues.get(panel_key)
+        return 0 if queue is None else len(queue.waiters)
+
+    @asynccontextmanager
+    async def slot(self, panel_key: str, priority: int = PRIORITY_NORMAL):
+        """
+        Waits for the turn of a command against the given panel. The command runs within the context.
+
+        Args:
+            panel_key: panel targeted by the command
+            priority: command priority (see `command_priority`)
+        """
+        queue = self._queue(panel_key)
+        start = time.monotonic()
+        if queue.in_flight < self._max_in_flight and not queue.waiters:
+            queue.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = (priority, next(self._sequence), future)
+            heapq.heappush(queue.waiters, entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was granted right before the cancellation: hand it over
+                    self._release(queue)
+                else:
+                    queue.waiters.remove(entry)
+                    heapq.heapify(queue.waiters)
+                raise
+        waited = time.monotonic() - start
+        queue.commands += 1
+        queue.wait_total += waited
+        queue.wait_max = max(queue.wait_max, waited)
+        try:
+            yield queue.tracker
+        finally:
+            self._release(queue)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Returns, for every panel, the queue depth, the wait times and the busy-window statistics"""
+        return {
+            panel_key: {
+                "queue_depth": self.queue_depth(panel_key),
+                "in_flight": queue.in_flight,
+                "commands": queue.commands,
+                "wait_time_total": queue.wait_total,
+                "wait_time_max": queue.wait_max,
+                "wait_time_avg": queue.wait_total / queue.commands if queue.commands else 0.0,
+                "busy_responses": queue.tracker.busy_count,
+                "busy_window_estimate": queue.tracker.window_estimate,
+            } for panel_key, queue in self._queues.items()
+        }
+
+    def _queue(self, panel_key: str, initial_window: float = BUSY_WAIT_INTERVAL) -> _PanelQueue:
+        queue = self._queues.get(panel_key)
+        if queue is None:
+            queue = _PanelQueue(BusyTracker(initial_window))
+            self._queues[panel_key] = queue
+        return queue
+
+    def _release(self, queue: _PanelQueue) -> None:
+        queue.in_flight -= 1
+        while queue.waiters:
+            _, _, future = heapq.heappop(queue.waiters)
+            if not future.done():
+                queue.in_flight += 1
+                future.set_result(None)
+                break
@@ -0,0 +1,55 @@
+"""
+Runs the Elmax simulator from the command line, e.g.:
+
+    python -m elmax_api.simulator --panels 3 --zones 500 --latency 0.05 --push-rate 5
+"""
+import argparse
+import asyncio
+import logging
+
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Offline Elmax cloud/local/push API simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--push-port", type=int, default=8081)
+    parser.add_argument("--panels", type=int, default=1)
+    parser.add_argument("--zones", type=int, default=8)
+    parser.add_argument("--actuators", type=int, default=4)
+    parser.add_argument("--areas", type=int, default=2)
+    parser.add_argument("--covers", type=int, default=2)
+    parser.add_argument("--groups", type=int, default=1)
+    parser.add_argument("--scenes", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed response latency, in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency, in seconds")
+    parser.add_argument("--token-ttl", type=float, default=3600.0, help="JWT lifetime, in seconds")
+    parser.add_argument("--busy-period", type=float, default=None, help="Period of the 422 busy windows, in seconds")
+    parser.add_argument("--busy-duration", type=float, default=0.0, help="Duration of each busy window, in seconds")
+    parser.add_argument("--push-rate", type=float, default=0.0, help="Spontaneous push events per second")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+async def main():
+    args = _parse_args()
+    simulator = ElmaxSimulator(panel_count=args.panels, zones=args.zones, actuators=args.actuators, areas=args.areas,
+                               covers=args.covers, groups=args.groups, scenes=args.scenes, latency=args.latency,
+                               latency_jitter=args.latency_jitter, token_ttl=args.token_ttl,
+                               busy_period=args.busy_period, busy_duration=args.busy_duration,
+                               push_rate=args.push_rate, host=args.host, port=args.port, push_port=args.push_port,
+                               seed=args.seed)
+    async with simulator:
+        print(f"Cloud API: {simulator.cloud_url} (username={simulator.username}, password={simulator.password})")
+        print(f"Local API: {simulator.local_url} (pin={simulator.pin})")
+        print(f"Push:      {simulator.push_url}")
+        await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,179 @@
+"""
+Synthetic panel payloads, shaped like the ones returned by the Elmax cloud and local APIs.
+"""
+import copy
+import random
+from typing import Dict, List, Optional, Tuple
+
+from elmax_api.model.alarm_status import AlarmArmStatus, AlarmStatus
+from elmax_api.model.cover_status import CoverStatus
+
+# Section keys, as used by the Elmax APIs, and the endpoint-id tag used for each of them
+SECTIONS = {
+    "zone": "zona",
+    "uscite": "uscita",
+    "aree": "area",
+    "tapparelle": "tapparella",
+    "gruppi": "gruppo",
+    "scenari": "scenario",
+}
+
+# Endpoint counts of some typical installations, from a small flat up to a large multi-building site
+PANEL_PROFILES = {
+    "tiny": dict(zones=4, actuators=2, areas=1, covers=0, groups=0, scenes=0),
+    "small": dict(zones=16, actuators=8, areas=2, covers=4, groups=2, scenes=4),
+    "medium": dict(zones=64, actuators=32, areas=4, covers=16, groups=8, scenes=16),
+    "large": dict(zones=256, actuators=128, areas=8, covers=64, groups=16, scenes=32),
+    "huge": dict(zones=1024, actuators=512, areas=16, covers=256, groups=32, scenes=64),
+}
+
+_ROOM_NAMES = [
+    "Ingresso", "Cucina", "Soggiorno", "Camera", "Bagno", "Studio", "Garage", "Taverna", "Corridoio", "Terrazzo",
+]
+
+
+def _endpoint_name(rnd: random.Random, prefix: str, index: int) -> str:
+    return f"{prefix} {rnd.choice(_ROOM_NAMES)} {index + 1}"
+
+
+def _base_entry(panel_id: str, section: str, index: int, name: str) -> Dict:
+    return {
+        "endpointId": f"{panel_id}-{SECTIONS[section]}-{index}",
+        "visibile": True,
+        "indice": index,
+        "nome": name,
+    }
+
+
+def build_panel_payload(panel_id: str = "0123456789abcdef",
+                        zones: int = 8,
+                        actuators: int = 4,
+                        areas: int = 2,
+                        covers: int = 2,
+                        groups: int = 1,
+                        scenes: int = 1,
+                        user_email: str = "user@example.com",
+                        push_feature: bool = True,
+                        seed: Optional[int] = None) -> Dict:
+    """
+    Builds a discovery payload for a synthetic panel with the given number of endpoints.
+
+    Args:
+        panel_id: identifier (hash) of the panel
+        zones: number of zones to generate
+        actuators: number of actuators (outputs) to generate
+        areas: number of areas to generate
+        covers: number of covers to generate
+        groups: number of groups to generate
+        scenes: number of scenes to generate
+        user_email: email of the user owning the panel
+        push_feature: value to advertise for the push feature
+        seed: seed for the random generator, so that the same arguments always yield the same payload
+
+    Returns: A dictionary shaped as the json returned by the `discovery` API
+    """
+    rnd = random.Random(seed)
+    all_statuses = [s.value for s in AlarmStatus]
+    all_arm_statuses = [s.value for s in AlarmArmStatus]
+
+    zone_entries = []
+    for i in range(zones):
+        entry = _base_entry(panel_id, "zone", i, _endpoint_name(rnd, "Zona", i))
+        entry["aperta"] = rnd.random() < 0.1
+        entry["esclusa"] = rnd.random() < 0.05
+        zone_entries.append(entry)
+
+    actuator_entries = []
+    for i in range(actuators):
+        entry = _base_entry(panel_id, "uscite", i, _endpoint_name(rnd, "Uscita", i))
+        entry["aperta"] = rnd.random() < 0.3
+        actuator_entries.append(entry)
+
+    area_entries = []
+    for i in range(areas):
+        entry = _base_entry(panel_id, "aree", i, _endpoint_name(rnd, "Area", i))
+        entry["statoSessione"] = AlarmStatus.NOT_ARMED_NOT_TRIGGERED.value
+        entry["stato"] = AlarmArmStatus.NOT_ARMED.value
+        entry["statiSessioneDisponibili"] = list(all_statuses)
+        entry["statiDisponibili"] = list(all_arm_statuses)
+        area_entries.append(entry)
+
+    cover_entries = []
+    for i in range(covers):
+        entry = _base_entry(panel_id, "tapparelle", i, _endpoint_name(rnd, "Tapparella", i))
+        entry["posizione"] = rnd.choice([0, 50, 100])
+        entry["stato"] = CoverStatus.IDLE.value
+        cover_entries.append(entry)
+
+    group_entries = [_base_entry(panel_id, "gruppi", i, f"Gruppo {i + 1}") for i in range(groups)]
+    scene_entries = [_base_entry(panel_id, "scenari", i, f"Scenario {i + 1}") for i in range(scenes)]
+
+    return {
+        "centrale": panel_id,
+        "utente": user_email,
+        "release": "4.13.2",
+        "tappFeature": covers > 0,
+        "sceneFeature": scenes > 0,
+        "pushFeature": push_feature,
+        "tipo_accessorio": "Ethernet",
+        "release_accessorio": "2.0.6",
+        "zone": zone_entries,
+        "uscite": actuator_entries,
+        "aree": area_entries,
+        "tapparelle": cover_entries,
+        "gruppi": group_entries,
+        "scenari": scene_entries,
+    }
+
+
+def build_profile_payload(profile: str, panel_id: str = "0123456789abcdef", seed: Optional[int] = 0,
+                          **kwargs) -> Dict:
+    """
+    Builds a discovery payload for a synthetic panel sized after one of the `PANEL_PROFILES`.
+
+    Args:
+        profile: name of the profile (e.g. `tiny`, `huge`)
+        panel_id: identifier (hash) of the panel
+        seed: seed for the random generator. Defaults to a fixed seed, so that payloads are reproducible
+        **kwargs: any other argument accepted by `build_panel_payload`, overriding the profile
+
+    Returns: A dictionary shaped as the json returned by the `discovery` API
+    """
+    if profile not in PANEL_PROFILES:
+        raise ValueError(f"Unknown panel profile {profile}. Expecting one of {', '.join(PANEL_PROFILES)}")
+    arguments = dict(PANEL_PROFILES[profile])
+    arguments.update(kwargs)
+    return build_panel_payload(panel_id=panel_id, seed=seed, **arguments)
+
+
+def build_endpoint_payload(panel_payload: Dict, section: str, entry: Dict) -> Dict:
+    """
+    Builds the payload returned by the `status/{endpoint}` API for a single endpoint of a panel.
+
+    Args:
+        panel_payload: discovery payload of the panel owning the endpoint
+        section: section key (e.g. `zone`) the endpoint belongs to
+        entry: the endpoint entry, as found in the panel payload
+
+    Returns: A dictionary shaped as the json returned by the `status/{endpoint}` API
+    """
+    res = {
+        "release": panel_payload.get("release"),
+        "tappFeature": panel_payload.get("tappFeature"),
+        "sceneFeature": panel_payload.get("sceneFeature"),
+        "pushFeature": panel_payload.get("pushFeature"),
+        "tipo_accessorio": panel_payload.get("tipo_accessorio"),
+        "release_accessorio": panel_payload.get("release_accessorio"),
+    }
+    for key in SECTIONS:
+        res[key] = [copy.deepcopy(entry)] if key == section else []
+    return res
+
+
+def iter_endpoints(panel_payload: Dict) -> List[Tuple[str, Dict]]:
+    """Returns a list of (section, entry) tuples for every endpoint of the given panel payload"""
+    res = []
+    for key in SECTIONS:
+        for entry in panel_payload.get(key, []):
+            res.append((key, entry))
+    return res
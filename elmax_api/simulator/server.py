@@ -0,0 +1,538 @@
+"""
+This module implements `ElmaxSimulator`, an offline stand-in for the Elmax cloud API, the local panel API and
+the local push-notification websocket. It is meant for load and latency testing of the client on a laptop,
+without any real account or panel.
+
+The simulator listens on localhost. The cloud API is served under `/api/ext/`, the local panel API under
+`/api/v2/` and the push websocket at `/api/v2/push` (on a separate port).
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+import jwt
+from websockets.asyncio.server import Server, ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+from elmax_api.constants import DEFAULT_PANEL_PIN, ENDPOINT_DEVICES, ENDPOINT_DISCOVERY, ENDPOINT_LOCAL_CMD, \
+    ENDPOINT_LOGIN, ENDPOINT_REFRESH, ENDPOINT_STATUS_ENTITY_ID
+from elmax_api.model.alarm_status import AlarmArmStatus, AlarmStatus
+from elmax_api.model.command import AreaCommand, CoverCommand, SwitchCommand
+from elmax_api.model.cover_status import CoverStatus
+from elmax_api.simulator.payload import build_endpoint_payload, build_panel_payload, iter_endpoints
+
+_LOGGER = logging.getLogger(__name__)
+
+_CLOUD_PREFIX = "/api/ext/"
+_LOCAL_PREFIX = "/api/v2/"
+_PUSH_PATH = "/api/v2/push"
+_JWT_SECRET = "elmax-simulator-offline-jwt-signing-key"
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                 405: "Method Not Allowed", 422: "Unprocessable Entity", 500: "Internal Server Error",
+                 502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout"}
+# Size, in bytes, of the body chunks of the responses slowed down by `drip_next`
+_DRIP_CHUNK_SIZE = 64
+
+
+class ElmaxSimulator:
+    """
+    Local simulator of the Elmax cloud API, the local panel API and the push websocket.
+
+    Usage:
+        async with ElmaxSimulator(panel_count=2, zones=200, latency=0.05) as sim:
+            client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+            ...
+    """
+
+    def __init__(self,
+                 panel_count: int = 1,
+                 zones: int = 8,
+                 actuators: int = 4,
+                 areas: int = 2,
+                 covers: int = 2,
+                 groups: int = 1,
+                 scenes: int = 1,
+                 username: str = "user@example.com",
+                 password: str = "password",
+                 pin: str = DEFAULT_PANEL_PIN,
+                 latency: float = 0.0,
+                 latency_jitter: float = 0.0,
+                 token_ttl: float = 3600.0,
+                 busy_period: Optional[float] = None,
+                 busy_duration: float = 0.0,
+                 push_rate: float = 0.0,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 push_port: int = 0,
+                 seed: Optional[int] = None):
+        """Simulator constructor.
+
+        Args:
+            panel_count: number of panels registered to the simulated cloud account
+            zones: number of zones of each simulated panel
+            actuators: number of actuators of each simulated panel
+            areas: number of areas of each simulated panel
+            covers: number of covers of each simulated panel
+            groups: number of groups of each simulated panel
+            scenes: number of scenes of each simulated panel
+            username: username accepted by the cloud login API
+            password: password accepted by the cloud login API
+            pin: panel PIN, accepted by the local login API and by the cloud discovery API
+            latency: fixed delay, in seconds, added to every HTTP response
+            latency_jitter: maximum random delay, in seconds, added on top of `latency`
+            token_ttl: lifetime, in seconds, of the issued JWT tokens
+            busy_period: when set, panels report busy (HTTP 422) for `busy_duration` seconds every `busy_period` seconds
+            busy_duration: duration, in seconds, of every periodic busy window
+            push_rate: number of spontaneous push events per second sent over the websocket (0 disables them)
+            host: interface to listen on
+            port: HTTP port to listen on (0 picks a free port)
+            push_port: websocket port to listen on (0 picks a free port)
+            seed: seed for the random generators, to make runs reproducible
+        """
+        self._rnd = random.Random(seed)
+        self._username = username
+        self._password = password
+        self._pin = pin
+        self._latency = latency
+        self._latency_jitter = latency_jitter
+        self._token_ttl = token_ttl
+        self._busy_period = busy_period
+        self._busy_duration = busy_duration
+        self._busy_until = 0.0
+        self._failures: Deque[Optional[int]] = deque()
+        self._drips: Deque[float] = deque()
+        self._corruptions = 0
+        self._in_flight = 0
+        self._offline: Set[str] = set()
+        self._push_available = True
+        self._push_rate = push_rate
+        self._host = host
+        self._port = port
+        self._push_port = push_port
+
+        self._panels: Dict[str, Dict] = {}
+        self._endpoints: Dict[str, Tuple[str, str, Dict]] = {}
+        for i in range(panel_count):
+            panel_id = f"{i:08x}{self._rnd.getrandbits(32):08x}"
+            self.add_panel(build_panel_payload(panel_id=panel_id, zones=zones, actuators=actuators, areas=areas,
+                                               covers=covers, groups=groups, scenes=scenes, user_email=username,
+                                               seed=self._rnd.getrandbits(32)))
+
+        self._stats: Dict[str, int] = {}
+        self._http_server: Optional[asyncio.AbstractServer] = None
+        self._ws_server: Optional[Server] = None
+        self._ws_clients: Set[ServerConnection] = set()
+        self._push_task: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def add_panel(self, payload: Dict) -> None:
+        """Registers a panel, given its discovery payload, to the simulated cloud account"""
+        panel_id = payload["centrale"]
+        self._panels[panel_id] = payload
+        for section, entry in iter_endpoints(payload):
+            self._endpoints[entry["endpointId"]] = (panel_id, section, entry)
+
+    @property
+    def panels(self) -> Dict[str, Dict]:
+        """Discovery payloads of the simulated panels, by panel id"""
+        return self._panels
+
+    @property
+    def local_panel_id(self) -> str:
+        """Id of the panel exposed through the local API and the push websocket"""
+        return next(iter(self._panels))
+
+    @property
+    def username(self) -> str:
+        return self._username
+
+    @property
+    def password(self) -> str:
+        return self._password
+
+    @property
+    def pin(self) -> str:
+        return self._pin
+
+    @property
+    def cloud_url(self) -> str:
+        """Base URL of the simulated cloud API, to be used as `Elmax` base URL"""
+        return f"http://{self._host}:{self._port}{_CLOUD_PREFIX}"
+
+    @property
+    def local_url(self) -> str:
+        """Base URL of the simulated local API, to be used as `ElmaxLocal` panel API URL"""
+        return f"http://{self._host}:{self._port}{_LOCAL_PREFIX}"
+
+    @property
+    def push_url(self) -> str:
+        """URL of the simulated push-notification websocket"""
+        return f"ws://{self._host}:{self._push_port}{_PUSH_PATH}"
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Number of served requests, by route name (e.g. `login`, `discovery`, `busy`, `push`), of accepted
+        HTTP connections (`connection`) and of injected failures (`failure`), and highest number of requests served
+        at the same time (`peak_in_flight`)"""
+        return self._stats
+
+    def set_busy(self, seconds: float) -> None:
+        """Makes the panels report busy (HTTP 422) for the given number of seconds, starting now"""
+        self._busy_until = time.monotonic() + seconds
+
+    def set_panel_online(self, panel_id: str, online: bool) -> None:
+        """Marks a panel online or offline. The cloud API reports offline panels as such, and answers the
+        status requests of offline panels with a gateway timeout (HTTP 504)"""
+        if online:
+            self._offline.discard(panel_id)
+        else:
+            self._offline.add(panel_id)
+
+    async def set_push_available(self, available: bool) -> None:
+        """Makes the push websocket available or unavailable. When unavailable, the open connections are dropped
+        and new connections are refused (HTTP 503)"""
+        self._push_available = available
+        if not available:
+            clients = list(self._ws_clients)
+            await asyncio.gather(*(client.close() for client in clients))
+
+    def fail_next(self, count: int = 1, status: Optional[int] = 503) -> None:
+        """
+        Makes the next HTTP requests fail, whatever their route.
+
+        Args:
+            count: number of requests to fail
+            status: HTTP status code of the failed responses. None drops the connection without responding.
+        """
+        self._failures.extend([status] * count)
+
+    def drip_next(self, count: int = 1, interval: float = 0.1) -> None:
+        """
+        Makes the next HTTP responses trickle in: their body is sent in small chunks, one every `interval`
+        seconds, so that no single read of the client times out.
+
+        Args:
+            count: number of responses to slow down
+            interval: delay, in seconds, between two chunks
+        """
+        self._drips.extend([interval] * count)
+
+    def corrupt_next(self, count: int = 1) -> None:
+        """
+        Makes the next successful HTTP responses carry a malformed payload: valid json, but not shaped like any
+        response of the API.
+
+        Args:
+            count: number of responses to corrupt
+        """
+        self._corruptions += count
+
+    @property
+    def is_busy(self) -> bool:
+        now = time.monotonic()
+        if now < self._busy_until:
+            return True
+        if self._busy_period:
+            return (now - self._started_at) % self._busy_period < self._busy_duration
+        return False
+
+    async def push_event(self, endpoint_id: Optional[str] = None) -> None:
+        """
+        Simulates a state change on the local panel and broadcasts it to the connected websocket clients.
+
+        Args:
+            endpoint_id: id of the zone to toggle. When not set, a random zone is toggled.
+        """
+        panel = self._panels[self.local_panel_id]
+        zones = panel["zone"]
+        if endpoint_id is not None:
+            _, _, entry = self._endpoints[endpoint_id]
+            entry["aperta"] = not entry.get("aperta")
+        elif zones:
+            entry = self._rnd.choice(zones)
+            entry["aperta"] = not entry["aperta"]
+        await self._broadcast()
+
+    async def start(self) -> None:
+        """Starts listening for HTTP and websocket connections"""
+        self._started_at = time.monotonic()
+        self._http_server = await asyncio.start_server(self._handle_http, self._host, self._port)
+        self._port = self._http_server.sockets[0].getsockname()[1]
+        self._ws_server = await serve(self._handle_ws, self._host, self._push_port,
+                                      process_request=self._check_ws_request)
+        self._push_port = self._ws_server.sockets[0].getsockname()[1]
+        if self._push_rate > 0:
+            self._push_task = asyncio.get_running_loop().create_task(self._push_looper())
+        _LOGGER.info("Elmax simulator listening on %s and %s", self.local_url, self.push_url)
+
+    async def stop(self) -> None:
+        """Stops the simulator and drops every open connection"""
+        if self._push_task is not None:
+            self._push_task.cancel()
+            self._push_task = None
+        if self._ws_server is not None:
+            self._ws_server.close()
+            await self._ws_server.wait_closed()
+            self._ws_server = None
+        if self._http_server is not None:
+            self._http_server.close()
+            await self._http_server.wait_closed()
+            self._http_server = None
+
+    async def __aenter__(self) -> "ElmaxSimulator":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.stop()
+
+    # ------------------------------------------------------------------
+    # Authentication
+    # ------------------------------------------------------------------
+    def _issue_token(self) -> Dict:
+        claims = {"email": self._username, "exp": int(time.time() + self._token_ttl)}
+        return {"token": f"JWT {jwt.encode(claims, _JWT_SECRET, algorithm='HS256')}"}
+
+    @staticmethod
+    def _is_authorized(authorization: Optional[str]) -> bool:
+        if not authorization:
+            return False
+        token = authorization[4:] if authorization.startswith("JWT ") else authorization
+        try:
+            jwt.decode(token, _JWT_SECRET, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return False
+        return True
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    def _count(self, route: str) -> None:
+        self._stats[route] = self._stats.get(route, 0) + 1
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._count("connection")
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                self._in_flight += 1
+                self._stats["peak_in_flight"] = max(self._stats.get("peak_in_flight", 0), self._in_flight)
+                try:
+                    delay = self._latency + (self._rnd.uniform(0, self._latency_jitter) if self._latency_jitter else 0)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                    if self._failures:
+                        self._count("failure")
+                        status = self._failures.popleft()
+                        if status is None:
+                            break
+                        payload = None
+                    else:
+                        status, payload = await self._dispatch(method.upper(), target, headers, body)
+                        if self._corruptions and status == 200:
+                            self._corruptions -= 1
+                            payload = [None]
+                finally:
+                    self._in_flight -= 1
+                content = b"" if payload is None else json.dumps(payload).encode("utf-8")
+                head = (
+                    f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1")
+                )
+                if self._drips:
+                    interval = self._drips.popleft()
+                    writer.write(head)
+                    for i in range(0, len(content), _DRIP_CHUNK_SIZE):
+                        await writer.drain()
+                        await asyncio.sleep(interval)
+                        writer.write(content[i:i + _DRIP_CHUNK_SIZE])
+                else:
+                    writer.write(head + content)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str],
+                        body: bytes) -> Tuple[int, Optional[object]]:
+        path = urlsplit(target).path
+        if path.startswith(_CLOUD_PREFIX):
+            cloud = True
+            parts = [unquote(p) for p in path[len(_CLOUD_PREFIX):].split("/") if p]
+        elif path.startswith(_LOCAL_PREFIX):
+            cloud = False
+            parts = [unquote(p) for p in path[len(_LOCAL_PREFIX):].split("/") if p]
+        else:
+            return 404, None
+        if not parts:
+            return 404, None
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, None
+
+        route = parts[0]
+        if route == ENDPOINT_LOGIN and method == "POST":
+            self._count("login")
+            if cloud:
+                ok = data.get("username") == self._username and data.get("password") == self._password
+            else:
+                ok = data.get("pin") == self._pin
+            return (200, self._issue_token()) if ok else (401, None)
+
+        if not self._is_authorized(headers.get("authorization")):
+            self._count("unauthorized")
+            return 401, None
+
+        if route == ENDPOINT_REFRESH and method == "POST" and not cloud:
+            self._count("refresh")
+            return 200, self._issue_token()
+
+        if route == ENDPOINT_DEVICES and method == "GET" and cloud:
+            self._count("devices")
+            return 200, [{
+                "hash": panel_id,
+                "centrale_online": panel_id not in self._offline,
+                "username": [{"name": self._username, "label": f"Centrale {i + 1}"}],
+            } for i, panel_id in enumerate(self._panels)]
+
+        if self.is_busy:
+            self._count("busy")
+            return 422, None
+
+        if route == ENDPOINT_DISCOVERY and method == "GET":
+            self._count("discovery")
+            if cloud:
+                if len(parts) != 3 or parts[1] not in self._panels:
+                    return 404, None
+                if parts[1] in self._offline:
+                    return 504, None
+                if parts[2] != self._pin:
+                    return 403, None
+                return 200, self._panels[parts[1]]
+            return 200, self._panels[self.local_panel_id]
+
+        if route == ENDPOINT_STATUS_ENTITY_ID and method == "GET" and len(parts) == 2:
+            self._count("status")
+            if parts[1] not in self._endpoints:
+                return 404, None
+            panel_id, section, entry = self._endpoints[parts[1]]
+            return 200, build_endpoint_payload(self._panels[panel_id], section, entry)
+
+        if method == "POST":
+            # Cloud commands are issued against {endpoint}/{cmd}, local ones against cmd/{endpoint}/{cmd}
+            if not cloud and route == ENDPOINT_LOCAL_CMD and len(parts) == 3:
+                endpoint_id, command = parts[1], parts[2]
+            elif cloud and len(parts) == 2:
+                endpoint_id, command = parts[0], parts[1]
+            else:
+                return 404, None
+            self._count("cmd")
+            status = self._apply_command(endpoint_id, command, data)
+            if status == 200:
+                if self._endpoints[endpoint_id][0] == self.local_panel_id:
+                    await self._broadcast()
+                return 200, {"result": "ok"}
+            return status, None
+
+        return 404, None
+
+    def _apply_command(self, endpoint_id: str, command: str, data: Dict) -> int:
+        if endpoint_id not in self._endpoints:
+            return 404
+        _, section, entry = self._endpoints[endpoint_id]
+        if section in ("uscite", "gruppi"):
+            if command == SwitchCommand.TURN_ON.value:
+                entry["aperta"] = True
+            elif command == SwitchCommand.TURN_OFF.value:
+                entry["aperta"] = False
+            else:
+                return 400
+        elif section == "scenari":
+            if command != "on":
+                return 400
+        elif section == "tapparelle":
+            if command == str(CoverCommand.UP.value):
+                entry["posizione"], entry["stato"] = 100, CoverStatus.IDLE.value
+            elif command == str(CoverCommand.DOWN.value):
+                entry["posizione"], entry["stato"] = 0, CoverStatus.IDLE.value
+            else:
+                return 400
+        elif section == "aree":
+            if data.get("code", DEFAULT_PANEL_PIN) != self._pin:
+                return 403
+            if command not in [str(c.value) for c in AreaCommand]:
+                return 400
+            arm_status = AlarmArmStatus(int(command))
+            entry["stato"] = arm_status.value
+            entry["statoSessione"] = (AlarmStatus.NOT_ARMED_NOT_TRIGGERED if arm_status == AlarmArmStatus.NOT_ARMED
+                                      else AlarmStatus.ARMED_STANDBY).value
+        else:
+            return 400
+        return 200
+
+    # ------------------------------------------------------------------
+    # Push websocket
+    # ------------------------------------------------------------------
+    def _check_ws_request(self, connection: ServerConnection, request):
+        if request.path != _PUSH_PATH:
+            return connection.respond(404, "Not found\n")
+        if not self._push_available:
+            return connection.respond(503, "Service unavailable\n")
+        if not self._is_authorized(request.headers.get("Authorization")):
+            return connection.respond(401, "Unauthorized\n")
+        return None
+
+    async def _handle_ws(self, connection: ServerConnection) -> None:
+        self._count("push_connection")
+        self._ws_clients.add(connection)
+        try:
+            await connection.wait_closed()
+        finally:
+            self._ws_clients.discard(connection)
+
+    async def _broadcast(self) -> None:
+        if not self._ws_clients:
+            return
+        message = json.dumps(self._panels[self.local_panel_id])
+        clients: List[ServerConnection] = list(self._ws_clients)
+        for client in clients:
+            try:
+                await client.send(message)
+                self._count("push")
+            except ConnectionClosed:
+                self._ws_clients.discard(client)
+
+    async def _push_looper(self) -> None:
+        interval = 1.0 / self._push_rate
+        next_tick = time.monotonic()
+        while True:
+            next_tick += interval
+            await self.push_event()
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
@@ -0,0 +1,146 @@
+"""
+This module implements token stores, used by the API clients to share JWT tokens across client instances and
+processes, so that a valid token obtained by one of them is reused by the others instead of logging in again.
+"""
+
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    import fcntl
+
+    def _lock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:  # pragma: no cover - Windows
+    import msvcrt
+
+    def _lock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class TokenStore(ABC):
+    """
+    Abstract token store.
+    Tokens are stored in their encoded form, keyed by a string identifying the API server and the user/panel.
+    """
+
+    @abstractmethod
+    def load(self, key: str) -> Optional[str]:
+        """Returns the encoded JWT stored for the given key, if any"""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def save(self, key: str, raw_jwt: str) -> None:
+        """Stores the encoded JWT for the given key, replacing any previous one"""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Removes the token stored for the given key, if any"""
+        raise NotImplementedError()
+
+
+class MemoryTokenStore(TokenStore):
+    """Token store sharing tokens among the clients of the current process"""
+
+    def __init__(self):
+        self._tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._tokens.get(key)
+
+    def save(self, key: str, raw_jwt: str) -> None:
+        with self._lock:
+            self._tokens[key] = raw_jwt
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._tokens.pop(key, None)
+
+
+class FileTokenStore(TokenStore):
+    """
+    Token store persisting tokens to a json file, shared among processes.
+    Accesses are serialized by an exclusive lock on a sibling `.lock` file, and the store file is replaced
+    atomically on every write. Both files are only readable by the current user.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Constructor.
+
+        Args:
+            path: path of the store file. Defaults to ~/.cache/elmax-api/tokens.json
+        """
+        if path is None:
+            path = os.path.join(os.path.expanduser("~"), ".cache", "elmax-api", "tokens.json")
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(f"{self._path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            _lock_file(fd)
+            try:
+                yield
+            finally:
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+
+    def _read(self) -> Dict[str, str]:
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            _LOGGER.warning("Token store %s is corrupted and will be overwritten", self._path)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, data: Dict[str, str]) -> None:
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path)
+
+    def load(self, key: str) -> Optional[str]:
+        with self._locked():
+            return self._read().get(key)
+
+    def save(self, key: str, raw_jwt: str) -> None:
+        with self._locked():
+            data = self._read()
+            data[key] = raw_jwt
+            self._write(data)
+
+    def delete(self, key: str) -> None:
+        with self._locked():
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
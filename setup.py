@@ -43,6 +43,7 @@ setup(
     },
     data_files=[('.', ['requirements.txt'])],
     install_requires=requirements,
+    extras_require={"http2": ["httpx[http2]"], "fast": ["orjson"]},
     python_requires=">=3.7",
     test_suite="tests",
 )
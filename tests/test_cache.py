@@ -0,0 +1,128 @@
+"""Test the read-through panel-status cache against the offline Elmax simulator."""
+import asyncio
+
+import pytest
+
+from elmax_api.cache import StatusCache
+from elmax_api.exceptions import ElmaxBadPinError
+from elmax_api.http import Elmax, ElmaxLocal
+from elmax_api.model.command import SwitchCommand
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_one_request():
+    async with ElmaxSimulator(latency=0.05) as sim:
+        cache = StatusCache(max_age=10)
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, status_cache=cache)
+        statuses = await asyncio.gather(*(client.get_current_panel_status() for _ in range(20)))
+        assert sim.stats["discovery"] == 1
+        assert cache.misses == 1 and cache.coalesced == 19
+        # The response is parsed once
+        assert all(s is statuses[0] for s in statuses)
+
+        # Fresh statuses are served from the cache, whatever the decoding options
+        areas_only = await client.get_current_panel_status(sections={"areas"})
+        assert not areas_only.zones and areas_only.areas
+        assert sim.stats["discovery"] == 1 and cache.hits == 1
+
+        # An explicit max_age forces a new request
+        await client.get_current_panel_status(max_age=0)
+        assert sim.stats["discovery"] == 2
+
+
+@pytest.mark.asyncio
+async def test_commands_invalidate_cached_status():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, status_cache=StatusCache(max_age=10))
+        status = await client.get_current_panel_status()
+        actuator = status.actuators[0]
+        command = SwitchCommand.TURN_OFF if actuator.opened else SwitchCommand.TURN_ON
+        await client.execute_command(actuator.endpoint_id, command)
+
+        updated = await client.get_current_panel_status()
+        assert sim.stats["discovery"] == 2
+        assert updated.get_actuator(actuator.endpoint_id).opened != actuator.opened
+
+
+@pytest.mark.asyncio
+async def test_commands_invalidate_only_their_panel():
+    async with ElmaxSimulator() as sim, ElmaxSimulator() as other_sim:
+        cache = StatusCache(max_age=10)
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, status_cache=cache)
+        other = ElmaxLocal(panel_api_url=other_sim.local_url, panel_code=other_sim.pin, status_cache=cache)
+        status = await client.get_current_panel_status()
+        await other.get_current_panel_status()
+
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_ON)
+        await client.get_current_panel_status()
+        await other.get_current_panel_status()
+        assert sim.stats["discovery"] == 2 and other_sim.stats["discovery"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cloud_cache_is_keyed_by_panel_and_pin():
+    async with ElmaxSimulator(panel_count=2) as sim:
+        cache = StatusCache(max_age=10)
+        client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url, status_cache=cache)
+        panels = await client.list_control_panels()
+        first, second = panels[0].hash, panels[1].hash
+        await client.get_panel_status(first, pin=sim.pin)
+        await client.get_panel_status(second, pin=sim.pin)
+        await client.get_panel_status(first, pin=sim.pin)
+        assert cache.misses == 2 and cache.hits == 1
+
+        # Bad PINs are not cached
+        for _ in range(2):
+            with pytest.raises(ElmaxBadPinError):
+                await client.get_panel_status(first, pin="999999")
+        assert cache.misses == 4
+
+        # A command only invalidates the status of its own panel
+        status = await client.get_panel_status(first, pin=sim.pin)
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_ON)
+        await client.get_panel_status(first, pin=sim.pin)
+        await client.get_panel_status(second, pin=sim.pin)
+        assert cache.misses == 5
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate():
+    async with ElmaxSimulator(latency=0.05) as sim:
+        cache = StatusCache(max_age=0.1, stale_while_revalidate=10)
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, status_cache=cache)
+        first = await client.get_current_panel_status()
+        await asyncio.sleep(0.15)
+
+        # The stale status is returned right away, while a fresh one is fetched in background
+        stale = await client.get_current_panel_status()
+        assert stale is first and cache.stale_hits == 1
+        assert sim.stats["discovery"] == 1
+        await asyncio.sleep(0.2)
+        assert sim.stats["discovery"] == 2
+        assert await client.get_current_panel_status() is not first
+
+
+@pytest.mark.asyncio
+async def test_unchanged_responses_are_not_parsed_again():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, skip_unchanged=True)
+        first = await client.get_current_panel_status()
+        assert await client.get_current_panel_status() is first
+        assert client.skipped_parse_count == 1
+        # Statuses are reused only for the same decoding options
+        assert await client.get_current_panel_status(sections={"areas"}) is not first
+
+        actuator = first.actuators[0]
+        await client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_OFF if actuator.opened
+                                     else SwitchCommand.TURN_ON)
+        updated = await client.get_current_panel_status()
+        assert updated is not first and client.skipped_parse_count == 2
+
+        # With a status cache, revalidating an unchanged panel keeps the parsed status
+        cache = StatusCache(max_age=0)
+        cached_client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, skip_unchanged=True,
+                                   status_cache=cache)
+        cached = await cached_client.get_current_panel_status()
+        assert await cached_client.get_current_panel_status() is cached
+        assert cache.misses == 2
@@ -0,0 +1,105 @@
+"""Test the circuit breakers of the API clients."""
+import asyncio
+import socket
+import time
+
+import pytest
+
+from elmax_api.circuit import CircuitBreaker, CircuitBreakerRegistry, CircuitState
+from elmax_api.exceptions import ElmaxApiError, ElmaxCircuitOpenError, ElmaxConnectionError, ElmaxNetworkError
+from elmax_api.http import ElmaxLocal
+from elmax_api.retry import RetryPolicy
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+def _fail(breaker: CircuitBreaker, error: Exception):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+def test_circuit_breaker_states():
+    changes = []
+    breaker = CircuitBreaker("panel", failure_threshold=2, recovery_timeout=0.05,
+                             on_state_change=lambda key, old, new: changes.append((key, old, new)))
+    # Client errors do not count as failures, and successes reset the count
+    _fail(breaker, ElmaxNetworkError())
+    _fail(breaker, ElmaxApiError(status_code=404))
+    _fail(breaker, ElmaxApiError(status_code=503))
+    assert breaker.state == CircuitState.CLOSED and breaker.consecutive_failures == 1
+
+    _fail(breaker, ElmaxNetworkError())
+    assert breaker.state == CircuitState.OPEN
+    _fail(breaker, ElmaxCircuitOpenError())
+
+    # A failed probe opens the circuit again
+    time.sleep(0.06)
+    _fail(breaker, ElmaxNetworkError())
+    assert breaker.state == CircuitState.OPEN
+
+    # A single probe at a time, closing the circuit on success
+    time.sleep(0.06)
+    with breaker.guard():
+        assert breaker.state == CircuitState.HALF_OPEN
+        _fail(breaker, ElmaxCircuitOpenError())
+    assert breaker.state == CircuitState.CLOSED
+
+    assert changes == [
+        ("panel", CircuitState.CLOSED, CircuitState.OPEN),
+        ("panel", CircuitState.OPEN, CircuitState.HALF_OPEN),
+        ("panel", CircuitState.HALF_OPEN, CircuitState.OPEN),
+        ("panel", CircuitState.OPEN, CircuitState.HALF_OPEN),
+        ("panel", CircuitState.HALF_OPEN, CircuitState.CLOSED),
+    ]
+    assert breaker.metrics() == {"state": "closed", "consecutive_failures": 0, "trips": 2, "rejected": 2}
+
+
+def test_cancelled_probe_frees_its_slot():
+    breaker = CircuitBreaker("panel", failure_threshold=1, recovery_timeout=0)
+    _fail(breaker, ElmaxNetworkError())
+    _fail(breaker, asyncio.CancelledError())
+    assert breaker.state == CircuitState.HALF_OPEN
+    with breaker.guard():
+        pass
+    assert breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_dead_panel_fails_fast():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    registry = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=0.2)
+    policy = RetryPolicy(attempts=1)
+    dead = ElmaxLocal(panel_api_url=f"http://127.0.0.1:{port}/api/v2/", panel_code="000000",
+                      retry_policy=policy, circuit_breakers=registry)
+    for _ in range(2):
+        with pytest.raises(ElmaxConnectionError):
+            await dead.login()
+    start = time.monotonic()
+    with pytest.raises(ElmaxCircuitOpenError):
+        await dead.login()
+    assert time.monotonic() - start < 0.05
+
+    async with ElmaxSimulator() as sim:
+        # Healthy panels sharing the registry are not affected
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=policy, circuit_breakers=registry)
+        await client.get_current_panel_status()
+
+        # The circuit recovers once the server answers again
+        sim.fail_next(2, status=503)
+        for _ in range(2):
+            with pytest.raises(ElmaxApiError):
+                await client.get_current_panel_status()
+        with pytest.raises(ElmaxCircuitOpenError):
+            await client.get_current_panel_status()
+        await asyncio.sleep(0.2)
+        await client.get_current_panel_status()
+        assert client.circuit_breaker.state == CircuitState.CLOSED
+
+        metrics = registry.metrics()
+        assert metrics[str(dead.base_url)]["state"] == "open"
+        assert metrics[str(client.base_url)]["trips"] == 1
+        await client.aclose()
+    await dead.aclose()
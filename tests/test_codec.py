@@ -0,0 +1,45 @@
+"""Test the pluggable JSON codecs."""
+import pytest
+
+from elmax_api.codec import StdlibJsonCodec, available_codecs, get_codec
+from elmax_api.http import ElmaxLocal
+from elmax_api.model.command import AreaCommand, SwitchCommand
+from elmax_api.simulator.payload import build_profile_payload
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.parametrize("name", list(available_codecs()))
+def test_codec_round_trip(name):
+    codec = get_codec(name)
+    payload = build_profile_payload("small")
+    data = codec.dumps(payload)
+    assert isinstance(data, bytes)
+    assert codec.loads(data) == payload
+    assert codec.loads(data.decode("utf-8")) == payload
+    with pytest.raises(ValueError):
+        codec.loads(b"{not json")
+
+
+def test_default_codec():
+    assert type(get_codec()) is next(iter(available_codecs().values()))
+    assert "json" in available_codecs()
+    with pytest.raises(ValueError):
+        get_codec("yaml")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", list(available_codecs()))
+async def test_client_codec(name):
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, json_codec=get_codec(name))
+        status = await client.get_current_panel_status()
+        await client.execute_command(status.areas[0].endpoint_id, AreaCommand.DISARM, extra_payload={"code": sim.pin})
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_ON)
+        assert sim.stats["cmd"] == 2
+
+
+def test_client_default_codec():
+    client = ElmaxLocal(panel_api_url="http://127.0.0.1/api/v2/", panel_code="000000")
+    assert client.json_codec is get_codec()
+    client = ElmaxLocal(panel_api_url="http://127.0.0.1/api/v2/", panel_code="000000", json_codec=StdlibJsonCodec())
+    assert isinstance(client.json_codec, StdlibJsonCodec)
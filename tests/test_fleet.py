@@ -0,0 +1,111 @@
+"""Test the fleet poller of cloud panels."""
+import asyncio
+import socket
+
+import pytest
+
+from elmax_api.circuit import CircuitBreakerRegistry, CircuitState
+from elmax_api.exceptions import ElmaxApiError, ElmaxBadPinError, ElmaxCircuitOpenError
+from elmax_api.fleet import FleetPoller
+from elmax_api.http import Elmax
+from elmax_api.retry import RetryPolicy
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.asyncio
+async def test_fleet_poller():
+    async with ElmaxSimulator(panel_count=6, latency=0.01) as sim:
+        panel_ids = list(sim.panels)
+        offline, wrong_pin = panel_ids[0], panel_ids[1]
+        sim.set_panel_online(offline, False)
+        client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url,
+                       retry_policy=RetryPolicy(attempts=1))
+        poller = FleetPoller(client, pins={wrong_pin: "999999"}, default_pin=sim.pin, concurrency=2,
+                             interval=10, offline_probe_interval=0.3)
+
+        # Offline panels are skipped, the others are polled concurrently
+        results = [result async for result in poller.poll_once(spread=0.1)]
+        assert sorted(r.panel_id for r in results) == sorted(panel_ids[1:])
+        assert all(r.succeeded and r.status.panel_id == r.panel_id for r in results if r.panel_id != wrong_pin)
+        failed = [r for r in results if not r.succeeded]
+        assert [r.panel_id for r in failed] == [wrong_pin] and isinstance(failed[0].error, ElmaxBadPinError)
+
+        # Failing panels back off
+        results = [result async for result in poller.poll_once()]
+        assert sorted(r.panel_id for r in results) == sorted(panel_ids[2:])
+        assert poller.health()[wrong_pin]["skipped"] == 1
+
+        # Offline panels are probed from time to time
+        await asyncio.sleep(0.3)
+        results = {r.panel_id: r for r in [result async for result in poller.poll_once()]}
+        assert results[offline].probe and isinstance(results[offline].error, ElmaxApiError)
+        assert results[offline].error.status_code == 504
+
+        # Panels coming back online are polled right away
+        sim.set_panel_online(offline, True)
+        results = {r.panel_id: r for r in [result async for result in poller.poll_once()]}
+        assert results[offline].succeeded and not results[offline].probe
+
+        metrics = poller.metrics()
+        assert metrics["panels"] == 6 and metrics["online"] == 6 and metrics["failing"] == 1
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fleet_poller_stream():
+    async with ElmaxSimulator(panel_count=3) as sim:
+        client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url)
+        poller = FleetPoller(client, default_pin=sim.pin, interval=0.2)
+        stream = poller.poll()
+        polled = [(await stream.__anext__()).panel_id for _ in range(6)]
+        await stream.aclose()
+        assert sorted(polled) == sorted(list(sim.panels) * 2)
+        assert sim.stats["devices"] == 2
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_offline_panel_does_not_trip_the_account_circuit():
+    async with ElmaxSimulator(panel_count=3) as sim:
+        offline = list(sim.panels)[0]
+        sim.set_panel_online(offline, False)
+        registry = CircuitBreakerRegistry(failure_threshold=2)
+        client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url,
+                       retry_policy=RetryPolicy(backoff_initial=0.01), circuit_breakers=registry)
+        poller = FleetPoller(client, default_pin=sim.pin, offline_probe_interval=0, failure_backoff_max=0)
+
+        # Every probe is retried, but counts as a single failure of the circuit of its panel
+        results = {r.panel_id: r for r in [result async for result in poller.poll_once()]}
+        assert isinstance(results[offline].error, ElmaxApiError)
+        assert client.metrics.counter("retries_total", endpoint="discovery", reason="server_error") == 2
+        assert client.panel_circuit_breaker(offline).consecutive_failures == 1
+
+        results = {r.panel_id: r for r in [result async for result in poller.poll_once()]}
+        assert client.panel_circuit_breaker(offline).state == CircuitState.OPEN
+        results = {r.panel_id: r for r in [result async for result in poller.poll_once()]}
+        assert isinstance(results[offline].error, ElmaxCircuitOpenError)
+
+        # The other panels, and the account-level requests, are not affected
+        assert all(r.succeeded for panel_id, r in results.items() if panel_id != offline)
+        assert client.circuit_breaker.state == CircuitState.CLOSED
+        await client.login()
+        assert len(await client.list_control_panels()) == 3
+        await client.aclose()
+
+
+def test_fleet_poller_built_outside_the_loop():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    simulator = ElmaxSimulator(panel_count=2, port=port)
+    client = Elmax(username=simulator.username, password=simulator.password, base_url=simulator.cloud_url)
+    poller = FleetPoller(client, default_pin=simulator.pin, concurrency=1)
+
+    async def _poll():
+        async with simulator:
+            results = [result async for result in poller.poll_once()]
+        await client.aclose()
+        return results
+
+    results = asyncio.run(_poll())
+    assert len(results) == 2 and all(r.succeeded for r in results)
@@ -0,0 +1,183 @@
+"""Test the HTTP client behaviour against the offline Elmax simulator."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from elmax_api.exceptions import ElmaxApiError
+from elmax_api.http import Elmax, ElmaxLocal, create_http_session
+from elmax_api.model.command import SwitchCommand
+from elmax_api.scheduler import CommandScheduler
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.asyncio
+async def test_single_flight_login():
+    async with ElmaxSimulator(latency=0.05) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        statuses = await asyncio.gather(*(client.get_current_panel_status() for _ in range(50)))
+        assert len(statuses) == 50
+        assert sim.stats["login"] == 1
+
+        # Expiring token: every concurrent caller waits for the same login
+        client._jwt["exp"] = int(time.time()) + 10
+        actuator = statuses[0].actuators[0]
+        await asyncio.gather(*(client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_ON)
+                               for _ in range(20)))
+        assert sim.stats["login"] == 2
+
+
+@pytest.mark.asyncio
+async def test_nested_calls_acquire_token_once():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        await client.login()
+        acquisitions = 0
+        original = ElmaxLocal._acquire_token
+
+        class _CountingClient(ElmaxLocal):
+            async def _acquire_token(self, renew: bool = False):
+                nonlocal acquisitions
+                acquisitions += 1
+                return await original(self, renew)
+
+        client.__class__ = _CountingClient
+        status = await client.get_current_panel_status()
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_OFF)
+        assert acquisitions == 0
+
+        # The token renewed by the outer call is used as is by the nested ones
+        client._jwt["exp"] = int(time.time()) + 10
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_ON)
+        assert acquisitions == 1 and sim.stats["login"] == 2
+
+
+@pytest.mark.asyncio
+async def test_token_expiring_during_batch():
+    async with ElmaxSimulator(token_ttl=2, latency=0.1, actuators=24) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        status = await client.get_current_panel_status()
+        # The batch outlives the token checked when it started: every command checks it again
+        results = await client.execute_commands([(a.endpoint_id, SwitchCommand.TURN_ON) for a in status.actuators],
+                                                concurrency=1)
+        assert all(r.succeeded for r in results)
+        assert sim.stats.get("unauthorized", 0) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_login_is_retried():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code="999999")
+        results = await asyncio.gather(*(client.get_current_panel_status() for _ in range(5)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, Exception) for r in results)
+        assert sim.stats["login"] == 1
+
+        client.set_current_panel(sim.local_url, sim.pin)
+        await client.get_current_panel_status()
+        assert sim.stats["login"] == 2
+
+
+@pytest.mark.asyncio
+async def test_background_token_refresher():
+    async with ElmaxSimulator(token_ttl=3) as sim:
+        local_client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        cloud_client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url)
+        local_client.start_token_refresher(margin=1, jitter=0.1)
+        cloud_client.start_token_refresher(margin=1, jitter=0.1)
+        try:
+            assert local_client.is_token_refresher_running
+            deadline = time.monotonic() + 4
+            while time.monotonic() < deadline and (sim.stats.get("refresh", 0) < 1 or sim.stats.get("login", 0) < 3):
+                await asyncio.sleep(0.05)
+            # The local client logs in once and then uses the refresh API, the cloud client logs in again
+            assert sim.stats.get("refresh", 0) >= 1
+            assert sim.stats["login"] >= 3
+            assert local_client.token_expiration_time > time.time()
+        finally:
+            local_client.stop_token_refresher()
+            cloud_client.stop_token_refresher()
+        assert not local_client.is_token_refresher_running
+
+
+@pytest.mark.asyncio
+async def test_shared_http_session():
+    async with ElmaxSimulator(latency=0.02) as sim:
+        session = create_http_session(limits=httpx.Limits(max_connections=2))
+        clients = [ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, http_session=session)
+                   for _ in range(10)]
+        await asyncio.gather(*(c.get_current_panel_status() for c in clients for _ in range(3)))
+        # All the clients share the pooled connections of the session
+        assert sim.stats["connection"] <= 2
+
+        for client in clients:
+            async with client:
+                pass
+        # The session is owned by the caller: closing the clients does not close it
+        assert not session.is_closed
+        await clients[0].get_current_panel_status()
+        await session.aclose()
+
+        async with ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin) as client:
+            client.start_token_refresher()
+            await client.get_current_panel_status()
+        assert client.http_session.is_closed
+        assert not client.is_token_refresher_running
+
+
+@pytest.mark.asyncio
+async def test_execute_commands_batch():
+    async with ElmaxSimulator(latency=0.05, actuators=20) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            command_scheduler=CommandScheduler(max_in_flight=10))
+        status = await client.get_current_panel_status()
+        actuators = [a.endpoint_id for a in status.actuators]
+        batch = [(endpoint_id, SwitchCommand.TURN_ON) for endpoint_id in actuators]
+        # Commands against the same endpoint keep their order
+        batch += [(actuators[0], SwitchCommand.TURN_OFF), (actuators[0], SwitchCommand.TURN_ON, None),
+                  ("unknown-endpoint", SwitchCommand.TURN_ON)]
+
+        sim.stats.clear()
+        results = await client.execute_commands(batch, concurrency=10)
+        # Commands run concurrently, up to the batch concurrency
+        assert 1 < sim.stats["peak_in_flight"] <= 10
+
+        assert [r.endpoint_id for r in results] == [b[0] for b in batch]
+        assert all(r.succeeded for r in results[:-1])
+        assert not results[-1].succeeded and results[-1].error is not None
+        updated = await client.get_current_panel_status()
+        assert all(a.opened for a in updated.actuators)
+
+        with pytest.raises(ValueError):
+            await client.execute_commands(batch, concurrency=0)
+
+        # Malformed commands are rejected before any command is sent
+        commands = sim.stats["cmd"]
+        for malformed in [(actuators[0], SwitchCommand.TURN_ON, None, {"result": 1}), (actuators[0],), "abc"]:
+            with pytest.raises(ValueError):
+                await client.execute_commands([(actuators[1], SwitchCommand.TURN_OFF), malformed])
+        assert sim.stats["cmd"] == commands
+
+
+@pytest.mark.asyncio
+async def test_refresh_endpoints():
+    async with ElmaxSimulator(latency=0.05, actuators=10) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        snapshot = await client.get_current_panel_status()
+        actuators = [a.endpoint_id for a in snapshot.actuators]
+        await client.execute_commands([(endpoint_id, SwitchCommand.TURN_OFF) for endpoint_id in actuators])
+        sim.stats.clear()
+
+        refreshed = await client.refresh_endpoints(snapshot, actuators + [actuators[0]], concurrency=5)
+        # 10 endpoints, 5 at a time
+        assert 1 < sim.stats["peak_in_flight"] <= 5
+        assert sim.stats["status"] == 10 and "discovery" not in sim.stats
+
+        assert not any(a.opened for a in refreshed.actuators)
+        assert refreshed.fingerprints == (await client.get_current_panel_status()).fingerprints
+        assert [a.endpoint_id for a in refreshed.actuators] == actuators
+        assert refreshed.zones is snapshot.zones
+
+        with pytest.raises(ElmaxApiError):
+            await client.refresh_endpoints(snapshot, ["unknown-endpoint"])
@@ -0,0 +1,63 @@
+"""Memory-footprint regression tests for the endpoint and panel models."""
+import gc
+import tracemalloc
+
+import pytest
+
+from elmax_api.model.actuator import Actuator
+from elmax_api.model.area import Area
+from elmax_api.model.cover import Cover
+from elmax_api.model.goup import Group
+from elmax_api.model.panel import PanelStatus
+from elmax_api.model.scene import Scene
+from elmax_api.model.zone import Zone
+from elmax_api.simulator.payload import build_profile_payload
+
+# Bytes allocated per endpoint object, including its slot in the containing list. Strings are not accounted as
+# they are shared with the decoded json payload.
+MAX_BYTES_PER_ENDPOINT = {
+    Zone: 100,
+    Actuator: 100,
+    Cover: 100,
+    Group: 100,
+    Scene: 100,
+    # Areas also hold the lists of available statuses
+    Area: 360,
+}
+MAX_BYTES_EMPTY_PANEL_STATUS = 1100
+MAX_BYTES_SMALL_PANEL_STATUS = 5400
+
+_SECTIONS = {Zone: "zone", Actuator: "uscite", Area: "aree", Cover: "tapparelle", Group: "gruppi", Scene: "scenari"}
+
+
+def _allocated_bytes(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+@pytest.mark.parametrize("cls", list(_SECTIONS))
+def test_bytes_per_endpoint(cls):
+    entries = build_profile_payload("huge")[_SECTIONS[cls]]
+    allocated = _allocated_bytes(lambda: [cls.from_api_response(e) for e in entries])
+    assert allocated / len(entries) <= MAX_BYTES_PER_ENDPOINT[cls]
+
+
+@pytest.mark.parametrize("cls", list(_SECTIONS))
+def test_endpoints_have_no_instance_dict(cls):
+    entry = build_profile_payload("small")[_SECTIONS[cls]][0]
+    assert not hasattr(cls.from_api_response(entry), "__dict__")
+
+
+def test_bytes_per_panel_status():
+    payload = build_profile_payload("small")
+    empty_payload = {k: v for k, v in payload.items() if not isinstance(v, list)}
+    assert _allocated_bytes(lambda: PanelStatus.from_api_response(empty_payload)) <= MAX_BYTES_EMPTY_PANEL_STATUS
+    assert _allocated_bytes(lambda: PanelStatus.from_api_response(payload)) <= MAX_BYTES_SMALL_PANEL_STATUS
@@ -0,0 +1,114 @@
+"""Test the metrics of the API clients and push-notification handlers."""
+import json
+
+import pytest
+
+from elmax_api.cache import StatusCache
+from elmax_api.http import ElmaxLocal
+from elmax_api.metrics import Metrics
+from elmax_api.model.command import SwitchCommand
+from elmax_api.push.push import DispatchMode, PushNotificationHandler
+from elmax_api.retry import RetryPolicy
+from elmax_api.simulator.payload import build_profile_payload
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+def test_metrics_export():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("responses_total", endpoint="login", status="200")
+    metrics.inc("responses_total", endpoint="login", status="200")
+    metrics.inc("errors_total", value=0.5, error='Bad "quoted"\nerror')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        metrics.observe("request_duration_seconds", value, endpoint="login")
+
+    assert metrics.counter("responses_total", status="200", endpoint="login") == 2
+    histogram = metrics.histogram("request_duration_seconds", endpoint="login")
+    assert histogram.count == 4 and histogram.sum == pytest.approx(3.65)
+    assert histogram.cumulative_counts()[:2] == [(0.1, 2), (1.0, 3)]
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["responses_total"] == [{"labels": {"endpoint": "login", "status": "200"}, "value": 2}]
+    assert snapshot["histograms"]["request_duration_seconds"][0]["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+    json.dumps(snapshot)
+
+    assert metrics.to_prometheus().splitlines() == [
+        '# TYPE elmax_errors_total counter',
+        'elmax_errors_total{error="Bad \\"quoted\\"\\nerror"} 0.5',
+        '# TYPE elmax_responses_total counter',
+        'elmax_responses_total{endpoint="login",status="200"} 2',
+        '# TYPE elmax_request_duration_seconds histogram',
+        'elmax_request_duration_seconds_bucket{endpoint="login",le="0.1"} 2',
+        'elmax_request_duration_seconds_bucket{endpoint="login",le="1.0"} 3',
+        'elmax_request_duration_seconds_bucket{endpoint="login",le="+Inf"} 4',
+        'elmax_request_duration_seconds_sum{endpoint="login"} 3.65',
+        'elmax_request_duration_seconds_count{endpoint="login"} 4',
+    ]
+
+    disabled = Metrics(enabled=False)
+    disabled.inc("responses_total")
+    disabled.observe("request_duration_seconds", 1.0)
+    assert disabled.snapshot() == {"counters": {}, "histograms": {}}
+
+
+@pytest.mark.asyncio
+async def test_client_metrics():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=RetryPolicy(backoff_initial=0.01))
+        metrics = client.metrics
+        status = await client.get_current_panel_status()
+        sim.fail_next(1, status=None)
+        await client.get_current_panel_status()
+        sim.set_busy(0.05)
+        await client.execute_command(status.actuators[0].endpoint_id, SwitchCommand.TURN_ON)
+
+        assert metrics.counter("auth_total", kind="login", outcome="ok") == 1
+        assert metrics.histogram("auth_duration_seconds", kind="login").count == 1
+        assert metrics.histogram("request_duration_seconds", method="POST", endpoint="login").count == 1
+        assert metrics.histogram("request_duration_seconds", method="GET", endpoint="discovery").count == 2
+        assert metrics.counter("responses_total", endpoint="discovery", status="200") == 2
+        assert metrics.histogram("response_decode_duration_seconds", endpoint="discovery").count == 2
+        assert metrics.histogram("status_parse_duration_seconds").count == 2
+        assert metrics.counter("network_errors_total", endpoint="discovery", error="RemoteProtocolError") == 1
+        assert metrics.counter("retries_total", endpoint="discovery", reason="network_error") == 1
+        # Commands are labelled without their endpoint id
+        assert metrics.counter("retries_total", endpoint="command", reason="busy") >= 1
+        assert metrics.counter("responses_total", endpoint="command", status="422") >= 1
+        assert metrics.counter("responses_total", endpoint="command", status="200") == 1
+        assert 'elmax_responses_total{endpoint="discovery",status="200"} 2' in metrics.to_prometheus()
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_cached_status_parse_metrics():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, status_cache=StatusCache(max_age=10))
+        for _ in range(3):
+            await client.get_current_panel_status()
+        await client.get_current_panel_status(sections={"zones"})
+        # Cached statuses are parsed once per section selection
+        assert client.metrics.histogram("status_parse_duration_seconds").count == 2
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_push_metrics():
+    client = ElmaxLocal(panel_api_url="http://127.0.0.1/api/v2/", panel_code="000000")
+    handler = PushNotificationHandler("ws://127.0.0.1/api/v2/push", client, dispatch_mode=DispatchMode.SEQUENTIAL,
+                                      skip_unchanged=True)
+    received = []
+
+    async def _on_status(status):
+        received.append(status)
+
+    handler.register_push_notification_handler(_on_status)
+    message = json.dumps(build_profile_payload("small"))
+    for _ in range(3):
+        await handler._notify_handlers(message)
+
+    metrics = client.metrics
+    endpoint = "ws://127.0.0.1/api/v2/push"
+    assert len(received) == 1
+    assert metrics.counter("push_skipped_total", endpoint=endpoint) == 2
+    for name in ("push_decode_duration_seconds", "push_parse_duration_seconds", "push_dispatch_duration_seconds"):
+        assert metrics.histogram(name, endpoint=endpoint).count == 1
@@ -0,0 +1,130 @@
+"""Test the panel and endpoint status models, offline."""
+import copy
+
+import pytest
+
+from elmax_api.model.alarm_status import AlarmArmStatus
+from elmax_api.model.panel import EndpointStatus, PanelStatus
+from elmax_api.simulator.payload import build_endpoint_payload, build_profile_payload
+
+
+def test_lazy_decoding():
+    payload = build_profile_payload("medium")
+    eager = PanelStatus.from_api_response(payload)
+    lazy = PanelStatus.from_api_response(payload, lazy=True)
+
+    assert lazy._zones is None and lazy._covers is None
+    assert lazy.areas == eager.areas
+    assert lazy._zones is None
+
+    assert lazy.all_endpoints == eager.all_endpoints
+    # Once every section is decoded, the raw payload is released
+    assert lazy._raw is None
+
+
+def test_section_selection():
+    payload = build_profile_payload("medium")
+    status = PanelStatus.from_api_response(payload, sections={"areas", "zones"})
+    assert len(status.areas) == len(payload["aree"])
+    assert len(status.zones) == len(payload["zone"])
+    assert status.covers == [] and status.actuators == [] and status.groups == [] and status.scenes == []
+
+    lazy = PanelStatus.from_api_response(payload, lazy=True, sections={"areas"})
+    assert lazy.covers == []
+    assert len(lazy.areas) == len(payload["aree"])
+
+    with pytest.raises(ValueError):
+        PanelStatus.from_api_response(payload, sections={"doors"})
+
+
+def test_lazy_endpoint_status():
+    payload = build_profile_payload("small")
+    endpoint_payload = build_endpoint_payload(payload, "tapparelle", payload["tapparelle"][0])
+    status = EndpointStatus.from_api_response(endpoint_payload, lazy=True)
+    assert status.covers[0].endpoint_id == payload["tapparelle"][0]["endpointId"]
+    # Like panel statuses, endpoint statuses list their covers among all the endpoints
+    assert status.all_endpoints == [status.covers[0]]
+    assert status.get_endpoint(status.covers[0].endpoint_id) is status.covers[0]
+    assert list(status.fingerprints) == [status.covers[0].endpoint_id]
+
+
+def test_lazy_repr():
+    payload = build_profile_payload("tiny")
+    assert repr(PanelStatus.from_api_response(payload, lazy=True)) == repr(PanelStatus.from_api_response(payload))
+
+
+def test_endpoint_lookup():
+    payload = build_profile_payload("medium")
+    status = PanelStatus.from_api_response(payload)
+    assert status.all_endpoints is status.all_endpoints
+
+    for endpoint in status.all_endpoints:
+        assert status.get_endpoint(endpoint.endpoint_id) is endpoint
+    zone = status.zones[3]
+    assert status.get_zone(zone.endpoint_id) is zone
+    assert status.get_area(zone.endpoint_id) is None
+    assert status.get_area(status.areas[1].endpoint_id) is status.areas[1]
+    assert status.get_cover(status.covers[0].endpoint_id) is status.covers[0]
+    assert status.get_endpoint("missing") is None
+
+
+def test_lazy_endpoint_lookup():
+    payload = build_profile_payload("medium")
+    status = PanelStatus.from_api_response(payload, lazy=True)
+    area_id = payload["aree"][0]["endpointId"]
+    assert status.get_area(area_id).endpoint_id == area_id
+    # Typed accessors only decode their own section
+    assert status._zones is None
+    assert status.get_endpoint(area_id) is status.get_area(area_id)
+
+
+def test_diff():
+    payload = build_profile_payload("large")
+    previous = PanelStatus.from_api_response(payload)
+    assert previous.diff(previous).is_empty
+
+    changed_payload = copy.deepcopy(payload)
+    changed_payload["zone"][5]["aperta"] = not payload["zone"][5]["aperta"]
+    changed_payload["aree"][0]["stato"] = AlarmArmStatus.ARMED_TOTALLY.value
+    changed_payload["tapparelle"][2]["posizione"] = 42
+    removed_actuator = changed_payload["uscite"].pop()
+    changed_payload["uscite"].append(dict(removed_actuator, endpointId="new-actuator"))
+    current = PanelStatus.from_api_response(changed_payload)
+
+    diff = current.diff(previous)
+    assert diff
+    assert [e.endpoint_id for e in diff.added] == ["new-actuator"]
+    assert [e.endpoint_id for e in diff.removed] == [removed_actuator["endpointId"]]
+    changes = {c.endpoint_id: c.changed_fields for c in diff.changed}
+    assert changes == {
+        payload["zone"][5]["endpointId"]: {"opened": (payload["zone"][5]["aperta"], not payload["zone"][5]["aperta"])},
+        payload["aree"][0]["endpointId"]: {"armed_status": (AlarmArmStatus.NOT_ARMED, AlarmArmStatus.ARMED_TOTALLY)},
+        payload["tapparelle"][2]["endpointId"]: {"position": (payload["tapparelle"][2]["posizione"], 42)},
+    }
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_merge(lazy):
+    payload = build_profile_payload("medium")
+    status = PanelStatus.from_api_response(payload, lazy=lazy)
+
+    changed_payload = copy.deepcopy(payload)
+    changed_payload["zone"][3]["aperta"] = not payload["zone"][3]["aperta"]
+    changed_payload["aree"][1]["stato"] = AlarmArmStatus.ARMED_TOTALLY.value
+    changed_payload["uscite"].append(dict(payload["uscite"][0], endpointId="new-actuator"))
+    endpoints = [
+        EndpointStatus.from_api_response(build_endpoint_payload(changed_payload, "zone", changed_payload["zone"][3])),
+        EndpointStatus.from_api_response(build_endpoint_payload(changed_payload, "aree", changed_payload["aree"][1])),
+        EndpointStatus.from_api_response(build_endpoint_payload(changed_payload, "uscite",
+                                                                changed_payload["uscite"][-1])),
+    ]
+    merged = status.merge(e for endpoint_status in endpoints for e in endpoint_status.all_endpoints)
+
+    assert merged is not status and merged.panel_id == status.panel_id
+    # Sections not involved are not decoded
+    assert (merged._covers is None) == lazy
+    assert merged.fingerprints == PanelStatus.from_api_response(changed_payload).fingerprints
+    # The original snapshot is left untouched
+    assert status.fingerprints == PanelStatus.from_api_response(payload).fingerprints
+    with pytest.raises(ValueError):
+        status.merge([object()])
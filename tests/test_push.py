@@ -0,0 +1,369 @@
+"""Test the push-notification handler against the offline Elmax simulator."""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from elmax_api.http import ElmaxLocal
+from elmax_api.model.panel import PanelStatus
+from elmax_api.push import push
+from elmax_api.push.push import DispatchMode, PushNotificationHandler
+from elmax_api.push.store import PanelStateStore, StatusSource
+from elmax_api.push.supervisor import PushSupervisor
+from elmax_api.simulator.payload import build_profile_payload
+from elmax_api.simulator.server import ElmaxSimulator
+
+MESSAGE = json.dumps(build_profile_payload("small"))
+
+
+def _handler(dispatch_mode=DispatchMode.CONCURRENT, **kwargs) -> PushNotificationHandler:
+    client = ElmaxLocal(panel_api_url="http://127.0.0.1/api/v2/", panel_code="000000")
+    return PushNotificationHandler("ws://127.0.0.1/api/v2/push", client, dispatch_mode=dispatch_mode, **kwargs)
+
+
+async def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_dispatch_isolates_slow_handlers():
+    errors = []
+    handler = _handler(handler_timeout=0.1, on_handler_error=lambda h, e: errors.append((h, e)))
+    received = []
+    sync_threads = []
+
+    async def _slow(status: PanelStatus):
+        await asyncio.sleep(10)
+
+    async def _failing(status: PanelStatus):
+        raise RuntimeError("boom")
+
+    async def _fast(status: PanelStatus):
+        received.append(status)
+
+    def _sync(status: PanelStatus):
+        sync_threads.append(threading.current_thread())
+
+    for h in (_slow, _failing, _fast, _sync):
+        handler.register_push_notification_handler(h)
+
+    start = time.monotonic()
+    await handler._notify_handlers(MESSAGE)
+    # Dispatching does not wait for the handlers
+    assert time.monotonic() - start < 0.1
+
+    assert await _wait_for(lambda: len(errors) == 2)
+    assert received and sync_threads and sync_threads[0] is not threading.current_thread()
+    reported = {h: type(e) for h, e in errors}
+    assert reported == {_slow: asyncio.TimeoutError, _failing: RuntimeError}
+
+
+@pytest.mark.asyncio
+async def test_sequential_dispatch_reports_errors():
+    errors = []
+
+    async def _on_error(h, e):
+        errors.append(e)
+
+    handler = _handler(dispatch_mode=DispatchMode.SEQUENTIAL, on_handler_error=_on_error)
+
+    async def _failing(status: PanelStatus):
+        raise RuntimeError("boom")
+
+    handler.register_push_notification_handler(_failing)
+    await handler._notify_handlers(MESSAGE)
+    assert len(errors) == 1 and isinstance(errors[0], RuntimeError)
+
+
+@pytest.mark.asyncio
+async def test_slow_handler_does_not_stall_receive_loop():
+    async with ElmaxSimulator(push_rate=100) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        handler = PushNotificationHandler(sim.push_url, client, dispatch_mode=DispatchMode.CONCURRENT,
+                                          handler_timeout=0.5)
+        received = []
+
+        async def _slow(status: PanelStatus):
+            await asyncio.sleep(0.4)
+
+        async def _fast(status: PanelStatus):
+            received.append(status)
+
+        handler.register_push_notification_handler(_slow)
+        handler.register_push_notification_handler(_fast)
+        handler.start(asyncio.get_running_loop())
+        try:
+            assert await _wait_for(lambda: len(received) >= 10, timeout=0.35)
+        finally:
+            handler.stop()
+
+
+def _frame(zone_open: int = 0, area_status: int = 0) -> str:
+    payload = build_profile_payload("small")
+    payload["zone"][0]["aperta"] = bool(zone_open % 2)
+    payload["zone"][1]["nome"] = f"Zona {zone_open}"
+    payload["aree"][0]["stato"] = area_status
+    return json.dumps(payload)
+
+
+@pytest.mark.asyncio
+async def test_coalescing_collapses_bursts():
+    handler = _handler(dispatch_mode=DispatchMode.SEQUENTIAL, coalesce_window=0.05)
+    received = []
+
+    async def _on_status(status: PanelStatus):
+        received.append(status)
+
+    handler.register_push_notification_handler(_on_status)
+    for i in range(10):
+        await handler._notify_handlers(_frame(zone_open=i))
+    # The first frame is delivered right away, the rest of the burst is collapsed into its latest frame
+    assert len(received) == 1
+    assert await _wait_for(lambda: len(received) == 2)
+    assert received[-1].zones[1].name == "Zona 9"
+    assert handler.coalesced_count == 8
+
+
+@pytest.mark.asyncio
+async def test_coalescing_delivers_urgent_changes_right_away():
+    handler = _handler(dispatch_mode=DispatchMode.SEQUENTIAL, coalesce_window=10)
+    received = []
+
+    async def _on_status(status: PanelStatus):
+        received.append(status)
+
+    handler.register_push_notification_handler(_on_status)
+    await handler._notify_handlers(_frame(zone_open=0))
+    await handler._notify_handlers(_frame(zone_open=1))
+    assert len(received) == 1
+    await handler._notify_handlers(_frame(zone_open=1, area_status=4))
+    assert len(received) == 2
+    assert received[-1].areas[0].armed_status.value == 4
+    handler.stop()
+
+
+@pytest.mark.asyncio
+async def test_coalescing_max_delay():
+    handler = _handler(dispatch_mode=DispatchMode.SEQUENTIAL, coalesce_window=0.05, coalesce_max_delay=0.1)
+    received = []
+
+    async def _on_status(status: PanelStatus):
+        received.append(status)
+
+    handler.register_push_notification_handler(_on_status)
+    # A steady stream of frames, closer than the window, must still be delivered every max_delay seconds
+    for i in range(30):
+        await handler._notify_handlers(_frame(zone_open=i))
+        await asyncio.sleep(0.01)
+    assert len(received) >= 3
+    handler.stop()
+
+
+@pytest.mark.asyncio
+async def test_supervisor_multiplexes_panels():
+    simulators = [ElmaxSimulator(push_rate=50, seed=i) for i in range(3)]
+    for sim in simulators:
+        await sim.start()
+    supervisor = PushSupervisor(start_spread=0.05, reconnect_jitter=0.1, restart_delay=0.1)
+    try:
+        for i, sim in enumerate(simulators):
+            client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+            supervisor.add_panel(f"panel-{i}", sim.push_url, client)
+
+        received = {}
+        only_first = []
+
+        async def _on_status(panel_id: str, status: PanelStatus):
+            received.setdefault(panel_id, []).append(status.panel_id)
+
+        async def _on_first(panel_id: str, status: PanelStatus):
+            only_first.append(panel_id)
+
+        supervisor.register_push_notification_handler(_on_status)
+        supervisor.register_push_notification_handler(_on_first, panel_ids=["panel-0"])
+        supervisor.start(asyncio.get_running_loop())
+
+        assert await _wait_for(lambda: len(received) == 3 and all(len(v) > 3 for v in received.values()))
+        for i, sim in enumerate(simulators):
+            assert set(received[f"panel-{i}"]) == {sim.local_panel_id}
+        assert set(only_first) == {"panel-0"}
+
+        health = supervisor.health()
+        assert all(h["connected"] for h in health.values())
+        metrics = supervisor.metrics()
+        assert metrics["panels"] == 3 and metrics["connected"] == 3 and metrics["messages"] > 9
+
+        # Connections stopping for good are restarted after the restart delay
+        handler = supervisor.get_handler("panel-0")
+        handler.stop()
+        assert await _wait_for(lambda: not handler.is_running)
+        assert await _wait_for(lambda: handler.connection_count == 2 and handler.is_connected)
+
+        supervisor.remove_panel("panel-2")
+        assert supervisor.panel_ids == ["panel-0", "panel-1"]
+    finally:
+        supervisor.stop()
+        for sim in simulators:
+            await sim.stop()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_frames_are_skipped():
+    handler = _handler(dispatch_mode=DispatchMode.SEQUENTIAL, skip_unchanged=True)
+    received = []
+
+    async def _on_status(status: PanelStatus):
+        received.append(status)
+
+    handler.register_push_notification_handler(_on_status)
+    for frame in (_frame(0), _frame(0), _frame(1), _frame(1).encode(), _frame(0)):
+        await handler._notify_handlers(frame)
+    assert len(received) == 3
+    assert handler.skipped_count == 2
+
+
+@pytest.mark.asyncio
+async def test_push_connections_reuse_client_token(monkeypatch):
+    monkeypatch.setattr(push, "_WS_ERROR_COOLDOWN_SECONDS", 0.05)
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        await client.get_current_panel_status()
+        handler = PushNotificationHandler(sim.push_url, client)
+        handler.start(asyncio.get_running_loop())
+        try:
+            assert await _wait_for(lambda: handler.is_connected)
+            # Reconnections reuse the token of the client as well
+            await sim.set_push_available(False)
+            assert await _wait_for(lambda: not handler.is_connected)
+            await sim.set_push_available(True)
+            assert await _wait_for(lambda: handler.connection_count == 2 and handler.is_connected)
+            assert sim.stats["login"] == 1
+
+            # A token refused by the websocket is replaced through the client
+            client._raw_jwt = "refused"
+            await sim.set_push_available(False)
+            await sim.set_push_available(True)
+            assert await _wait_for(lambda: handler.connection_count == 3 and handler.is_connected)
+            assert sim.stats["login"] == 2
+            assert client.metrics.counter("auth_total", kind="login", outcome="ok") == 2
+        finally:
+            handler.stop()
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_token_renewal_does_not_spin(monkeypatch):
+    monkeypatch.setattr(push, "TOKEN_REFRESH_RETRY_INTERVAL", 0.1)
+    handler = _handler()
+    handler._loop = asyncio.get_running_loop()
+    handler._should_run = True
+    renewals = []
+
+    async def _acquire_token(renew=False):
+        renewals.append(renew)
+        if len(renewals) % 2:
+            raise ConnectionError("network down")
+        # Renewed tokens may be shorter-lived than the renewal interval
+        handler._client._jwt = {"exp": time.time() + 1}
+
+    class _Connection:
+        async def recv(self, decode=None):
+            await asyncio.Event().wait()
+
+    monkeypatch.setattr(handler._client, "_acquire_token", _acquire_token)
+    task = asyncio.create_task(handler._wait_for_messages(_Connection()))
+    await asyncio.sleep(0.45)
+    handler.stop()
+    await asyncio.wait_for(task, 1)
+    # Failed and short-lived renewals are retried every TOKEN_REFRESH_RETRY_INTERVAL seconds
+    assert 3 <= len(renewals) <= 6
+
+
+@pytest.mark.asyncio
+async def test_state_store_falls_back_to_polling(monkeypatch):
+    monkeypatch.setattr(push, "_WS_ERROR_COOLDOWN_SECONDS", 0.3)
+    async with ElmaxSimulator() as sim, ElmaxSimulator() as no_push_sim:
+        store = PanelStateStore(poll_interval=0.1, check_interval=0.05)
+        updates = []
+
+        async def _on_update(panel_id: str, status: PanelStatus):
+            updates.append((panel_id, status))
+
+        store.register_update_handler(_on_update, panel_ids=["push"])
+        store.add_panel("push", ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin), sim.push_url)
+        store.add_panel("poll", ElmaxLocal(panel_api_url=no_push_sim.local_url, panel_code=no_push_sim.pin))
+        store.start(asyncio.get_running_loop())
+        try:
+            # The status is synced on connection, then pushed
+            assert await _wait_for(lambda: store.health()["push"]["push_connected"]
+                                   and store.health()["push"]["poll_updates"] == 2)
+            assert len(updates) == 1
+            polls = sim.stats["discovery"]
+            await sim.push_event()
+            assert await _wait_for(lambda: len(updates) == 2)
+            assert store.get_source("push") == StatusSource.PUSH and store.get_status("push") is updates[1][1]
+            await asyncio.sleep(0.2)
+            assert sim.stats["discovery"] == polls
+
+            # Panels without a push endpoint are polled
+            assert store.get_source("poll") == StatusSource.POLL
+            assert store.statuses["poll"].panel_id == no_push_sim.local_panel_id
+
+            # Outages are covered by polling
+            await sim.set_push_available(False)
+            assert await _wait_for(lambda: not store.health()["push"]["push_connected"])
+            await sim.push_event()
+            assert await _wait_for(lambda: len(updates) == 3)
+            assert store.get_source("push") == StatusSource.POLL
+
+            # Back to push once the websocket is available again
+            await sim.set_push_available(True)
+            assert await _wait_for(lambda: store.health()["push"]["push_connected"])
+            await asyncio.sleep(0.1)
+            await sim.push_event()
+            assert await _wait_for(lambda: len(updates) == 4)
+            assert store.get_source("push") == StatusSource.PUSH
+            assert all(panel_id == "push" for panel_id, _ in updates)
+        finally:
+            store.stop()
+
+
+@pytest.mark.asyncio
+async def test_state_store_restarts_stopped_push():
+    async with ElmaxSimulator() as sim:
+        store = PanelStateStore(poll_interval=0.1, check_interval=0.05, restart_delay=0.1)
+        store.add_panel("push", ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin), sim.push_url)
+        store.start(asyncio.get_running_loop())
+        try:
+            assert await _wait_for(lambda: store.health()["push"]["push_connected"])
+            # A push connection stopping for good is restarted by the supervisor
+            handler = store._supervisor.get_handler("push")
+            handler.stop()
+            assert await _wait_for(lambda: not handler.is_running)
+            assert await _wait_for(lambda: handler.connection_count == 2 and store.health()["push"]["push_connected"])
+            await sim.push_event()
+            assert await _wait_for(lambda: store.health()["push"]["push_updates"] == 1)
+        finally:
+            store.stop()
+
+
+@pytest.mark.asyncio
+async def test_state_store_survives_malformed_statuses():
+    async with ElmaxSimulator() as sim:
+        store = PanelStateStore(poll_interval=0.05, check_interval=0.05)
+        store.add_panel("poll", ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin))
+        store.start(asyncio.get_running_loop())
+        try:
+            assert await _wait_for(lambda: store.health()["poll"]["poll_updates"] == 1)
+            sim.corrupt_next(2)
+            assert await _wait_for(lambda: store.health()["poll"]["poll_errors"] == 2)
+            # The panel is still polled
+            assert await _wait_for(lambda: store.health()["poll"]["poll_updates"] >= 2)
+            assert store.get_source("poll") == StatusSource.POLL
+        finally:
+            store.stop()
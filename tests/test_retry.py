@@ -0,0 +1,137 @@
+"""Test the retry policy applied to transient failures."""
+import socket
+import time
+
+import pytest
+
+from elmax_api.exceptions import ElmaxApiError, ElmaxConnectionError, ElmaxNetworkError
+from elmax_api.http import ElmaxLocal
+from elmax_api.model.command import SwitchCommand
+from elmax_api.retry import RetryPolicy
+from elmax_api.scheduler import CommandScheduler
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, backoff_initial=1.0, backoff_max=3.0)
+    assert policy.should_retry(ElmaxApiError(status_code=503), attempt=1, idempotent=True)
+    assert not policy.should_retry(ElmaxApiError(status_code=503), attempt=3, idempotent=True)
+    assert not policy.should_retry(ElmaxApiError(status_code=404), attempt=1, idempotent=True)
+    # Commands are retried only when they could not be sent at all
+    assert not policy.should_retry(ElmaxApiError(status_code=503), attempt=1, idempotent=False)
+    assert not policy.should_retry(ElmaxNetworkError(), attempt=1, idempotent=False)
+    assert policy.should_retry(ElmaxConnectionError(), attempt=1, idempotent=False)
+    assert RetryPolicy(retry_non_idempotent=True).should_retry(ElmaxNetworkError(), attempt=1, idempotent=False)
+
+    for attempt in range(1, 6):
+        assert 0 <= policy.backoff(attempt) <= min(3.0, 2 ** (attempt - 1))
+    with pytest.raises(ValueError):
+        RetryPolicy(attempts=0)
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried():
+    async with ElmaxSimulator() as sim:
+        # Without a retry policy, requests are attempted once
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        assert client.retry_policy.deadline is None
+        await client.login()
+        sim.fail_next(1, status=503)
+        with pytest.raises(ElmaxApiError):
+            await client.get_current_panel_status()
+        sim.stats.clear()
+
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=RetryPolicy(backoff_initial=0.05))
+        await client.login()
+
+        sim.fail_next(2, status=503)
+        status = await client.get_current_panel_status()
+        assert sim.stats["failure"] == 2 and sim.stats["discovery"] == 1
+
+        sim.fail_next(1, status=None)
+        await client.get_current_panel_status()
+        assert sim.stats["failure"] == 3 and sim.stats["discovery"] == 2
+
+        # Exhausted attempts surface the last error
+        sim.fail_next(3, status=502)
+        with pytest.raises(ElmaxApiError) as ex:
+            await client.get_current_panel_status()
+        assert ex.value.status_code == 502
+
+        # Commands are not repeated, since the panel may have executed them already
+        actuator = status.actuators[0]
+        sim.fail_next(1, status=503)
+        with pytest.raises(ElmaxApiError):
+            await client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_ON)
+        assert sim.stats.get("cmd", 0) == 0
+
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=RetryPolicy(backoff_initial=0.05, retry_non_idempotent=True))
+        sim.fail_next(1, status=503)
+        await client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_ON)
+        assert sim.stats["cmd"] == 1
+
+
+@pytest.mark.asyncio
+async def test_busy_responses_do_not_consume_attempts():
+    async with ElmaxSimulator() as sim:
+        scheduler = CommandScheduler()
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, command_scheduler=scheduler,
+                            retry_policy=RetryPolicy(attempts=2, backoff_initial=0.01))
+        scheduler.busy_tracker(client.current_panel_id, initial_window=0.01)
+        await client.login()
+
+        # Busy responses are retried on their own budget: the server error still gets its retry
+        sim.fail_next(2, status=422)
+        sim.fail_next(1, status=503)
+        await client.get_current_panel_status()
+        assert sim.stats["failure"] == 3 and sim.stats["discovery"] == 1
+
+        sim.fail_next(1, status=422)
+        sim.fail_next(2, status=503)
+        with pytest.raises(ElmaxApiError) as ex:
+            await client.get_current_panel_status()
+        assert ex.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_connection_refused_is_retried():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    client = ElmaxLocal(panel_api_url=f"http://127.0.0.1:{port}/api/v2/", panel_code="000000",
+                        retry_policy=RetryPolicy(attempts=4, backoff_initial=0.05, backoff_max=0.1))
+    start = time.monotonic()
+    with pytest.raises(ElmaxConnectionError):
+        await client.login()
+    assert time.monotonic() - start < 1.0
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_the_request():
+    async with ElmaxSimulator(latency=1.0) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=RetryPolicy(attempts=10, backoff_initial=0.05, deadline=0.3))
+        start = time.monotonic()
+        with pytest.raises(ElmaxNetworkError):
+            await client.login()
+        assert time.monotonic() - start < 0.8
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_slow_responses():
+    async with ElmaxSimulator(zones=50) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin,
+                            retry_policy=RetryPolicy(deadline=0.5))
+        await client.login()
+        # Every chunk arrives well within the timeout of a read, but the whole response would take seconds
+        sim.drip_next(1, interval=0.05)
+        start = time.monotonic()
+        with pytest.raises(ElmaxNetworkError):
+            await client.get_current_panel_status()
+        assert time.monotonic() - start < 0.8
+        assert client.metrics.counter("network_errors_total", endpoint="discovery", error="DeadlineExceeded") == 1
+        await client.aclose()
@@ -0,0 +1,97 @@
+"""Test the per-panel command scheduler."""
+import asyncio
+import time
+
+import pytest
+
+from elmax_api import http
+from elmax_api.http import ElmaxLocal
+from elmax_api.model.command import AreaCommand, CoverCommand, SwitchCommand
+from elmax_api.scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, BusyTracker, CommandScheduler, command_priority
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+def test_command_priority():
+    assert command_priority(AreaCommand.DISARM) == PRIORITY_HIGH
+    assert command_priority(SwitchCommand.TURN_ON) == PRIORITY_NORMAL
+    assert command_priority(CoverCommand.UP) == PRIORITY_NORMAL
+    assert command_priority("on") == PRIORITY_NORMAL
+
+
+@pytest.mark.asyncio
+async def test_priorities_and_queue_depth():
+    scheduler = CommandScheduler(max_in_flight=1)
+    order = []
+    release = asyncio.Event()
+
+    async def _command(name: str, priority: int):
+        async with scheduler.slot("panel", priority=priority):
+            order.append(name)
+            if name == "first":
+                await release.wait()
+
+    first = asyncio.create_task(_command("first", PRIORITY_NORMAL))
+    await asyncio.sleep(0)
+    switches = [asyncio.create_task(_command(f"switch-{i}", PRIORITY_NORMAL)) for i in range(3)]
+    cancelled = asyncio.create_task(_command("cancelled", PRIORITY_NORMAL))
+    area = asyncio.create_task(_command("area", PRIORITY_HIGH))
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth("panel") == 5
+
+    # A waiter leaving the queue does not hold it
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth("panel") == 4
+
+    release.set()
+    await asyncio.gather(first, area, *switches)
+    assert order == ["first", "area", "switch-0", "switch-1", "switch-2"]
+
+    metrics = scheduler.metrics()["panel"]
+    assert metrics["queue_depth"] == 0 and metrics["in_flight"] == 0 and metrics["commands"] == 5
+    assert metrics["wait_time_max"] > 0
+
+    # The queue is still usable
+    async with scheduler.slot("panel"):
+        pass
+
+
+def test_busy_tracker_learns_windows():
+    tracker = BusyTracker(initial_window=2.0)
+    assert tracker.expected_wait() == 0
+    # The first retry waits for the expected end of the window
+    assert 2.0 <= tracker.on_busy(attempt=1) <= 2.2
+    assert tracker.is_busy and tracker.expected_wait() > 1.9
+    # A window shorter than expected lowers the estimate
+    tracker.on_success()
+    assert not tracker.is_busy and tracker.window_estimate < 2.0
+
+
+@pytest.mark.asyncio
+async def test_adaptive_busy_backoff(monkeypatch):
+    monkeypatch.setattr(http, "BUSY_WAIT_INTERVAL", 0.8)
+    async with ElmaxSimulator() as sim:
+        scheduler = CommandScheduler(max_in_flight=4)
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, command_scheduler=scheduler)
+        status = await client.get_current_panel_status()
+        actuator = status.actuators[0]
+        tracker = scheduler.busy_tracker(client.current_panel_id)
+
+        # Short busy windows teach the tracker, so that later windows are waited for a shorter time
+        for _ in range(3):
+            sim.set_busy(0.1)
+            await client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_ON, retry_attempts=10)
+        assert tracker.window_estimate < 0.5
+        sim.set_busy(0.1)
+        start = time.monotonic()
+        await client.execute_command(actuator.endpoint_id, SwitchCommand.TURN_OFF, retry_attempts=10)
+        assert time.monotonic() - start < 0.5
+
+        # Commands issued while the panel is known to be busy wait for the end of the window instead of
+        # hitting the panel
+        sim.set_busy(0.3)
+        busy = sim.stats["busy"]
+        await asyncio.gather(*(client.execute_command(a.endpoint_id, SwitchCommand.TURN_ON, retry_attempts=10)
+                               for a in status.actuators))
+        assert sim.stats["busy"] - busy < 4 * len(status.actuators)
+        assert scheduler.metrics()[client.current_panel_id]["busy_responses"] >= 6
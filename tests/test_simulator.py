@@ -0,0 +1,122 @@
+"""Test the client against the offline Elmax simulator."""
+import asyncio
+
+import pytest
+
+from elmax_api import http
+from elmax_api.exceptions import ElmaxBadLoginError, ElmaxBadPinError, ElmaxPanelBusyError
+from elmax_api.http import Elmax, ElmaxLocal
+from elmax_api.model.alarm_status import AlarmArmStatus
+from elmax_api.model.command import AreaCommand, SwitchCommand
+from elmax_api.model.panel import EndpointStatus, PanelStatus
+from elmax_api.push.push import PushNotificationHandler
+from elmax_api.simulator.payload import PANEL_PROFILES, SECTIONS, build_endpoint_payload, build_profile_payload
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.parametrize("profile", list(PANEL_PROFILES))
+def test_profile_payloads(profile):
+    payload = build_profile_payload(profile)
+    assert payload == build_profile_payload(profile)
+    status = PanelStatus.from_api_response(payload)
+    assert len(status.zones) == PANEL_PROFILES[profile]["zones"]
+    assert len(status.all_endpoints) == sum(PANEL_PROFILES[profile].values())
+    for section in SECTIONS:
+        if payload[section]:
+            endpoint_status = EndpointStatus.from_api_response(
+                build_endpoint_payload(payload, section, payload[section][0]))
+            assert len(endpoint_status.all_endpoints) == 1
+
+
+@pytest.mark.asyncio
+async def test_cloud_api():
+    async with ElmaxSimulator(panel_count=3, zones=20, seed=1) as sim:
+        client = Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url)
+        panels = await client.list_control_panels()
+        assert [p.hash for p in panels] == list(sim.panels)
+        assert client.get_authenticated_username() == sim.username
+
+        status = await client.get_panel_status(control_panel_id=panels[1].hash, pin=sim.pin)
+        assert isinstance(status, PanelStatus)
+        assert status.panel_id == panels[1].hash
+        assert len(status.zones) == 20
+
+        with pytest.raises(ElmaxBadPinError):
+            await client.get_panel_status(control_panel_id=panels[1].hash, pin="999999")
+
+        actuator = status.actuators[0]
+        await client.execute_command(endpoint_id=actuator.endpoint_id, command=SwitchCommand.TURN_ON)
+        endpoint_status = await client.get_endpoint_status(endpoint_id=actuator.endpoint_id)
+        assert endpoint_status.actuators[0].opened
+
+
+@pytest.mark.asyncio
+async def test_bad_credentials():
+    async with ElmaxSimulator() as sim:
+        client = Elmax(username=sim.username, password="wrong", base_url=sim.cloud_url)
+        with pytest.raises(ElmaxBadLoginError):
+            await client.login()
+        local_client = ElmaxLocal(panel_api_url=sim.local_url, panel_code="999999")
+        with pytest.raises(ElmaxBadLoginError):
+            await local_client.login()
+
+
+@pytest.mark.asyncio
+async def test_local_api_and_token_renew():
+    async with ElmaxSimulator(token_ttl=120) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        status = await client.get_current_panel_status()
+        assert status.panel_id == sim.local_panel_id
+
+        area = status.areas[0]
+        await client.execute_command(endpoint_id=area.endpoint_id, command=AreaCommand.ARM_TOTALLY,
+                                     extra_payload={"code": sim.pin})
+        endpoint_status = await client.get_endpoint_status(endpoint_id=area.endpoint_id)
+        assert endpoint_status.areas[0].armed_status == AlarmArmStatus.ARMED_TOTALLY
+
+        await client.renew_token()
+        assert sim.stats["refresh"] == 1
+
+        areas_only = await client.get_current_panel_status(sections={"areas"})
+        assert len(areas_only.areas) == len(status.areas)
+        assert areas_only.zones == []
+
+
+@pytest.mark.asyncio
+async def test_busy_window(monkeypatch):
+    monkeypatch.setattr(http, "BUSY_WAIT_INTERVAL", 0.05)
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        await client.login()
+
+        sim.set_busy(0.08)
+        status = await client.get_current_panel_status()
+        assert isinstance(status, PanelStatus)
+        assert sim.stats["busy"] >= 1
+
+        sim.set_busy(10)
+        with pytest.raises(ElmaxPanelBusyError):
+            await client.get_current_panel_status()
+
+
+@pytest.mark.asyncio
+async def test_push_notifications():
+    async with ElmaxSimulator(push_rate=50) as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin)
+        handler = PushNotificationHandler(sim.push_url, client)
+        received = []
+
+        async def _on_status(status: PanelStatus):
+            received.append(status)
+
+        handler.register_push_notification_handler(_on_status)
+        handler.start(asyncio.get_running_loop())
+        try:
+            for _ in range(100):
+                if len(received) >= 5:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            handler.stop()
+        assert len(received) >= 5
+        assert received[0].panel_id == sim.local_panel_id
@@ -0,0 +1,125 @@
+"""Test the sharing of tokens through token stores."""
+import asyncio
+import json
+import multiprocessing
+import time
+
+import jwt
+import pytest
+
+from elmax_api.http import Elmax, ElmaxLocal
+from elmax_api.simulator.server import ElmaxSimulator
+from elmax_api.token_store import FileTokenStore, MemoryTokenStore
+
+
+def _token(exp: float) -> str:
+    return jwt.encode({"exp": int(exp), "email": "user@example.com"}, "secret-key-for-token-store-tests",
+                      algorithm="HS256")
+
+
+def _save_many(path: str, worker: int) -> None:
+    store = FileTokenStore(path)
+    for i in range(50):
+        store.save(f"key-{worker}-{i}", f"token-{i}")
+
+
+def test_file_token_store(tmp_path):
+    path = str(tmp_path / "nested" / "tokens.json")
+    store = FileTokenStore(path)
+    assert store.load("a") is None
+    store.save("a", "token-a")
+    store.save("b", "token-b")
+    assert FileTokenStore(path).load("a") == "token-a"
+    store.delete("a")
+    assert store.load("a") is None and store.load("b") == "token-b"
+
+    # Corrupted stores are discarded
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert store.load("b") is None
+    store.save("b", "token-b")
+    assert store.load("b") == "token-b"
+
+
+def test_file_token_store_concurrent_processes(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    processes = [multiprocessing.Process(target=_save_many, args=(path, w)) for w in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    store = FileTokenStore(path)
+    # No update is lost
+    assert all(store.load(f"key-{w}-{i}") == f"token-{i}" for w in range(4) for i in range(50))
+
+
+@pytest.mark.asyncio
+async def test_clients_share_stored_token(tmp_path):
+    async with ElmaxSimulator() as sim:
+        path = str(tmp_path / "tokens.json")
+        first = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, token_store=FileTokenStore(path))
+        await first.get_current_panel_status()
+        assert sim.stats["login"] == 1
+
+        # A new client (e.g. in a freshly started process) reuses the stored token
+        second = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, token_store=FileTokenStore(path))
+        await second.get_current_panel_status()
+        assert sim.stats["login"] == 1
+        assert second._raw_jwt == first._raw_jwt
+
+        # Local tokens are keyed by the panel URL only: nothing derived from the panel code is stored
+        with open(path) as stored:
+            assert list(json.load(stored)) == [str(first._base_url)]
+
+        # After the logout, the stored token is not used anymore
+        await second.logout()
+        third = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, token_store=FileTokenStore(path))
+        await third.get_current_panel_status()
+        assert sim.stats["login"] == 2
+
+
+@pytest.mark.asyncio
+async def test_renewals_are_shared():
+    async with ElmaxSimulator() as sim:
+        store = MemoryTokenStore()
+        clients = [Elmax(username=sim.username, password=sim.password, base_url=sim.cloud_url, token_store=store)
+                   for _ in range(3)]
+        await asyncio.gather(*(c.list_control_panels() for c in clients))
+        # The first login is shared by the clients which had not started their own yet
+        assert sim.stats["login"] <= 3
+        logins = sim.stats["login"]
+
+        # A valid token in the store is adopted instead of logging in
+        clients[0]._jwt["exp"] = int(time.time()) + 10
+        await clients[0].list_control_panels()
+        assert sim.stats["login"] == logins
+
+        # The first client to renew its expiring token shares the new one with the others
+        store.save(clients[0]._token_store_key(), _token(time.time() + 10))
+        for c in clients:
+            c._jwt["exp"] = int(time.time()) + 10
+        await clients[0].list_control_panels()
+        await asyncio.gather(*(c.list_control_panels() for c in clients[1:]))
+        assert sim.stats["login"] == logins + 1
+        assert len({c._raw_jwt for c in clients}) == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_or_older_tokens_are_ignored():
+    store = MemoryTokenStore()
+    client = Elmax(username="user@example.com", password="password", base_url="http://127.0.0.1/api/ext/",
+                   token_store=store)
+    key = client._token_store_key()
+
+    store.save(key, _token(time.time() + 30))
+    assert await client._load_stored_token() is None
+
+    store.save(key, "not-a-jwt")
+    assert await client._load_stored_token() is None
+
+    store.save(key, _token(time.time() + 3600))
+    assert await client._load_stored_token() is not None
+    assert client.is_authenticated
+
+    store.save(key, _token(time.time() + 1800))
+    assert await client._load_stored_token() is None
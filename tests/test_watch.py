@@ -0,0 +1,47 @@
+"""Test the adaptive polling of panels without push notifications."""
+import asyncio
+import time
+
+import pytest
+
+from elmax_api.http import ElmaxLocal
+from elmax_api.model.command import SwitchCommand
+from elmax_api.simulator.server import ElmaxSimulator
+
+
+@pytest.mark.asyncio
+async def test_watch():
+    async with ElmaxSimulator() as sim:
+        client = ElmaxLocal(panel_api_url=sim.local_url, panel_code=sim.pin, skip_unchanged=True)
+        received = []
+
+        async def _consume():
+            async for status in client.watch(interval_min=0.05, interval_max=0.3):
+                received.append((time.monotonic(), status))
+
+        task = asyncio.ensure_future(_consume())
+        await asyncio.sleep(1.0)
+        # A quiet panel is polled less and less often, and yields only its initial status
+        assert len(received) == 1
+        assert sim.stats["discovery"] < 10
+
+        # Commands wake the watcher up
+        actuator = received[0][1].actuators[0]
+        start = time.monotonic()
+        command = SwitchCommand.TURN_OFF if actuator.opened else SwitchCommand.TURN_ON
+        await client.execute_command(actuator.endpoint_id, command)
+        await asyncio.sleep(0.2)
+        assert len(received) == 2 and received[1][0] - start < 0.1
+        assert received[1][1].get_actuator(actuator.endpoint_id).opened != actuator.opened
+
+        # External changes are caught within interval_max
+        await asyncio.sleep(0.5)
+        start = time.monotonic()
+        await sim.push_event()
+        await asyncio.sleep(0.4)
+        assert len(received) == 3 and received[2][0] - start <= 0.35
+        diff = received[2][1].diff(received[1][1])
+        assert len(diff.changed) == 1 and not diff.added and not diff.removed
+
+        task.cancel()
+        await client.aclose()